@@ -1,17 +1,228 @@
 import os
 from datetime import datetime as dt
+from time import sleep, monotonic, perf_counter_ns
+from collections import deque
 import threading
+import sys
+import struct
+import json
+import gzip
+from array import array
 
 LO_RES_TIME_FORMAT = '%04d%02d%02d'      # YYYYMMDD
 HI_RES_TIME_FORMAT = '%04d%02d%02d-%02d%02d%02d'    #YYYYMMDD-HHMMSS
+
+# Async mode: write_log() only queues the line and a writer thread does the disk I/O in batches.
+# Off by default, lines are written as they arrive like before; FILE_MANAGER(True) or set_async()
+# turns it on (the K5R, K5 and Willow GUIs do, they log at 125 Hz and up).
+ASYNC_WRITES = False
+QUEUE_SIZE = 100000         # Lines waiting to be written before new ones are dropped
+WRITE_BATCH = 5000          # Max lines per write/flush
+WRITE_INTERVAL = 0.01       # Writer thread poll period when the queue is empty (sec)
+DRAIN_TIMEOUT = 5.0         # Longest drain_queue() waits for the writer thread (sec)
+LINE_END = os.linesep.encode()      # Text logs are written as bytes, with the terminator text mode used to add
+
+# Host receive time: text lines are written as '<perf_counter_ns>\t<line>', a monotonic integer
+# nanosecond count taken when write_log() is called (or passed in by the reader that got the line)
+HOST_TIMESTAMPS = False
+
+# Durability policy: flush once this many lines, milliseconds or bytes are pending (0 = no limit)
+FLUSH_LINES = 1
+FLUSH_INTERVAL_MS = 0
+FLUSH_BYTES = 0
+FSYNC_ON_CLOSE = False      # Force the log to disk when it is closed or rotated
+
+# Binary record logs: RECORD_MAGIC, header length (uint32 LE), JSON schema padded to RECORD_ALIGN,
+# then one packed little-endian record per row
+RECORD_SUFFIX = '.rec'
+RECORD_MAGIC = b'FMREC001'
+RECORD_ALIGN = 64
+RECORD_TYPES = {'<f8': 'd', '<f4': 'f', '<i8': 'q', '<i4': 'i', '<i2': 'h', '<i1': 'b', '<u4': 'I', '<u2': 'H', '<u1': 'B'}
+
+# Compressed logs: the text goes out in frames, each one an independent gzip member, with a
+# '.frames' index next to the log holding 'offset,size,data offset,data size' per frame
+COMPRESS_LOGS = False
+COMPRESSED_SUFFIX = '.gz'
+FRAME_SUFFIX = '.frames'
+FRAME_SECONDS = 10              # A frame is closed once it is this old...
+FRAME_BYTES = 4 * 1024 * 1024   # ...or holds this much text
+COMPRESS_LEVEL = 6
+
+# Rotation: a session continues in a new segment (<name>_001.log, ...) once the current one holds
+# ROTATE_BYTES of text or is ROTATE_SECONDS old (0 = no limit, both 0 = one file, no manifest).
+# '<name>.session.json' lists the segments with their time range and line count, and with a row
+# format set (FILE_MANAGER.set_row_format) their data row count and range on the plot's time axis.
+ROTATE_BYTES = 0
+ROTATE_SECONDS = 0
+SESSION_SUFFIX = '.session.json'
+
+# Column sink: data rows of a text log are also stored as columns in '<log>.cols/', one
+# 'chunk_NNNNNN.npy' (rows x columns, float64) per COLUMN_BATCH_ROWS rows plus 'schema.json'
+COLUMNS_SUFFIX = '.cols'
+COLUMN_BATCH_ROWS = 5000
+
+# Logging statistics, see FILE_MANAGER.stats()
+LATENCY_SAMPLES = 1000      # Most recent write_text() durations kept for the percentiles
+
+class FRAMED_LOG():
+    # Write-only log that reaches the disk one gzip member at a time. flush() only closes the
+    # current frame once it is due, so a crash loses at most one frame.
+    def __init__(self, path, frame_seconds=FRAME_SECONDS, frame_bytes=FRAME_BYTES, level=COMPRESS_LEVEL):
+        self.file = open(path, 'wb')
+        self.index = open(path + FRAME_SUFFIX, 'w')
+        self.frame_seconds = frame_seconds
+        self.frame_bytes = frame_bytes
+        self.level = level
+        self.parts = []
+        self.size = 0
+        self.data_offset = 0
+        self.frame_start = monotonic()
+        self.closed = False
+
+    def write(self, data):
+        if not self.parts:
+            self.frame_start = monotonic()
+        self.parts.append(data)
+        self.size += len(data)
+
+    def flush(self):
+        if self.size >= self.frame_bytes or (self.parts and monotonic() - self.frame_start >= self.frame_seconds):
+            self.end_frame()
+
+    def end_frame(self):
+        if self.parts:
+            data = b''.join(self.parts)
+            frame = gzip.compress(data, self.level, mtime=0)
+            offset = self.file.tell()
+            self.file.write(frame)
+            self.file.flush()
+            # Indexed only once the frame is on disk, readers never see a partial frame
+            self.index.write('%d,%d,%d,%d\n' % (offset, len(frame), self.data_offset, len(data)))
+            self.index.flush()
+            self.data_offset += len(data)
+        self.parts = []
+        self.size = 0
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        if not self.closed:
+            self.end_frame()
+            self.file.close()
+            self.index.close()
+            self.closed = True
         
+class COLUMN_SINK():
+    # Parses the data rows (prefix + delimited numbers) of the lines it is given and writes them out
+    # in batches. Lines that aren't data rows are ignored. schema.json gets 'complete' on close.
+    def __init__(self, path, columns, prefix='', delimiter=',', stamped=False, batch_rows=COLUMN_BATCH_ROWS):
+        if not os.path.isdir(path):
+            os.mkdir(path)
+        self.path = path
+        self.num_fields = len(columns)
+        self.prefix = prefix
+        self.delimiter = delimiter
+        self.stamped = stamped      # Lines start with '<host time>\t', stored as a 'host_time' column
+        self.batch_rows = batch_rows
+        self.values = array('d')
+        self.rows = 0
+        self.total_rows = 0
+        self.chunks = 0
+        self.skipped_rows = 0       # Data rows with a bad field count or value
+        self.schema = {'columns': (['host_time'] if stamped else []) + list(columns), 'rows': 0, 'chunks': 0, 'complete': False}
+        self.write_schema()
+
+    def append(self, lines):
+        for line in lines:
+            if isinstance(line, bytes):
+                line = line.decode(errors='replace')
+            if self.stamped:
+                stamp, _, line = line.partition('\t')
+            if not line.startswith(self.prefix):
+                continue
+            fields = line[len(self.prefix):].rstrip(self.delimiter).split(self.delimiter)
+            if len(fields) != self.num_fields:
+                self.skipped_rows += 1
+                continue
+            try:
+                values = [float(v) for v in fields]
+                if self.stamped:
+                    values.insert(0, float(stamp))
+            except ValueError:
+                self.skipped_rows += 1
+                continue
+            self.values.extend(values)
+            self.rows += 1
+            if self.rows >= self.batch_rows:
+                self.flush()
+
+    def flush(self):
+        # Writes the pending rows as the next chunk, readers only ever see whole chunks
+        if self.rows == 0:
+            return
+        header = "{'descr': '%sf8', 'fortran_order': False, 'shape': (%d, %d), }" % ('<' if sys.byteorder == 'little' else '>', self.rows, len(self.schema['columns']))
+        header += ' ' * (-(10 + len(header) + 1) % 64) + '\n'
+        path = os.path.join(self.path, 'chunk_%06d.npy' % self.chunks)
+        f = open(path + '.tmp', 'wb')
+        f.write(b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header.encode())
+        self.values.tofile(f)
+        f.close()
+        os.replace(path + '.tmp', path)
+        self.chunks += 1
+        self.total_rows += self.rows
+        self.values = array('d')
+        self.rows = 0
+
+    def close(self):
+        self.flush()
+        self.schema['complete'] = True
+        self.write_schema()
+
+    def write_schema(self):
+        self.schema['rows'] = self.total_rows
+        self.schema['chunks'] = self.chunks
+        f = open(os.path.join(self.path, 'schema.json'), 'w')
+        json.dump(self.schema, f)
+        f.close()
+
 class FILE_MANAGER():
-    def __init__(self):
+    def __init__(self, async_mode=False, queue_size=QUEUE_SIZE, host_timestamps=HOST_TIMESTAMPS):
         self.log_directory = 'logs/'
         self.log = ''
         self.log_file = ''
         self.lock = threading.Lock()
+        self.flush_timer = None     # Checks the flush interval in sync mode, see write_text()
         self.setup_directories()
+        self.set_flush_policy()
+        self.set_rotation()
+        self.set_row_format()
+        self.session = None         # Manifest of the rotating session being written
+        self.set_column_sink()
+        self.sink = None            # COLUMN_SINK of the open text log
+        self.log_name = ''          # Name of the open text log without extension
+        self.log_compress = False
+        self.line_end = LINE_END
+        self.named_logs = {}        # Extra logs of the same session, see open_named_log()
+        self.record = None          # struct.Struct of a record when a binary log is open
+        self.record_format = None   # (prefix, delimiter) used to convert text lines to records
+        self.record_cast = float
+        self.skipped_lines = 0      # Lines that could not be stored as a record
+        self.host_timestamps = host_timestamps
+
+        self.async_mode = False
+        self.queue = deque()
+        self.queue_size = queue_size
+        self.queue_high_water = 0      # Deepest the queue has been
+        self.dropped_lines = 0         # Lines lost because the queue was full or the write failed
+        self.last_error = None         # Exception of the last failed write, see stats()
+        self.lines_written = 0
+        self.bytes_written = 0
+        self.write_latency = deque(maxlen=LATENCY_SAMPLES)     # ns per write_text() call
+        self.stats_start = monotonic()
+        self.last_stats = {}            # reader: (time, lines, bytes) at its previous stats() call
+        self.writer_running = False
+        self.set_async(async_mode)
 
     def setup_directories(self):
         # Create main log directory
@@ -20,52 +231,565 @@ class FILE_MANAGER():
         else:
             print("%s already exists!" % self.log_directory)
 
-    def create_log_file(self):
+    def set_flush_policy(self, lines=FLUSH_LINES, interval_ms=FLUSH_INTERVAL_MS, num_bytes=FLUSH_BYTES, fsync=FSYNC_ON_CLOSE):
+        # Whichever limit is reached first triggers the flush. At most that much data is lost if the
+        # program dies; the OS still has to write it out unless fsync is set (close/rotation only).
+        self.flush_lines = lines
+        self.flush_interval_ms = interval_ms
+        self.flush_bytes = num_bytes
+        self.fsync = fsync
+        self.pending_lines = 0
+        self.pending_bytes = 0
+        self.last_flush = monotonic()
+
+    def set_rotation(self, num_bytes=ROTATE_BYTES, seconds=ROTATE_SECONDS):
+        # Applies from the next create_log_file()
+        self.rotate_bytes = num_bytes
+        self.rotate_seconds = seconds
+
+    def set_row_format(self, num_fields=None, prefix='', delimiter=',', trailing=False, time_column=0, cumulative=False):
+        # Data rows (prefix + num_fields delimited fields, trailing: one more delimiter after the last)
+        # of the next sessions are counted per segment, with the first, last, min and max time of
+        # the plot's axis: field time_column, its running sum when cumulative, or the row number
+        # when time_column is None. num_fields=None turns it off.
+        if num_fields is None:
+            self.row_format = None
+        else:
+            self.row_format = (num_fields, prefix, delimiter, trailing, time_column, cumulative)
+
+    def set_column_sink(self, columns=None, prefix='', delimiter=',', batch_rows=COLUMN_BATCH_ROWS):
+        # Data rows (prefix + len(columns) delimited fields) of the next text logs also go to a
+        # column sink, parsed by the writer while it waits for data. columns=None turns it off.
+        self.sink_format = (columns, prefix, delimiter, batch_rows)
+
+    def close_sink(self):
+        if self.sink is not None:
+            try:
+                self.sink.close()
+            except Exception as e:
+                print("Column sink error:", e)
+            self.sink = None
+
+    def create_log_file(self, fname=None, compress=COMPRESS_LOGS):
+        self.drain_queue()      # Lines queued so far belong to the previous log
         now = dt.now()
         self.lock.acquire()
 
         # Attempt to close the last logfile
         try:
+            self.sync_log()
             self.log.close()
         except Exception as e:
             pass
             # print("Logfile '%s' does not exist!" % self.log)
             # print("Error:", e)
+        self.close_sink()
+        self.end_session()
+
+        self.record = None
 
         # Check if main log directory exists
         if not os.path.isdir(self.log_directory):
             self.setup_directories()
-        self.log_file = (HI_RES_TIME_FORMAT % (now.year, now.month, now.day, now.hour, now.minute, now.second)) + '.log'
+        if fname == None:
+            fname = HI_RES_TIME_FORMAT % (now.year, now.month, now.day, now.hour, now.minute, now.second)
+        self.log_file = fname + '.log'
+        if compress:
+            self.log_file += COMPRESSED_SUFFIX
+        self.log_name = fname
+        self.log_compress = compress
         
-        # Open logfile and write header
-        self.log = open(self.log_directory + self.log_file, "w")
-        self.log.write("DATA LOG: DI-2008 Thermocouple Logger\r")
-        self.log.write("DATE: %04d-%02d-%02d\r" % (now.year, now.month, now.day))
-        self.log.write("TIME: %02d:%02d:%02d\r\n\n" % (now.hour, now.minute, now.second))
-        self.log.flush()
+        self.open_log(now, compress)
+        if self.rotate_bytes or self.rotate_seconds:
+            self.session = {
+                'title': "DATA LOG: DI-2008 Thermocouple Logger",
+                'date': "%04d-%02d-%02d" % (now.year, now.month, now.day),
+                'time': "%02d:%02d:%02d" % (now.hour, now.minute, now.second),
+                'segments': [],
+            }
+            if self.row_format is not None:
+                num_fields, prefix, delimiter, trailing, time_column, cumulative = self.row_format
+                self.session['row_format'] = {'fields': num_fields, 'prefix': prefix, 'delimiter': delimiter,
+                    'trailing': trailing, 'time_column': time_column, 'cumulative': cumulative}
+                self.session_rows = 0       # Row number / running time carry on across segments
+                self.session_time = 0.0
+            self.session_name = fname
+            self.session_compress = compress
+            self.session_start = monotonic()
+            self.start_segment(now)
+
+        self.lock.release()
+
+        for name in self.named_logs:
+            self.open_named_log(name)
+
+        return self.log_file
+
+    def open_named_log(self, name, async_mode=None):
+        # Extra log '<log name>-<name>.log' of the current session with its own FILE_MANAGER (and
+        # writer thread in async mode), so sources logging at different rates never wait on each
+        # other. Its lines carry host_time from the same perf_counter_ns() clock as every other log.
+        # It follows the main log: re-opened by create_log_file(), closed by close_log_file().
+        if name not in self.named_logs:
+            if async_mode is None:
+                async_mode = self.async_mode
+            named = FILE_MANAGER(async_mode, self.queue_size, host_timestamps=True)
+            named.log_directory = self.log_directory
+            self.named_logs[name] = named
+        named = self.named_logs[name]
+        fname = '%s-%s' % (self.log_name, name)
+        if self.log_name and named.log_name != fname:
+            named.set_flush_policy(self.flush_lines, self.flush_interval_ms, self.flush_bytes, self.fsync)
+            named.set_rotation(self.rotate_bytes, self.rotate_seconds)
+            named.create_log_file(fname, self.log_compress)
+        return named.log_file
+
+    def close_named_log(self, name):
+        # Closes the named log for good: create_log_file() no longer re-opens it and its writer ends
+        named = self.named_logs.pop(name, None)
+        if named is not None:
+            named.close_log_file()
+            named.stop_writer()
+
+    def set_async(self, on=True):
+        # Starts the writer thread, or stops it once everything queued is written
+        if on and not self.writer_running:
+            self.writer_running = True
+            self.writer = threading.Thread(target=self.writer_thread, daemon=True)
+            self.writer.start()
+            self.async_mode = True
+        elif not on:
+            self.stop_writer()
+
+    def stop_writer(self):
+        # Async mode: the writer thread ends once everything queued is written, lines after that
+        # are written as they arrive
+        if self.writer_running:
+            self.drain_queue()
+            self.writer_running = False
+            self.writer.join(DRAIN_TIMEOUT)
+        self.async_mode = False
+
+    def write_named_log(self, name, data, host_time=None):
+        # Dropped when the named log isn't open (logging off)
+        named = self.named_logs.get(name)
+        if named is not None and named.log_name:
+            named.write_log(data, host_time)
+
+    def open_log(self, now, compress):
+        # Open logfile and write header, caller holds self.lock. Lines can be given as str or bytes.
+        if compress:
+            self.log = FRAMED_LOG(self.log_directory + self.log_file)
+            self.line_end = b'\n'
+        else:
+            self.log = open(self.log_directory + self.log_file, "wb")
+            self.line_end = LINE_END
+        header = "DATA LOG: DI-2008 Thermocouple Logger\r"
+        header += "DATE: %04d-%02d-%02d\r" % (now.year, now.month, now.day)
+        if self.host_timestamps:
+            header += "HOST TIME: %d\r" % perf_counter_ns()     # Host clock at DATE/TIME
+        header += "TIME: %02d:%02d:%02d\r\n\n" % (now.hour, now.minute, now.second)
+        self.log.write(header.encode().replace(b'\n', self.line_end))
+        self.flush_log()
+        columns, prefix, delimiter, batch_rows = self.sink_format
+        if columns is not None:
+            self.sink = COLUMN_SINK(self.log_directory + self.log_file + COLUMNS_SUFFIX, columns, prefix, delimiter, self.host_timestamps, batch_rows)
+
+    def start_segment(self, now):
+        self.segment_start = monotonic()
+        self.segment_lines = 0
+        self.segment_bytes = 0
+        self.session['segments'].append({
+            'file': self.log_file,
+            'opened': now.strftime('%Y-%m-%d %H:%M:%S'),
+            'start': round(self.segment_start - self.session_start, 3),     # Seconds from the session start
+            'end': None,
+            'lines': 0,
+        })
+        if 'row_format' in self.session:
+            self.session['segments'][-1].update({'rows': 0, 'first_time': None, 'last_time': None, 'min_time': None, 'max_time': None})
+        self.write_manifest()
+
+    def end_session(self, last=True):
+        # Records the range and line count of the current segment; last=False when rotating
+        if self.session is None:
+            return
+        segment = self.session['segments'][-1]
+        segment['end'] = round(monotonic() - self.session_start, 3)
+        segment['lines'] = self.segment_lines
+        self.write_manifest()
+        if last:
+            self.session = None
+
+    def count_rows(self, lines):
+        # Data rows of the current segment and their range on the time axis, see set_row_format().
+        # A row is what log_reader selects: the prefix and the exact number of delimiters.
+        row_format = self.session['row_format']
+        prefix, delimiter, time_column = row_format['prefix'], row_format['delimiter'], row_format['time_column']
+        num_delims = row_format['fields'] - 1 + prefix.count(delimiter) + (1 if row_format['trailing'] else 0)
+        segment = self.session['segments'][-1]
+        for line in lines:
+            if isinstance(line, bytes):
+                line = line.decode(errors='replace')
+            if self.host_timestamps:
+                line = line.partition('\t')[2]
+            if not line.startswith(prefix) or line.count(delimiter) != num_delims:
+                continue
+            if time_column is None:
+                t = float(self.session_rows)
+            else:
+                try:
+                    t = float(line[len(prefix):].split(delimiter)[time_column])
+                except ValueError:
+                    t = float('nan')
+                if row_format['cumulative']:
+                    if t == t:
+                        self.session_time += t
+                    t = self.session_time
+            if segment['rows'] == 0:
+                segment['first_time'] = t
+            segment['last_time'] = t
+            if t == t:
+                if segment['min_time'] is None or t < segment['min_time']:
+                    segment['min_time'] = t
+                if segment['max_time'] is None or t > segment['max_time']:
+                    segment['max_time'] = t
+            segment['rows'] += 1
+            self.session_rows += 1
+
+    def write_manifest(self):
+        # Replaced in one step so a reader never sees half a manifest
+        path = self.log_directory + self.session_name + SESSION_SUFFIX
+        f = open(path + '.tmp', 'w')
+        json.dump(self.session, f, indent=1)
+        f.close()
+        os.replace(path + '.tmp', path)
+
+    def rotation_due(self):
+        if self.rotate_bytes and self.segment_bytes >= self.rotate_bytes:
+            return True
+        return self.rotate_seconds and monotonic() - self.segment_start >= self.rotate_seconds
+
+    def rotate_log(self):
+        # Continues the session in the next segment, caller holds self.lock
+        self.sync_log()
+        self.log.close()
+        self.close_sink()
+        self.end_session(last=False)
+        now = dt.now()
+        self.log_file = '%s_%03d.log' % (self.session_name, len(self.session['segments']))
+        if self.session_compress:
+            self.log_file += COMPRESSED_SUFFIX
+        self.open_log(now, self.session_compress)
+        self.start_segment(now)
+
+    def create_record_file(self, columns, fname=None, dtype='<f8', prefix='', delimiter=','):
+        # Binary log of fixed-width records, one dtype field per column. write_record() stores values
+        # as they are; write_log() converts a text row (prefix + delimited fields) to a record.
+        self.drain_queue()
+        now = dt.now()
+        self.lock.acquire()
+
+        try:
+            self.sync_log()
+            self.log.close()
+        except Exception as e:
+            pass
+        self.close_sink()
+        self.end_session()
+        if not os.path.isdir(self.log_directory):
+            self.setup_directories()
+        if fname == None:
+            fname = HI_RES_TIME_FORMAT % (now.year, now.month, now.day, now.hour, now.minute, now.second)
+        self.log_file = fname + RECORD_SUFFIX
+
+        schema = {
+            'title': "DATA LOG: DI-2008 Thermocouple Logger",
+            'date': "%04d-%02d-%02d" % (now.year, now.month, now.day),
+            'time': "%02d:%02d:%02d" % (now.hour, now.minute, now.second),
+            'columns': list(columns),
+            'dtype': dtype,
+        }
+        header = json.dumps(schema).encode()
+        header += b' ' * (-(len(RECORD_MAGIC) + 4 + len(header)) % RECORD_ALIGN)
+        self.record = struct.Struct('<' + RECORD_TYPES[dtype] * len(columns))
+        if RECORD_TYPES[dtype] in 'fd':
+            self.record_cast = float
+        else:
+            self.record_cast = int
+        self.record_format = (prefix, delimiter)
+
+        self.log = open(self.log_directory + self.log_file, "wb")
+        self.log.write(RECORD_MAGIC + struct.pack('<I', len(header)) + header)
+        self.flush_log()
 
         self.lock.release()
 
         return self.log_file
 
     def close_log_file(self):
+        self.drain_queue()
         self.lock.acquire()
+        self.cancel_flush_timer()
         try:
+            self.sync_log()
             self.log.close()
         except Exception as e:
             pass
+        self.close_sink()
+        self.end_session()
+        self.log_name = ''
         self.lock.release()
+        for named in self.named_logs.values():
+            named.close_log_file()
         return self.log_file
 
-    def write_log(self, data):
+    def write_log(self, data, host_time=None):
+        # data: line without terminator, bytes as received go to the file without any conversion.
+        # host_time: perf_counter_ns() taken by the caller when the line arrived, else taken here
+        if self.host_timestamps and self.record is None:
+            if host_time is None:
+                host_time = perf_counter_ns()
+            if isinstance(data, bytes):
+                data = b'%d\t%s' % (host_time, data)
+            else:
+                data = '%d\t%s' % (host_time, data)
+        if self.record is not None:
+            # Binary log: only data rows can be stored, anything else (CLI echo etc.) is skipped
+            prefix, delimiter = self.record_format
+            if isinstance(data, bytes):
+                data = data.decode(errors='replace')
+            if data.startswith(prefix):
+                self.write_record(data[len(prefix):].rstrip(delimiter).split(delimiter))
+            else:
+                self.skipped_lines += 1
+            return
+        if self.async_mode:
+            # deque.append is atomic, no lock needed on the acquisition thread
+            depth = len(self.queue)
+            if depth >= self.queue_size:
+                self.dropped_lines += 1
+            else:
+                self.queue.append(data)
+                if depth >= self.queue_high_water:
+                    self.queue_high_water = depth + 1
+            return
+        with self.lock:
+            try:
+                if self.sink is not None:
+                    self.sink.append([data])
+                if self.session is not None and 'row_format' in self.session:
+                    self.count_rows([data])
+                if isinstance(data, str):
+                    data = data.encode()
+                self.write_text(data + self.line_end, 1)
+            except Exception as e:
+                self.dropped_lines += 1
+                self.last_error = e
+
+    def write_record(self, values):
         try:
-            self.lock.acquire()
-            self.log.write(data + '\n')
-            self.log.flush()
-            self.lock.release()
+            record = self.record.pack(*[self.record_cast(v) for v in values])
         except:
-            pass
+            self.skipped_lines += 1     # Wrong number of fields or not a number
+            return
+        if self.async_mode:
+            depth = len(self.queue)
+            if depth >= self.queue_size:
+                self.dropped_lines += 1
+            else:
+                self.queue.append(record)
+                if depth >= self.queue_high_water:
+                    self.queue_high_water = depth + 1
+            return
+        with self.lock:
+            try:
+                self.write_text(record, 1)
+            except Exception as e:
+                self.dropped_lines += 1
+                self.last_error = e
+
+    def writer_thread(self):
+        while self.writer_running:
+            if len(self.queue) == 0:
+                if self.flush_interval_ms:
+                    # Time limit still applies when the data stops
+                    with self.lock:
+                        try:
+                            if self.flush_due():
+                                self.flush_log()
+                        except Exception as e:
+                            self.last_error = e
+                sleep(WRITE_INTERVAL)
+                continue
+            with self.lock:
+                lines = []
+                while self.queue and len(lines) < WRITE_BATCH:
+                    lines.append(self.queue.popleft())
+                try:
+                    if self.record is not None:
+                        self.write_text(b''.join(lines), len(lines))
+                    else:
+                        if self.sink is not None:
+                            self.sink.append(lines)     # Before write_text(), which may rotate the log
+                        if self.session is not None and 'row_format' in self.session:
+                            self.count_rows(lines)
+                        lines = [line.encode() if isinstance(line, str) else line for line in lines]
+                        self.write_text(self.line_end.join(lines) + self.line_end, len(lines))
+                except Exception as e:
+                    # The batch is off the queue: count it as lost instead of dropping it silently
+                    self.dropped_lines += len(lines)
+                    self.last_error = e
+
+    def write_text(self, text, num_lines):
+        # Caller holds self.lock
+        t_start = perf_counter_ns()
+        self.log.write(text)
+        self.pending_lines += num_lines
+        self.pending_bytes += len(text)
+        if self.flush_due():
+            self.flush_log()
+        elif self.flush_interval_ms and not self.writer_running and self.flush_timer is None:
+            # Sync mode has no writer thread to check the time limit once the lines stop coming
+            self.start_flush_timer()
+        if self.session is not None:
+            self.segment_lines += num_lines
+            self.segment_bytes += len(text)
+            if self.rotation_due():
+                self.rotate_log()
+        self.lines_written += num_lines
+        self.bytes_written += len(text)
+        self.write_latency.append(perf_counter_ns() - t_start)
+
+    def flush_due(self):
+        if self.pending_lines == 0:
+            return False
+        if self.flush_lines and self.pending_lines >= self.flush_lines:
+            return True
+        if self.flush_bytes and self.pending_bytes >= self.flush_bytes:
+            return True
+        return self.flush_interval_ms and (monotonic() - self.last_flush) * 1000 >= self.flush_interval_ms
+
+    def start_flush_timer(self):
+        # Caller holds self.lock. Fires when the flush interval since the last flush is up.
+        delay = self.flush_interval_ms * 0.001 - (monotonic() - self.last_flush)
+        self.flush_timer = threading.Timer(max(delay, 0), self.flush_timer_expired)
+        self.flush_timer.daemon = True
+        self.flush_timer.start()
+
+    def flush_timer_expired(self):
+        with self.lock:
+            if self.flush_timer is not threading.current_thread():
+                return      # Cancelled by close_log_file()
+            self.flush_timer = None
+            try:
+                if self.flush_due():
+                    self.flush_log()
+                elif self.pending_lines:
+                    self.start_flush_timer()    # A flush since the timer started moved the deadline
+            except Exception as e:
+                self.last_error = e
+
+    def cancel_flush_timer(self):
+        # Caller holds self.lock
+        if self.flush_timer is not None:
+            self.flush_timer.cancel()
+            self.flush_timer = None
+
+    def flush_log(self):
+        self.log.flush()
+        self.pending_lines = 0
+        self.pending_bytes = 0
+        self.last_flush = monotonic()
+
+    def sync_log(self):
+        # Before closing: pending lines always reach the OS, and the disk too if fsync is set
+        if isinstance(self.log, FRAMED_LOG):
+            self.log.end_frame()    # An open frame can only be written out whole
+        else:
+            self.log.flush()
+        if self.fsync:
+            os.fsync(self.log.fileno())
+
+    def drain_queue(self, timeout=DRAIN_TIMEOUT):
+        # Waits for the writer thread to write everything queued so far. Lines it can't get to (no
+        # writer thread running, or still queued after timeout sec) are dropped and counted.
+        end = monotonic() + timeout
+        while len(self.queue):
+            if not self.writer_running or not self.writer.is_alive():
+                error = 'writer thread not running'
+            elif monotonic() > end:
+                error = 'writer thread stalled'
+            else:
+                sleep(WRITE_INTERVAL)
+                continue
+            lost = 0
+            try:
+                while True:
+                    self.queue.popleft()
+                    lost += 1
+            except IndexError:
+                pass
+            self.dropped_lines += lost
+            self.last_error = '%s, %d queued lines dropped' % (error, lost)
+            return False
+        return True
+
+    def queue_depth(self):
+        return len(self.queue)
+
+    def stats(self, reader='status'):
+        # Rates are since the previous call with the same reader (the status bar, a benchmark...),
+        # so callers do not shorten each other's window. Latencies are over the last
+        # LATENCY_SAMPLES writes. Named logs are included in every figure.
+        logs = [self] + list(self.named_logs.values())
+        lines = sum(l.lines_written for l in logs)
+        num_bytes = sum(l.bytes_written for l in logs)
+        latency = []
+        for l in logs:
+            latency += list(l.write_latency)
+        latency.sort()
+        now = monotonic()
+        then, last_lines, last_bytes = self.last_stats.get(reader, (self.stats_start, 0, 0))
+        self.last_stats[reader] = (now, lines, num_bytes)
+        elapsed = max(now - then, 1e-6)
+        stats = {
+            'lines': lines,
+            'bytes': num_bytes,
+            'lines_per_sec': (lines - last_lines) / elapsed,
+            'bytes_per_sec': (num_bytes - last_bytes) / elapsed,
+            'latency_p50_ms': 0.0,
+            'latency_p99_ms': 0.0,
+            'latency_max_ms': 0.0,
+            'queue_depth': sum(len(l.queue) for l in logs),
+            'queue_high_water': max(l.queue_high_water for l in logs),
+            'dropped_lines': sum(l.dropped_lines for l in logs),
+            'skipped_lines': sum(l.skipped_lines for l in logs),
+            'last_error': None,
+        }
+        errors = [str(l.last_error) for l in logs if l.last_error is not None]
+        if errors:
+            stats['last_error'] = errors[-1]
+        if latency:
+            stats['latency_p50_ms'] = latency[(len(latency) - 1) // 2] / 1e6
+            stats['latency_p99_ms'] = latency[(len(latency) - 1) * 99 // 100] / 1e6
+            stats['latency_max_ms'] = latency[-1] / 1e6
+        return stats
+
+    def status_text(self):
+        # One line readout for the GUI status bar
+        s = self.stats()
+        text = '%d lines/s  %.1f kB/s  write p50 %.2f / p99 %.2f / max %.2f ms  queue %d (max %d)' % (
+            s['lines_per_sec'], s['bytes_per_sec'] / 1000, s['latency_p50_ms'], s['latency_p99_ms'], s['latency_max_ms'],
+            s['queue_depth'], s['queue_high_water'])
+        if s['dropped_lines']:
+            text += '  DROPPED %d' % s['dropped_lines']
+        if s['skipped_lines']:
+            text += '  skipped %d' % s['skipped_lines']
+        if s['last_error']:
+            text += '  ERROR: %s' % s['last_error']
+        return text
 
 
-file_manager = FILE_MANAGER()
+file_manager = FILE_MANAGER(ASYNC_WRITES)
 
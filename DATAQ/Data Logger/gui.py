@@ -8,6 +8,7 @@ import PySimpleGUI as sg
 from di2008 import DI2008
 from file_manager import file_manager as fm
 from plotting import plotter
+import log_reader
 
 PROJECT_TITLE = 'DI-2008 DATA LOGGER'
 PROJECT_COLOR_THEME = 'Purple'      # 'DarkAmber'
@@ -31,6 +32,8 @@ GUI_FONT_TITLE = (GUI_TEXTFONT_ALL, GUI_TEXTSIZE_TITLE)
 
 GUI_BORDERWIDTH_FRAME = 10
 
+LOG_STATS_INTERVAL = 1000   # ms between updates of the logging status readout
+
 PARSE_LINE_PARAM_UPDATE_LIST = ['tcr', 'temp']
 cp = sg.cprint
 
@@ -58,6 +61,7 @@ FRAME_CONNECTION_LAYOUT = [
 
 FRAME_DATA_PROCESSING_LAYOUT = [
     [sg.Text('Data File:',size=(8,1),font=GUI_FONT_MAIN),sg.Input(key='gui_process_data_file',size=(26,1),font=GUI_FONT_MAIN, change_submits=True, disabled=True),sg.FileBrowse(key='gui_process_file_browser', size=(6,1), font=GUI_FONT_MAIN),sg.Button('PLOT',key='gui_button_process_plot',size=(4,1),font=GUI_FONT_MAIN)],
+    [sg.Text('Range:',size=(8,1),font=GUI_FONT_MAIN),sg.Input(key='gui_process_range_start',size=(10,1),font=GUI_FONT_MAIN),sg.Text('to',size=(2,1),font=GUI_FONT_MAIN),sg.Input(key='gui_process_range_end',size=(10,1),font=GUI_FONT_MAIN),sg.Text('(sec or HH:MM:SS)',font=GUI_FONT_MAIN)],
     [sg.T('', size=(1,1))],
 ]
 
@@ -130,6 +134,7 @@ GUI_LAYOUT = [
      sg.Frame('CHANNEL 5', FRAME_CHANNEL5_LAYOUT, font=GUI_FONT_FRAME, border_width=GUI_BORDERWIDTH_FRAME, key='gui_frame_channel5'), sg.Frame('CHANNEL 6', FRAME_CHANNEL6_LAYOUT, font=GUI_FONT_FRAME, border_width=GUI_BORDERWIDTH_FRAME, key='gui_frame_channel6'),
      sg.Frame('CHANNEL 7', FRAME_CHANNEL7_LAYOUT, font=GUI_FONT_FRAME, border_width=GUI_BORDERWIDTH_FRAME, key='gui_frame_channel7'), sg.Frame('CHANNEL 8', FRAME_CHANNEL8_LAYOUT, font=GUI_FONT_FRAME, border_width=GUI_BORDERWIDTH_FRAME, key='gui_frame_channel8')],
     [sg.Button('START', size=8, key='gui_button_start'), sg.Button('STOP', size=8, key='gui_button_stop'), sg.Button('EXIT', key='gui_button_exit')],
+    [sg.Text('', key='gui_log_stats', font=GUI_FONT_MAIN, size=(90,1))],
 ]
 
 class GUI():
@@ -176,8 +181,19 @@ class GUI():
     def update_param(self, param, val):
         self.window[param].Update(value=val)
 
+    def set_log_format(self):
+        # The plot's time axis is the running sum of t_diff, recorded per segment of a rotated log
+        try:
+            f = open(self.config_file_path, 'r')
+            num_fields = len(json.load(f)['DATA_HEADERS'])
+            f.close()
+        except (OSError, ValueError, KeyError):
+            num_fields = None
+        fm.set_row_format(num_fields, '', ',', False, 0, cumulative=True)
+
     def enable_logging(self, enable):
         if enable:
+            self.set_log_format()
             logfile = fm.create_log_file()
             print('New logfile created: %s' % logfile)
             self.log_stat = 1
@@ -188,10 +204,22 @@ class GUI():
             self.log_stat = 0
             self.tc_dvc.log_enable(self.log_stat)
 
+    def get_plot_range(self):
+        # Optional (start, end) to plot, in seconds from the start of the log or HH:MM:SS clock time
+        try:
+            start = log_reader.parse_time(self.plot_file_path, self.e_val['gui_process_range_start'])
+            end = log_reader.parse_time(self.plot_file_path, self.e_val['gui_process_range_end'])
+        except ValueError:
+            print('Plot range must be in seconds or HH:MM:SS, plotting whole file!')
+            return None
+        if start is None and end is None:
+            return None
+        return (start, end)
+
     def event_loop(self):
         # Event Loop to process "events"
         while True:
-            self.event, self.e_val = self.window.read(timeout=1000)
+            self.event, self.e_val = self.window.read(timeout=LOG_STATS_INTERVAL)
             # print(self.event, self.e_val)
             # TIMEOUT
             if self.event == '__TIMEOUT__':
@@ -199,6 +227,7 @@ class GUI():
                     if self.chan_enabled[i]:
                         param = 'gui_temp_display%d' % (i+1)
                         self.update_param(param, round(self.tc_dvc.temp_filt[i].result, 1))
+                self.window['gui_log_stats'].update(fm.status_text())
 
             # CONNECTION
             elif self.event == 'gui_button_connect':
@@ -235,7 +264,7 @@ class GUI():
                         print('Configuration file: %s' % self.config_file_path.split('/')[-1])
                         print('PLOTTING!')
                         plotter.load_config_file(self.config_file_path)
-                        if plotter.load_data_file(self.plot_file_path):
+                        if plotter.load_data_file(self.plot_file_path, self.get_plot_range()):
                             plotter.run()
                         else:
                             print('Bad data import of file!')
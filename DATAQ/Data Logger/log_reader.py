@@ -0,0 +1,1038 @@
+"""
+Bulk parser for data logs written by FILE_MANAGER.
+The whole file is handled as one byte buffer: line boundaries, row prefixes and
+delimiter counts are found with numpy, the matching rows are gathered into one
+contiguous block and that block goes through the pandas C tokenizer in a single
+call. No Python object is ever created per row.
+The dialect can be sniffed from the first rows of the file instead of being
+hard-coded per tool, so one loader reads K5R, K3/Willow and CSV style logs.
+Parsed columns are kept in a sidecar cache next to the log so re-plotting an
+unchanged file is a memory-mapped load instead of a re-parse. A row offset
+index, kept in the same cache, lets a time range be loaded with a binary
+search and a parse of only the rows in that range.
+Loaders take an optional usecols list so only the columns a plot needs are
+converted and kept; the other fields are skipped by the tokenizer.
+Whole-file and range loads can also take per-column dtypes; columns without
+one are narrowed to the smallest integer type that holds them.
+Lines that are not data rows (CLI echo, 'puff stop', errors) can be collected
+in the same pass into an event table, so finding them never re-reads the file.
+Binary record logs (FILE_MANAGER.create_record_file) need no parsing at all:
+the records are memory-mapped as a numpy structured array.
+Compressed logs (.log.gz) are a series of independent gzip members with a frame
+index next to them; every loader reads them transparently and range loads only
+decompress the frames holding the requested rows.
+A rotated session (FILE_MANAGER.set_rotation) is loaded through its manifest as
+one log; whole loads reuse the cache of every segment and range loads only read
+the segments holding the requested rows. When the manifest has the data row
+count and time range of each segment (FILE_MANAGER.set_row_format), a range
+query does not even open the index of the segments outside it.
+Lines stamped with the host receive time (FILE_MANAGER host_timestamps) are
+read like any other; the stamp is available as the 'host_time' column.
+Logs captured with a column sink (FILE_MANAGER.set_column_sink) are loaded from
+the .npy chunks written during acquisition, the text is not parsed at all.
+A log that is still being written can be followed with LOG_TAIL, which only
+parses the bytes appended since the previous read.
+"""
+
+import io
+import os
+import mmap
+import gzip
+import zlib
+import hashlib
+import json
+from datetime import datetime as dt
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+
+LINE_FEED = ord('\n')
+CARRIAGE_RETURN = ord('\r')
+TAB = ord('\t')
+DIGIT_0 = ord('0')
+DIGIT_9 = ord('9')
+
+# Host receive time of lines written as '<perf_counter_ns>\t<line>', loaded when usecols asks for it
+HOST_TIME_COLUMN = 'host_time'
+HOST_TIME_MAX_DIGITS = 19       # Longest int64 stamp
+
+# Data row dialects: (field delimiter, row prefix, trailing delimiter after last field)
+DIALECT_K5R = (b',', b'$,', False)      # $,f1,f2,...,fn
+DIALECT_K3 = (b';', b'', True)          # f1;f2;...;fn;
+DIALECT_WILLOW = DIALECT_K3
+DIALECT_CSV = (b',', b'', False)        # f1,f2,...,fn (DI-2008, TCR rig)
+DIALECTS = [DIALECT_K5R, DIALECT_K3, DIALECT_CSV]
+
+# Bytes read from the start of a log to sniff its dialect
+SNIFF_BYTES = 64 * 1024
+
+# Parsed logs are cached as column-major .npy files in a folder next to the log
+CACHE_DIRECTORY = '.cache'
+CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+CACHE_KEY_LENGTH = 16
+
+# Logs larger than this are streamed in chunks and decimated for plotting instead of loaded whole
+STREAM_THRESHOLD_BYTES = 512 * 1024 * 1024
+CHUNK_BYTES = 32 * 1024 * 1024
+PLOT_MAX_POINTS = 50000
+
+# Row offset index: byte offset of every data row plus its time (device units, or row number)
+INDEX_DTYPE = np.dtype([('offset', '<i8'), ('time', '<f8')])
+INDEX_SUFFIX = '.idx.npy'
+
+# Candidates for inferred column types, smallest first. Fractional or missing values stay float64.
+INT_DTYPES = [np.int8, np.int16, np.int32, np.int64]
+
+# Binary record logs: RECORD_MAGIC, header length (uint32 LE), JSON schema, packed records
+RECORD_SUFFIX = '.rec'
+RECORD_MAGIC = b'FMREC001'
+
+# Logs followed by tail_log() in this process (oldest dropped first)
+TAIL_MAX_FILES = 4
+
+# Compressed logs (FILE_MANAGER.create_log_file(compress=True)): one gzip member per frame, and a
+# '.frames' text index with 'offset,size,data offset,data size' per member
+COMPRESSED_SUFFIX = '.gz'
+FRAME_SUFFIX = '.frames'
+FRAME_DTYPE = np.dtype([('offset', '<i8'), ('size', '<i8'), ('data_offset', '<i8'), ('data_size', '<i8')])
+
+# Rotated sessions: '<name>.session.json' manifest listing the segments in order. Their row
+# index also says which segment every row is in.
+SESSION_SUFFIX = '.session.json'
+SESSION_INDEX_DTYPE = np.dtype([('offset', '<i8'), ('time', '<f8'), ('segment', '<i4')])
+
+# Column sink of a log: '<log>.cols/' with schema.json and chunk_NNNNNN.npy (rows x columns)
+COLUMNS_SUFFIX = '.cols'
+
+def read_log_bytes(file):
+    if file.endswith(COMPRESSED_SUFFIX):
+        return read_frames(file)
+    f = open(file, 'rb')
+    buf = f.read()
+    f.close()
+    return buf
+
+def read_log_range(file, start, end=None):
+    # Bytes [start, end) of the log text, end=None reads to the end
+    if file.endswith(COMPRESSED_SUFFIX):
+        return read_frames(file, start, end)
+    f = open(file, 'rb')
+    f.seek(start)
+    if end is None:
+        buf = f.read()
+    else:
+        buf = f.read(max(0, end - start))
+    f.close()
+    return buf
+
+def load_session(file):
+    # (manifest, segment paths in order) of a rotated session
+    f = open(file, 'r')
+    session = json.load(f)
+    f.close()
+    directory = os.path.dirname(file)
+    return session, [os.path.join(directory, segment['file']) for segment in session['segments']]
+
+def log_size(file):
+    # Bytes on disk of a log, all segments of a session
+    if file.endswith(SESSION_SUFFIX):
+        return sum(os.path.getsize(segment) for segment in load_session(file)[1])
+    return os.path.getsize(file)
+
+def scan_frames(file):
+    # Frame index of a compressed log rebuilt from the gzip members themselves (index file missing).
+    # A member cut short by a crash ends the scan.
+    f = open(file, 'rb')
+    buf = memoryview(f.read())
+    f.close()
+    frames = []
+    offset = 0
+    data_offset = 0
+    while offset < len(buf):
+        d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            data_size = len(d.decompress(buf[offset:]))
+        except zlib.error:
+            break
+        if not d.eof:
+            break
+        size = len(buf) - offset - len(d.unused_data)
+        frames.append((offset, size, data_offset, data_size))
+        offset += size
+        data_offset += data_size
+    return np.array(frames, dtype=FRAME_DTYPE)
+
+def load_frames(file):
+    # Frame index written by FILE_MANAGER (only complete lines count, the writer may be mid-line),
+    # rebuilt from the gzip members if it is missing or behind the log
+    try:
+        f = open(file + FRAME_SUFFIX, 'r')
+        text = f.read()
+        f.close()
+    except OSError:
+        return scan_frames(file)
+    lines = text.split('\n')[:-1]
+    frames = np.array([tuple(int(v) for v in line.split(',')) for line in lines], dtype=FRAME_DTYPE)
+    end = int(frames['offset'][-1] + frames['size'][-1]) if len(frames) else 0
+    if end != os.path.getsize(file):
+        return scan_frames(file)
+    return frames
+
+def read_frames(file, start=0, end=None, frames=None):
+    # Bytes [start, end) of the uncompressed text, decompressing only the frames that hold them
+    if frames is None:
+        frames = load_frames(file)
+    if len(frames) == 0:
+        return b''
+    if end is None:
+        end = int(frames['data_offset'][-1] + frames['data_size'][-1])
+    first = max(0, np.searchsorted(frames['data_offset'], start, side='right') - 1)
+    last = max(first + 1, np.searchsorted(frames['data_offset'], end, side='left'))
+    f = open(file, 'rb')
+    f.seek(int(frames['offset'][first]))
+    buf = f.read(int(frames['offset'][last - 1] + frames['size'][last - 1] - frames['offset'][first]))
+    f.close()
+    base = int(frames['data_offset'][first])
+    return gzip.decompress(buf)[start - base:end - base]
+
+def line_bounds(raw):
+    # Start (inclusive) and end (position of the terminator) of every line. Like readlines()
+    # in text mode, both '\n' and '\r' end a line so the '\r' separated file header splits too.
+    is_eol = (raw == LINE_FEED) | (raw == CARRIAGE_RETURN)
+    ends = np.flatnonzero(is_eol)
+    starts = np.empty_like(ends)
+    if len(ends):
+        starts[0] = 0
+        starts[1:] = ends[:-1] + 1
+    return starts, ends
+
+def skip_host_time(raw, starts, ends):
+    # Moves the start of every line stamped '<integer>\t' past the stamp. Returns the new starts
+    # and where each stamp ends (the tab, or the line start for lines without one).
+    # Every byte before the tab must be a digit, so a tab inside a data row ('12.5\t...') is no stamp.
+    tabs = np.flatnonzero(raw == TAB)
+    if len(tabs) == 0 or len(starts) == 0:
+        return starts, starts
+    first_tab = tabs[np.minimum(np.searchsorted(tabs, starts), len(tabs) - 1)]
+    lengths = first_tab - starts
+    stamped = (lengths > 0) & (lengths <= HOST_TIME_MAX_DIGITS) & (first_tab < ends)
+    for i in range(int(lengths[stamped].max()) if stamped.any() else 0):
+        check = stamped & (lengths > i)
+        digit = raw[starts[check] + i]
+        stamped[check] = (digit >= DIGIT_0) & (digit <= DIGIT_9)
+    stamp_ends = np.where(stamped, first_tab, starts)
+    return np.where(stamped, first_tab + 1, starts), stamp_ends
+
+def host_times(raw, stamp_starts, stamp_ends):
+    # Integer value of every stamp, one digit position at a time (NaN where the line has none)
+    lengths = stamp_ends - stamp_starts
+    values = np.zeros(len(lengths), dtype=np.int64)
+    for i in range(int(lengths.max()) if len(lengths) else 0):
+        digit = lengths > i
+        values[digit] = values[digit] * 10 + (raw[stamp_starts[digit] + i] - DIGIT_0)
+    return np.where(lengths > 0, values, np.nan)
+
+def count_lines(raw, starts, ends):
+    # Number of lines readlines() would return ('\r\n' counts once)
+    crlf = (raw[ends[:-1]] == CARRIAGE_RETURN) & (raw[ends[:-1] + 1] == LINE_FEED)
+    return len(ends) - int(np.count_nonzero(crlf))
+
+def match_prefix(raw, starts, ends, prefix):
+    keep = (ends - starts) >= len(prefix)
+    for i in range(len(prefix)):
+        idx = np.minimum(starts + i, len(raw) - 1)
+        keep &= raw[idx] == prefix[i]
+    return keep
+
+def select_rows(raw, starts, ends, num_fields, dialect, return_mask=False):
+    # Returns the first and last byte of every data row's field block (and which lines are data rows)
+    delimiter, prefix, trailing = dialect
+    keep = match_prefix(raw, starts, ends, prefix)
+    delim_pos = np.flatnonzero(raw == delimiter[0])
+    first_delim = np.searchsorted(delim_pos, starts)
+    last_delim = np.searchsorted(delim_pos, ends)
+    num_delims = num_fields - 1 + prefix.count(delimiter) + (1 if trailing else 0)
+    keep &= (last_delim - first_delim) == num_delims
+
+    row_starts = starts[keep] + len(prefix)
+    if trailing:
+        # Anything after the trailing delimiter is dropped (same as popping the last split field)
+        row_ends = delim_pos[last_delim[keep] - 1]
+    else:
+        row_ends = ends[keep]
+    if return_mask:
+        return row_starts, row_ends, keep
+    return row_starts, row_ends
+
+def gather_rows(raw, row_starts, row_ends):
+    # Copy the selected rows into one buffer, each terminated with '\n'
+    delta = np.zeros(len(raw) + 1, dtype=np.int8)
+    delta[row_starts] += 1
+    delta[row_ends + 1] -= 1
+    block = raw[np.cumsum(delta[:-1], dtype=np.int8).astype(bool)]
+    block[np.cumsum(row_ends - row_starts + 1) - 1] = LINE_FEED
+    return block
+
+def project(columns, usecols=None):
+    # Columns kept by a load, in log order (all of them when usecols is None), 'host_time' first
+    if usecols is None:
+        return list(columns)
+    kept = [c for c in columns if c in usecols]
+    if HOST_TIME_COLUMN in usecols and HOST_TIME_COLUMN not in columns:
+        kept.insert(0, HOST_TIME_COLUMN)
+    return kept
+
+def parse_block(block, columns, delimiter=b',', usecols=None):
+    kept = [c for c in project(columns, usecols) if c in columns]
+    if len(block) == 0:
+        return pd.DataFrame(columns=kept, dtype=np.float64)
+    try:
+        df = pd.read_csv(io.BytesIO(block), sep=delimiter.decode(), header=None, names=columns, usecols=kept, dtype=np.float64, skipinitialspace=True, engine='c')
+    except ValueError:
+        # At least one corrupted field: let the tokenizer infer each column, coerce the ones that
+        # did not come out numeric and leave the NaN rows for the caller to drop
+        df = pd.read_csv(io.BytesIO(block), sep=delimiter.decode(), header=None, names=columns, usecols=kept, skipinitialspace=True, engine='c')
+        for col in df.columns:
+            if not pd.api.types.is_numeric_dtype(df[col]):
+                df[col] = pd.to_numeric(df[col], errors='coerce')
+        df = df.astype(np.float64)
+    return df
+
+def parse_buffer(buf, columns, dialect=DIALECT_K5R, min_lines=0, usecols=None):
+    # Returns a float64 DataFrame of all data rows in buf, or None if it has min_lines lines or less
+    if not buf.endswith(b'\n'):
+        buf += b'\n'
+    raw = np.frombuffer(buf, dtype=np.uint8)
+    line_starts, ends = line_bounds(raw)
+    if count_lines(raw, line_starts, ends) <= min_lines:
+        return None
+    starts, stamp_ends = skip_host_time(raw, line_starts, ends)
+    row_starts, row_ends, keep = select_rows(raw, starts, ends, len(columns), dialect, True)
+    df = parse_block(gather_rows(raw, row_starts, row_ends), columns, dialect[0], usecols)
+    return add_host_time(df, raw, line_starts[keep], stamp_ends[keep], columns, usecols)
+
+def add_host_time(df, raw, stamp_starts, stamp_ends, columns, usecols=None):
+    if HOST_TIME_COLUMN in project(columns, usecols) and HOST_TIME_COLUMN not in df.columns:
+        df.insert(0, HOST_TIME_COLUMN, host_times(raw, stamp_starts, stamp_ends))
+    return df
+
+def sniff_dialect(file, columns, default=DIALECT_K5R, dialects=DIALECTS, sample_bytes=SNIFF_BYTES):
+    # The dialect (out of dialects) matching the most rows with len(columns) fields in the first
+    # sample_bytes of the log. Header and CLI lines match none so they don't affect the vote.
+    if file.endswith(SESSION_SUFFIX):
+        file = load_session(file)[1][0]
+    buf = read_log_range(file, 0, sample_bytes)
+    cut = max(buf.rfind(b'\n'), buf.rfind(b'\r')) + 1
+    raw = np.frombuffer(buf[:cut], dtype=np.uint8)
+    starts, ends = line_bounds(raw)
+    starts = skip_host_time(raw, starts, ends)[0]
+    best = default
+    best_rows = 0
+    for dialect in dialects:
+        rows = len(select_rows(raw, starts, ends, len(columns), dialect)[0])
+        if rows > best_rows:
+            best = dialect
+            best_rows = rows
+    return best
+
+def infer_dtype(values):
+    if len(values) == 0 or not np.isfinite(values).all() or not (values == np.trunc(values)).all():
+        return np.dtype(np.float64)
+    for dtype in INT_DTYPES:
+        info = np.iinfo(dtype)
+        if info.min <= values.min() and values.max() <= info.max:
+            return np.dtype(dtype)
+    return np.dtype(np.float64)
+
+def fits_dtype(values, dtype):
+    if dtype.kind == 'f':
+        return True
+    if not np.isfinite(values).all():
+        return False        # Missing values can't be held by an integer column
+    info = np.iinfo(dtype)
+    return len(values) == 0 or (info.min <= values.min() and values.max() <= info.max)
+
+def compact(df, dtypes):
+    # Casts each column to dtypes[column], or to an inferred type when it has none (or 'auto').
+    # A declared integer type that can't hold the values (missing or out of range) is ignored.
+    cols = {}
+    for col in df.columns:
+        values = df[col].to_numpy(dtype=np.float64)
+        dtype = dtypes.get(col, 'auto')
+        if dtype == 'auto':
+            dtype = infer_dtype(values)
+        else:
+            dtype = np.dtype(dtype)
+            if not fits_dtype(values, dtype):
+                dtype = np.dtype(np.float64)
+        cols[col] = values.astype(dtype, copy=False)
+    return pd.DataFrame(cols, index=df.index, copy=False)
+
+def parse_log(file, columns, dialect=DIALECT_K5R, min_lines=0, usecols=None):
+    return parse_buffer(read_log_bytes(file), columns, dialect, min_lines, usecols)
+
+def parse_buffer_events(buf, columns, dialect=DIALECT_K5R, usecols=None, time_column=0):
+    # Same as parse_buffer() plus an event table of every other non-empty line (file header, CLI
+    # echo, 'puff stop', errors): 'row' is the number of data rows before the line (the index of
+    # the next data row), 'time' the time column of the data row before it and 'text' the line.
+    if not buf.endswith(b'\n'):
+        buf += b'\n'
+    raw = np.frombuffer(buf, dtype=np.uint8)
+    line_starts, ends = line_bounds(raw)
+    starts, stamp_ends = skip_host_time(raw, line_starts, ends)
+    row_starts, row_ends, keep = select_rows(raw, starts, ends, len(columns), dialect, True)
+    df = parse_block(gather_rows(raw, row_starts, row_ends), columns, dialect[0], usecols)
+    df = add_host_time(df, raw, line_starts[keep], stamp_ends[keep], columns, usecols)
+
+    lines = np.flatnonzero(~keep & (ends > starts))
+    rows = np.cumsum(keep)[lines]
+    times = np.full(len(lines), np.nan)
+    if time_column is not None and columns[time_column] in df.columns and len(df):
+        # Lines ahead of the first data row take its time
+        times = df[columns[time_column]].to_numpy(dtype=np.float64)[np.maximum(rows - 1, 0)]
+    text = [raw[s:e].tobytes().decode(errors='replace') for s, e in zip(starts[lines], ends[lines])]
+    events = pd.DataFrame({'row': rows, 'time': times, 'text': text})
+    return df, events
+
+def load_log_events(file, columns, dialect=None, usecols=None, time_column=0, dtypes=None):
+    # (DataFrame, event table) of a log in one pass, see parse_buffer_events()
+    if dialect is None:
+        dialect = sniff_dialect(file, columns)
+    if file.endswith(SESSION_SUFFIX):
+        dfs = []
+        tables = []
+        rows = 0
+        for segment in load_session(file)[1]:
+            df, events = load_log_events(segment, columns, dialect, usecols, time_column, dtypes)
+            events['row'] += rows
+            rows += len(df)
+            dfs.append(df)
+            tables.append(events)
+        return pd.concat(dfs, ignore_index=True), pd.concat(tables, ignore_index=True)
+    df, events = parse_buffer_events(read_log_bytes(file), columns, dialect, usecols, time_column)
+    if dtypes is not None:
+        df = compact(df, dtypes)
+    return df, events
+
+def read_chunks(file, chunk_bytes=CHUNK_BYTES):
+    # Yields (bytes, progress) for consecutive pieces of the log text
+    if file.endswith(COMPRESSED_SUFFIX):
+        frames = load_frames(file)
+        if len(frames) == 0:
+            return
+        size = int(frames['data_offset'][-1] + frames['data_size'][-1])
+        for pos in range(0, size, chunk_bytes):
+            yield read_frames(file, pos, pos + chunk_bytes, frames), min(1.0, (pos + chunk_bytes) / size)
+        return
+    file_size = max(1, os.path.getsize(file))
+    f = open(file, 'rb')
+    while True:
+        buf = f.read(chunk_bytes)
+        if not buf:
+            break
+        yield buf, min(1.0, f.tell() / file_size)
+    f.close()
+
+def iter_log_chunks(file, columns, dialect=DIALECT_K5R, chunk_bytes=CHUNK_BYTES, usecols=None):
+    # Yields (DataFrame, progress) for consecutive pieces of the log, progress being the fraction
+    # of the file consumed so far. At most one chunk of text is held in memory at a time.
+    if file.endswith(SESSION_SUFFIX):
+        segments = load_session(file)[1]
+        for k, segment in enumerate(segments):
+            for df, progress in iter_log_chunks(segment, columns, dialect, chunk_bytes, usecols):
+                yield df, (k + progress) / len(segments)
+        return
+    key = cache_key(file, columns, dialect, usecols)
+    df = load_cached(file, key, project(columns, usecols))
+    if df is None:
+        df = load_column_sink(file, columns, usecols)
+    if df is not None:
+        rows = max(1, chunk_bytes // (8 * len(df.columns)))
+        for i in range(0, len(df), rows):
+            yield df.iloc[i:i + rows], min(1.0, (i + rows) / len(df))
+        return
+
+    tail = b''
+    for buf, progress in read_chunks(file, chunk_bytes):
+        buf = tail + buf
+        # Only complete lines are parsed, the remainder is carried into the next chunk
+        cut = max(buf.rfind(b'\n'), buf.rfind(b'\r')) + 1
+        tail = buf[cut:]
+        if cut:
+            yield parse_buffer(buf[:cut], columns, dialect, usecols=usecols), progress
+    if tail:
+        yield parse_buffer(tail, columns, dialect, usecols=usecols), 1.0
+
+def decimate(df, factor):
+    # Min/max envelope over every `factor` rows (two rows per bucket) so peaks survive decimation
+    if factor <= 1 or len(df) == 0:
+        return df
+    values = df.to_numpy(dtype=np.float64)
+    buckets = np.arange(0, len(values), factor)
+    out = np.empty((2 * len(buckets), values.shape[1]))
+    out[0::2] = np.fmin.reduceat(values, buckets, axis=0)
+    out[1::2] = np.fmax.reduceat(values, buckets, axis=0)
+    return pd.DataFrame(out, columns=df.columns)
+
+def stream_log(file, columns, calcs, dialect=DIALECT_K5R, max_points=PLOT_MAX_POINTS, usecols=None):
+    # Parses the log chunk by chunk, runs calcs(df) -> df on every chunk and keeps only a decimated
+    # copy, so peak memory is one chunk plus about max_points rows whatever the file size
+    factor = 0
+    parts = []
+    for chunk, progress in iter_log_chunks(file, columns, dialect, usecols=usecols):
+        chunk = chunk.dropna().reset_index(drop=True)
+        if len(chunk) == 0:
+            continue
+        chunk = calcs(chunk)
+        if factor == 0:
+            # Fixed for the whole file, estimated from the row density of the first chunk
+            factor = max(1, int(np.ceil(len(chunk) / progress / max_points)))
+        parts.append(decimate(chunk, factor))
+    if len(parts) == 0:
+        return None
+    return pd.concat(parts, ignore_index=True)
+
+class LOG_TAIL:
+    def __init__(self, file, columns, dialect=DIALECT_K5R, usecols=None, chunk_bytes=CHUNK_BYTES):
+        self.file = file
+        self.columns = columns
+        self.dialect = dialect
+        self.usecols = usecols
+        self.chunk_bytes = chunk_bytes
+        self.reset()
+
+    def reset(self):
+        self.file_id = None
+        self.offset = 0         # First byte not parsed yet (always the start of a line)
+        self.rows = 0
+        self.data = {}
+        for col in project(self.columns, self.usecols):
+            self.data[col] = np.empty(0)
+
+    def read(self):
+        # Parses the complete lines appended since the last read and returns all rows so far.
+        # A file that shrank or was replaced (new log with the same name) is read from the start.
+        st = os.stat(self.file)
+        if self.file_id != (st.st_dev, st.st_ino) or st.st_size < self.offset:
+            self.reset()
+            self.file_id = (st.st_dev, st.st_ino)
+        f = open(self.file, 'rb')
+        f.seek(self.offset)
+        while self.offset < st.st_size:
+            buf = f.read(min(self.chunk_bytes, st.st_size - self.offset))
+            cut = max(buf.rfind(b'\n'), buf.rfind(b'\r')) + 1
+            if cut == 0:
+                if len(buf) == self.chunk_bytes:
+                    cut = len(buf)  # No line end in a whole chunk: not a data row, skip it
+                else:
+                    break           # Row still being written, picked up next time
+            self.append(parse_buffer(buf[:cut], self.columns, self.dialect, usecols=self.usecols))
+            self.offset += cut
+            f.seek(self.offset)
+        f.close()
+        return self.frame()
+
+    def append(self, df):
+        rows = self.rows + len(df)
+        for col in self.data:
+            if rows > len(self.data[col]):
+                # Capacity doubles so appending n rows costs O(n) overall
+                grown = np.empty(max(rows, 2 * len(self.data[col]), 1024))
+                grown[:self.rows] = self.data[col][:self.rows]
+                self.data[col] = grown
+            self.data[col][self.rows:rows] = df[col].to_numpy()
+        self.rows = rows
+
+    def frame(self):
+        cols = {}
+        for col in self.data:
+            cols[col] = self.data[col][:self.rows]
+        return pd.DataFrame(cols, copy=False)
+
+log_tails = {}
+
+def tail_log(file, columns, dialect=DIALECT_K5R, usecols=None):
+    # All rows of a growing log, re-reading only what was appended since the last call for the
+    # same file and columns. The returned columns share memory with the tail: don't modify in place.
+    if file.endswith(COMPRESSED_SUFFIX):
+        # Only whole frames reach the disk, there is no byte offset to resume from
+        return load_log(file, columns, dialect, use_cache=False, usecols=usecols)
+    if file.endswith(SESSION_SUFFIX):
+        # Closed segments come from the cache, only the one being written is followed
+        segments = load_session(file)[1]
+        parts = [load_log(segment, columns, dialect, usecols=usecols) for segment in segments[:-1]]
+        parts.append(tail_log(segments[-1], columns, dialect, usecols))
+        return pd.concat(parts, ignore_index=True)
+    key = (os.path.abspath(file), tuple(columns), dialect, tuple(project(columns, usecols)))
+    if key not in log_tails:
+        while len(log_tails) >= TAIL_MAX_FILES:
+            log_tails.pop(next(iter(log_tails)))
+        log_tails[key] = LOG_TAIL(file, columns, dialect, usecols)
+    return log_tails[key].read()
+
+def cache_key(file, columns, dialect, usecols=None):
+    # Any change to the log (size/mtime), to the DATA_HEADERS schema or to the projection gives a new key
+    st = os.stat(file)
+    key = (os.path.abspath(file), st.st_size, st.st_mtime_ns, list(columns), dialect)
+    if usecols is not None:
+        key += (project(columns, usecols),)
+    key = repr(key)
+    return hashlib.sha1(key.encode()).hexdigest()[:CACHE_KEY_LENGTH]
+
+def cache_directory(file):
+    return os.path.join(os.path.dirname(os.path.abspath(file)), CACHE_DIRECTORY)
+
+def cache_file(file, key, suffix='.npy'):
+    return os.path.join(cache_directory(file), '%s.%s%s' % (os.path.basename(file), key, suffix))
+
+def load_cached(file, key, columns):
+    data = load_cached_array(file, key)
+    if data is None:
+        return None
+    return pd.DataFrame(data, columns=columns, copy=False)
+
+def load_cached_array(file, key, suffix='.npy'):
+    path = cache_file(file, key, suffix)
+    if not os.path.isfile(path):
+        return None
+    try:
+        data = np.load(path, mmap_mode='c')
+        os.utime(path)      # Mark as recently used for eviction
+    except (OSError, ValueError):
+        return None
+    return data
+
+def store_cached(file, key, df):
+    store_cached_array(file, key, np.asfortranarray(df.to_numpy(dtype=np.float64)))
+
+def store_cached_array(file, key, data, suffix='.npy'):
+    cache_dir = cache_directory(file)
+    path = cache_file(file, key, suffix)
+    try:
+        if not os.path.isdir(cache_dir):
+            os.mkdir(cache_dir)
+        # Drop entries of older versions of this log
+        prefix = os.path.basename(file) + '.'
+        for entry in os.listdir(cache_dir):
+            if entry.startswith(prefix) and entry.endswith(suffix) and len(entry) == len(prefix) + CACHE_KEY_LENGTH + len(suffix):
+                os.remove(os.path.join(cache_dir, entry))
+        tmp_path = path + '.tmp'
+        f = open(tmp_path, 'wb')
+        np.save(f, data)
+        f.close()
+        os.replace(tmp_path, path)
+        evict_cache(cache_dir)
+    except OSError as e:
+        print('Unable to cache parsed log: %s' % e)
+
+def evict_cache(cache_dir, max_bytes=CACHE_MAX_BYTES):
+    # Remove least recently used entries until the folder is back under max_bytes
+    entries = []
+    for entry in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, entry)
+        if entry.endswith('.npy'):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue    # Removed by another process meanwhile
+            entries.append((st.st_mtime, st.st_size, path))
+    total = sum(e[1] for e in entries)
+    for mtime, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass    # Still mapped by a loaded DataFrame (Windows)
+
+def load_log(file, columns, dialect=DIALECT_K5R, min_lines=0, use_cache=True, usecols=None, dtypes=None):
+    # Same as parse_log() but served from the sidecar cache when the log has not changed.
+    # With dtypes (a dict, may be empty) columns are narrowed by compact(); the cache stays float64.
+    # dialect=None sniffs it from the file.
+    if dialect is None:
+        dialect = sniff_dialect(file, columns)
+    if file.endswith(SESSION_SUFFIX):
+        # min_lines applies to the session as a whole, a short segment still holds data
+        parts = [load_log(segment, columns, dialect, 0, use_cache, usecols, dtypes) for segment in load_session(file)[1]]
+        parts = [df for df in parts if df is not None and len(df)]
+        if sum(len(df) for df in parts) <= min_lines or len(parts) == 0:
+            return None
+        return pd.concat(parts, ignore_index=True)
+    # A column sink written during acquisition needs no parsing or cache
+    df = load_column_sink(file, columns, usecols)
+    if df is None and not use_cache:
+        df = parse_log(file, columns, dialect, min_lines, usecols)
+    elif df is None:
+        key = cache_key(file, columns, dialect, usecols)
+        df = load_cached(file, key, project(columns, usecols))
+        if df is None:
+            df = parse_log(file, columns, dialect, min_lines, usecols)
+            if df is not None:
+                store_cached(file, key, df)
+    if df is not None and len(df) == 0:
+        return None     # Only headers or CLI echo, nothing to plot
+    if df is not None and dtypes is not None:
+        df = compact(df, dtypes)
+    return df
+
+def load_column_sink(file, columns, usecols=None):
+    # Float64 DataFrame of the log from its column sink, None when there is none, it is still being
+    # written, it holds no rows or it was captured with other columns (the caller then parses the text)
+    path = file + COLUMNS_SUFFIX
+    try:
+        f = open(os.path.join(path, 'schema.json'), 'r')
+        schema = json.load(f)
+        f.close()
+    except (OSError, ValueError):
+        return None
+    stored = schema['columns']
+    if not schema['complete'] or [c for c in stored if c != HOST_TIME_COLUMN] != list(columns):
+        return None
+    kept = project(columns, usecols)
+    if not set(kept) <= set(stored):
+        return None
+    chunks = [np.load(os.path.join(path, 'chunk_%06d.npy' % i), mmap_mode='r') for i in range(schema['chunks'])]
+    if sum(len(chunk) for chunk in chunks) == 0:
+        return None
+    data = np.concatenate(chunks)
+    return pd.DataFrame({col: data[:, stored.index(col)] for col in kept}, copy=False)
+
+def plot_columns(config, headers, num_data_headers, required=()):
+    # Data columns a plot config needs: x_data and subplotN traces of every PLOT_WINDOW plus the
+    # inputs of the CALCULATIONS they use ([name, input, ...], 1-based like the traces), and the
+    # names in required. Returns None (load everything) when a calculation's inputs are unknown.
+    wanted = []
+    for k,v in config.items():
+        if "PLOT_WINDOW" in k:
+            for name, traces in v.items():
+                if name != 'title':
+                    wanted += traces
+    calcs = {}
+    for k,v in config.get("CALCULATIONS", {}).items():
+        calcs[int(k)] = v
+    used = set(required)
+    while wanted:
+        loc = wanted.pop()
+        if loc <= num_data_headers:
+            used.add(headers[loc - 1])
+        elif isinstance(calcs.get(loc), list):
+            wanted += calcs.pop(loc)[1:]
+        elif loc in calcs:
+            return None
+    return [c for c in headers[:num_data_headers] if c in used]
+
+def plot_dtypes(config, headers, num_data_headers):
+    # dtypes for the loaders from a plot config's "DATA_TYPES" ({"2": "int8"}, 1-based like the
+    # traces, "auto" infers the narrowest type). None without it; columns it doesn't name stay float64.
+    declared = config.get("DATA_TYPES")
+    if not declared:
+        return None
+    dtypes = {}
+    for col in headers[:num_data_headers]:
+        dtypes[col] = 'float64'
+    for k,v in declared.items():
+        dtypes[headers[int(k) - 1]] = v
+    return dtypes
+
+def print_progress(done, total, file):
+    print("%d/%d: %s" % (done, total, file))
+
+def load_directory(log_directory, columns, dialect=DIALECT_K5R, extension='.log', workers=None, concat=False, progress=print_progress, usecols=None, dtypes=None, events=False):
+    # Parses every log in log_directory on a pool of worker processes (one per core by default).
+    # Returns {file name: DataFrame} in sorted file order, or with concat=True a single DataFrame
+    # indexed by (file, row). progress(done, total, file) is called as each file finishes.
+    # With events=True every DataFrame comes with its event table: {file name: (df, events)},
+    # or (df, events) both indexed by file when concatenated.
+    # Scripts calling this must keep their top level code under "if __name__ == '__main__':".
+    files = sorted(f for f in os.listdir(log_directory) if f.endswith(extension))
+    results = {}
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = {}
+        for file in files:
+            path = os.path.join(log_directory, file)
+            if events:
+                futures[pool.submit(load_log_events, path, columns, dialect, usecols, dtypes=dtypes)] = file
+            else:
+                futures[pool.submit(load_log, path, columns, dialect, usecols=usecols, dtypes=dtypes)] = file
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+            if progress is not None:
+                progress(len(results), len(files), futures[future])
+    finally:
+        pool.shutdown(cancel_futures=True)
+    results = {file: results[file] for file in files if results[file] is not None}
+    if concat:
+        empty = pd.DataFrame(columns=project(columns, usecols), dtype=np.float64)
+        if events:
+            if len(results) == 0:
+                return empty, pd.DataFrame({'row': [], 'time': [], 'text': []})
+            dfs = {file: results[file][0] for file in results}
+            tables = {file: results[file][1] for file in results}
+            return pd.concat(dfs, names=['file', 'row']), pd.concat(tables, names=['file', 'event'])
+        if len(results) == 0:
+            return empty
+        return pd.concat(results, names=['file', 'row'])
+    return results
+
+def field_bounds(raw, row_starts, row_ends, num_fields, delimiter, field):
+    # First and last byte of one field in every selected row (rows already have the right delimiter count)
+    delim_pos = np.flatnonzero(raw == delimiter[0])
+    first_delim = np.searchsorted(delim_pos, row_starts)
+    if field == 0:
+        starts = row_starts
+    else:
+        starts = delim_pos[first_delim + field - 1] + 1
+    if field == num_fields - 1:
+        ends = row_ends
+    else:
+        ends = delim_pos[first_delim + field]
+    return starts, ends
+
+def build_index(file, columns, dialect=DIALECT_K5R, time_column=0, cumulative=False, chunk_bytes=CHUNK_BYTES):
+    # Scans a memory-mapped log one window at a time. time_column=None stores row numbers as time,
+    # cumulative=True stores the running sum of the column (per-sample time deltas, DI-2008)
+    # Offsets of a compressed log are positions in the uncompressed text
+    index = []
+    if file.endswith(COMPRESSED_SUFFIX):
+        f = None
+        mm = read_frames(file)
+        if len(mm) == 0:
+            return np.zeros(0, dtype=INDEX_DTYPE)
+    else:
+        f = open(file, 'rb')
+        if os.fstat(f.fileno()).st_size == 0:
+            f.close()
+            return np.zeros(0, dtype=INDEX_DTYPE)
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        raw = np.frombuffer(mm, dtype=np.uint8)
+        pos = 0
+        rows = 0
+        while pos < len(raw):
+            window = raw[pos:pos + chunk_bytes]
+            line_starts, ends = line_bounds(window)
+            if len(ends) == 0:
+                if pos + chunk_bytes >= len(raw):
+                    break       # Unterminated last line, still being written
+                chunk_bytes *= 2
+                continue
+            window = window[:ends[-1] + 1]
+            starts = skip_host_time(window, line_starts, ends)[0]
+            row_starts, row_ends, keep = select_rows(window, starts, ends, len(columns), dialect, True)
+            chunk = np.zeros(len(row_starts), dtype=INDEX_DTYPE)
+            chunk['offset'] = pos + line_starts[keep]
+            if time_column is None:
+                chunk['time'] = np.arange(rows, rows + len(row_starts))
+            elif len(row_starts):
+                t_starts, t_ends = field_bounds(window, row_starts, row_ends, len(columns), dialect[0], time_column)
+                chunk['time'] = parse_block(gather_rows(window, t_starts, t_ends), ['time'])['time'].to_numpy()
+            index.append(chunk)
+            rows += len(row_starts)
+            pos += ends[-1] + 1
+        del raw, window
+    finally:
+        if f is not None:
+            mm.close()
+            f.close()
+    if len(index) == 0:
+        return np.zeros(0, dtype=INDEX_DTYPE)
+    index = np.concatenate(index)
+    if cumulative:
+        index['time'] = np.nancumsum(index['time'])
+    return index
+
+def load_index(file, columns, dialect=DIALECT_K5R, time_column=0, cumulative=False, t_from=None, t_to=None):
+    # t_from/t_to only matter for a session, see load_session_index()
+    if file.endswith(SESSION_SUFFIX):
+        return load_session_index(file, columns, dialect, time_column, cumulative, t_from, t_to)
+    key = cache_key(file, list(columns) + ['index', time_column, cumulative], dialect)
+    index = load_cached_array(file, key, INDEX_SUFFIX)
+    if index is None:
+        index = build_index(file, columns, dialect, time_column, cumulative)
+        store_cached_array(file, key, index, INDEX_SUFFIX)
+    return index
+
+def session_ranges(session, columns, dialect, time_column, cumulative):
+    # Per segment (rows, first, last, min, max time) from the manifest, None for the segments it
+    # can't tell about (still being written, or the rows were counted with another format)
+    row_format = {'fields': len(columns), 'prefix': dialect[1].decode(), 'delimiter': dialect[0].decode(),
+        'trailing': dialect[2], 'time_column': time_column, 'cumulative': cumulative}
+    ranges = []
+    for segment in session['segments']:
+        if session.get('row_format') != row_format or segment['end'] is None:
+            ranges.append(None)
+        else:
+            ranges.append((segment['rows'], segment['first_time'], segment['last_time'], segment['min_time'], segment['max_time']))
+    return ranges
+
+def start_time(file, columns, dialect=DIALECT_K5R, time_column=0, cumulative=False):
+    # Time of the first data row (None when there is none), from the manifest of a session if it can
+    if file.endswith(SESSION_SUFFIX):
+        for r in session_ranges(load_session(file)[0], columns, dialect, time_column, cumulative):
+            if r is None:
+                break
+            if r[0]:
+                return r[1]
+    index = load_index(file, columns, dialect, time_column, cumulative)
+    if len(index) == 0:
+        return None
+    return index['time'][0]
+
+def load_session_index(file, columns, dialect=DIALECT_K5R, time_column=0, cumulative=False, t_from=None, t_to=None):
+    # Row index of every segment (each one cached on its own) joined into one. Row numbers and
+    # running sums carry on from the previous segment.
+    # With t_from/t_to the segments the manifest puts outside the range are not opened. Their rows
+    # are placeholders (first and last time of the segment, offset 0) that find_rows() never selects,
+    # so row positions stay the same as in the full index.
+    session, segments = load_session(file)
+    ranges = session_ranges(session, columns, dialect, time_column, cumulative)
+    parts = []
+    rows = 0
+    total = 0.0
+    for k, segment in enumerate(segments):
+        r = ranges[k]
+        outside = r is not None and (t_from is not None or t_to is not None) and (r[0] == 0 or r[3] is None or
+            (t_from is not None and r[4] < t_from) or (t_to is not None and r[3] > t_to))
+        if outside:
+            part = np.zeros(r[0], dtype=SESSION_INDEX_DTYPE)
+            part['segment'] = k
+            if time_column is None:
+                part['time'] = np.arange(rows, rows + r[0])
+            elif len(part):
+                part['time'][0] = r[1]
+                part['time'][1:] = r[2]
+        else:
+            index = load_index(segment, columns, dialect, time_column, cumulative)
+            part = np.zeros(len(index), dtype=SESSION_INDEX_DTYPE)
+            part['offset'] = index['offset']
+            part['time'] = index['time']
+            part['segment'] = k
+            if time_column is None:
+                part['time'] += rows
+            elif cumulative:
+                part['time'] += total
+        if len(part):
+            total = part['time'][-1]
+        rows += len(part)
+        parts.append(part)
+    if len(parts) == 0:
+        return np.zeros(0, dtype=SESSION_INDEX_DTYPE)
+    return np.concatenate(parts)
+
+def find_rows(index, t_from=None, t_to=None):
+    # Binary search for the rows with t_from <= time <= t_to, returns (first, last) with last exclusive
+    times = index['time']
+    if np.all(times[1:] >= times[:-1]):
+        first = 0 if t_from is None else int(np.searchsorted(times, t_from, side='left'))
+        last = len(times) if t_to is None else int(np.searchsorted(times, t_to, side='right'))
+        return first, max(first, last)
+    # Time went backwards somewhere (device reset), fall back to a linear scan of the index
+    hits = np.ones(len(times), dtype=bool)
+    if t_from is not None:
+        hits &= times >= t_from
+    if t_to is not None:
+        hits &= times <= t_to
+    hits = np.flatnonzero(hits)
+    if len(hits) == 0:
+        return 0, 0
+    return int(hits[0]), int(hits[-1]) + 1
+
+def load_rows(file, columns, index, first, last, dialect=DIALECT_K5R, usecols=None, dtypes=None):
+    # Parses only the byte range holding data rows [first, last)
+    if last <= first:
+        return pd.DataFrame(columns=project(columns, usecols), dtype=np.float64)
+    if file.endswith(SESSION_SUFFIX):
+        # One read per segment in [first, last), the other segments are never opened
+        segments = load_session(file)[1]
+        parts = []
+        while first < last:
+            k = index['segment'][first]
+            end = first + int(np.searchsorted(index['segment'][first:last], k, side='right'))
+            if end < len(index) and index['segment'][end] == k:
+                buf = read_log_range(segments[k], int(index['offset'][first]), int(index['offset'][end]))
+            else:
+                buf = read_log_range(segments[k], int(index['offset'][first]))
+            parts.append(parse_buffer(buf, columns, dialect, usecols=usecols))
+            first = end
+        df = pd.concat(parts, ignore_index=True)
+    elif last < len(index):
+        df = parse_buffer(read_log_range(file, int(index['offset'][first]), int(index['offset'][last])), columns, dialect, usecols=usecols)
+    else:
+        df = parse_buffer(read_log_range(file, int(index['offset'][first])), columns, dialect, usecols=usecols)
+    if dtypes is not None:
+        df = compact(df, dtypes)
+    return df
+
+def read_record_header(file):
+    # (schema, offset of the first record) of a binary record log
+    f = open(file, 'rb')
+    head = f.read(len(RECORD_MAGIC) + 4)
+    if len(head) < len(RECORD_MAGIC) + 4 or not head.startswith(RECORD_MAGIC):
+        f.close()
+        raise ValueError('%s is not a record log' % file)
+    length = int.from_bytes(head[len(RECORD_MAGIC):], 'little')
+    schema = json.loads(f.read(length))
+    f.close()
+    return schema, len(RECORD_MAGIC) + 4 + length
+
+def load_records(file):
+    # Structured array of all complete records, memory-mapped copy-on-write (a record still being
+    # written is left out)
+    schema, offset = read_record_header(file)
+    dtype = np.dtype([(col, schema['dtype']) for col in schema['columns']])
+    num_records = (os.path.getsize(file) - offset) // dtype.itemsize
+    if num_records == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(file, dtype=dtype, mode='c', offset=offset, shape=(num_records,))
+
+def load_record_log(file, usecols=None, dtypes=None):
+    # DataFrame view of a record log, same columns/dtypes options as load_log()
+    records = load_records(file)
+    cols = {}
+    for col in project(records.dtype.names, usecols):
+        if col in records.dtype.names:     # Records carry no host_time
+            cols[col] = records[col]
+    df = pd.DataFrame(cols, copy=False)
+    if dtypes is not None:
+        df = compact(df, dtypes)
+    return df
+
+def log_start_time(file):
+    # Wall clock time from the 'DATE:'/'TIME:' lines of the FILE_MANAGER header
+    if file.endswith(SESSION_SUFFIX):
+        schema = load_session(file)[0]
+        return dt.strptime(schema['date'] + ' ' + schema['time'], '%Y-%m-%d %H:%M:%S')
+    if file.endswith(RECORD_SUFFIX):
+        schema = read_record_header(file)[0]
+        return dt.strptime(schema['date'] + ' ' + schema['time'], '%Y-%m-%d %H:%M:%S')
+    head = read_log_range(file, 0, 256).decode(errors='replace')
+    date = ''
+    clock = ''
+    for line in head.replace('\r', '\n').split('\n'):
+        if line.startswith('DATE: '):
+            date = line[6:].strip()
+        elif line.startswith('TIME: '):
+            clock = line[6:].strip()
+    try:
+        return dt.strptime(date + ' ' + clock, '%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        return None
+
+def parse_time(file, text):
+    # Seconds from the start of the log for '' (None), '754.5' (seconds) or '10:32' / '10:32:15' (wall clock)
+    text = text.strip()
+    if text == '':
+        return None
+    if ':' not in text:
+        return float(text)
+    start = log_start_time(file)
+    if start is None:
+        raise ValueError('Log has no start time header')
+    fields = [int(v) for v in text.split(':')] + [0]
+    clock = start.replace(hour=fields[0], minute=fields[1], second=fields[2])
+    seconds = (clock - start).total_seconds()
+    if seconds < 0:
+        seconds += 24 * 3600    # Run crossed midnight
+    return seconds
@@ -5,6 +5,8 @@ import matplotlib.pyplot as plt
 import numpy as np
 matplotlib.use("TkAgg")
 
+import log_reader
+
 
 class PLOTTER:
 	def __init__(self):
@@ -13,6 +15,10 @@ class PLOTTER:
 		self.headers = []
 		self.num_data_headers = 0
 		self.extra_calcs_flag = False
+		self.used_headers = None
+		self.dtypes = None
+		self.dialect = log_reader.DIALECT_CSV
+		self.time_offset = 0
 
 		self.r_targ = 0
 		self.r_base = 0
@@ -50,38 +56,73 @@ class PLOTTER:
 						self.headers[loc] = v[0]
 						self.hlabels[loc] = self.config["HEADERS_LABELS"][k]
 
+				# Only the columns the plot windows (and their calculations) use are parsed
+				self.used_headers = log_reader.plot_columns(self.config, self.headers, self.num_data_headers, ['time_stamp'])
+				# Optional per-column types, e.g. "DATA_TYPES": {"2": "int8"}. Others stay float64.
+				self.dtypes = log_reader.plot_dtypes(self.config, self.headers, self.num_data_headers)
+
 			except:
 				print('Configuration file selected is not properly formated for JSON!')
 		else:
 			print('Configuration file must be JSON!')
 
-	def load_data_file(self, file):
+	def load_data_file(self, file, t_range=None):
 		rtn_val = True
-		if file.endswith('.log'):
-			f = open(file, 'r')
-			r_lines = f.readlines()
-			w_lines = []
-			for i in range(len(r_lines)):
-				temp_line = r_lines[i].split(',')
-				if len(temp_line) == self.num_data_headers:
-					try:
-						w_lines.append([float(j) for j in temp_line])
-					except:
-						pass
-			f.close()
+		records = file.endswith(log_reader.RECORD_SUFFIX)
+		if file.endswith('.log') or file.endswith('.log' + log_reader.COMPRESSED_SUFFIX) or file.endswith(log_reader.SESSION_SUFFIX) or records:
+			self.time_offset = 0
 			try:
-				self.df = pd.DataFrame(w_lines, columns=self.headers[:len(self.config["DATA_HEADERS"].keys())])
-				self.df = self.df.dropna()
-				self.run_df_calcs()
+				if not records:
+					# Row format sniffed from the start of the file, DIALECT_CSV if it can't tell
+					self.dialect = log_reader.sniff_dialect(file, self.headers[:self.num_data_headers], log_reader.DIALECT_CSV)
+				streaming = False
+				if records:
+					# Binary record log: mapped straight into columns, nothing to parse
+					df = log_reader.load_record_log(file, self.used_headers, self.dtypes)
+				elif t_range is not None:
+					df = self.load_data_range(file, t_range)
+				elif log_reader.log_size(file) > log_reader.STREAM_THRESHOLD_BYTES:
+					# Too large to hold at once: calcs and plot decimation run chunk by chunk
+					streaming = True
+					df = log_reader.stream_log(file, self.headers[:self.num_data_headers], self.run_chunk_calcs, self.dialect, usecols=self.used_headers)
+				else:
+					df = log_reader.load_log(file, self.headers[:self.num_data_headers], self.dialect, usecols=self.used_headers, dtypes=self.dtypes)
+				if df is None or len(df) == 0:
+					print('Data file is empty!')
+					rtn_val = False
+				elif streaming:
+					self.df = df
+				else:
+					self.df = df.dropna()
+					self.run_df_calcs()
 			except:
 				print('Bad pandas import of file!')
+				rtn_val = False
 		else:
 			print('Data file must be a LOG file!')
 			rtn_val = False
 		return rtn_val
 
+	def load_data_range(self, file, t_range):
+		# t_range is (start, end) in seconds from the first row, either end may be None.
+		# The index holds the running time of every row so only rows in the range are parsed.
+		columns = self.headers[:self.num_data_headers]
+		index = log_reader.load_index(file, columns, self.dialect, cumulative=True, t_from=t_range[0], t_to=t_range[1])
+		first, last = log_reader.find_rows(index, t_range[0], t_range[1])
+		if first > 0:
+			self.time_offset = index['time'][first - 1]
+		return log_reader.load_rows(file, columns, index, first, last, self.dialect, usecols=self.used_headers, dtypes=self.dtypes)
+
+	def run_chunk_calcs(self, df):
+		self.df = df
+		self.run_df_calcs()
+		return self.df
+
 	def run_df_calcs(self):
-		self.df['time_stamp'] = self.df['time_stamp'].cumsum()
+		# Time stamps are per-sample deltas, the running total is carried across chunks when streaming
+		self.df['time_stamp'] = self.df['time_stamp'].cumsum() + self.time_offset
+		if len(self.df):
+			self.time_offset = self.df['time_stamp'].iat[-1]
 
 	def run(self):
 		for k,v in self.config.items():
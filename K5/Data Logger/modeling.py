@@ -4,6 +4,7 @@ import pandas as pd
 import matplotlib
 import matplotlib.pyplot as plt
 import numpy as np
+import log_reader
 matplotlib.use("TkAgg")
 
 LO_RES_TIME_FORMAT = '%04d%02d%02d'      # YYYYMMDD
@@ -24,9 +25,6 @@ column_names = [
     'cool_count'
 ]
 
-file_list = os.listdir(log_directory)
-file_list.sort()
-
 def run_df_calcs():
     t_start  = df['timestamp'][0]
     df['timestamp'] = (df['timestamp'] - t_start) * 1e-3
@@ -36,33 +34,15 @@ def run_df_calcs():
     # df['r_ratio_minus'] = -500
 
 
-fig, ax = plt.subplots(1, sharex=True)
-fig.suptitle('Model Raw Data')
+if __name__ == '__main__':
+    fig, ax = plt.subplots(1, sharex=True)
+    fig.suptitle('Model Raw Data')
 
-count = 0
-for file in file_list:
-    if file.endswith('.csv'):
+    count = 0
+    logs = log_reader.load_directory(log_directory, column_names, extension='.csv')
+    for file, df in logs.items():
         count += 1
-        print("%d: %s" % (count, file))
-        df = pd.DataFrame()
-        df_data_lines = []
-        file_path = log_directory + file
-        f = open(file_path, 'r')
-        r_lines = f.readlines()[4:]
-
-        for i in range(len(r_lines)):
-            temp_line = r_lines[i].split(',')
-
-            if temp_line[0] == '$':
-                try:
-                    temp_line.pop(0)    # Remove '$'
-                    temp_list = [float(j) for j in temp_line]
-                    df_data_lines.append(temp_list)
-                except:
-                    pass
-        f.close()
-        df = pd.DataFrame(df_data_lines, columns=column_names)
-        df = df.dropna()
+        df = df.dropna().reset_index(drop=True)
         run_df_calcs()
 
         x = df['timestamp']
@@ -101,5 +81,5 @@ for file in file_list:
         ax.legend(loc='upper right')
         # ax.plot(df['timestamp'],df['fixed_offset_plus'])
         # ax.plot(df['timestamp'],df['fixed_offset_minus'])
-plt.xlabel(x_label)
-plt.show()
+    plt.xlabel(x_label)
+    plt.show()
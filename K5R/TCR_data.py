@@ -4,6 +4,7 @@ import pandas as pd
 import matplotlib
 import matplotlib.pyplot as plt
 import numpy as np
+import log_reader
 matplotlib.use("TkAgg")
 
 TCR_NEW = 445
@@ -23,9 +24,6 @@ column_names = [
     'oven_temp'
 ]
 
-file_list = os.listdir(log_directory)
-file_list.sort()
-
 def run_df_calcs():
     r1_base = df['channel_1'][0]
     r2_base = df['channel_2'][0]
@@ -49,35 +47,18 @@ def run_df_calcs():
     df['tcr_por'] = TCR_POR * 1e-6 * df['oven_temp'] - 0.03
 
 
-# fig1, ax1 = plt.subplots(2, sharex=True)
-# fig1.suptitle('TCR = %s' % TCR)
-
-fig2, ax2 = plt.subplots(1, sharex=True)
-fig2.suptitle('TCR NEW = %s\nTCR POR = %s' % (TCR_NEW, TCR_POR))
-
-count = 0
-for file in file_list:
-    if file.endswith('.log'):
-        count += 1
-        print("%d: %s" % (count, file))
-        df = pd.DataFrame()
-        df_data_lines = []
-        file_path = log_directory + file
-        f = open(file_path, 'r')
-        r_lines = f.readlines()[4:]
+if __name__ == '__main__':
+    # fig1, ax1 = plt.subplots(2, sharex=True)
+    # fig1.suptitle('TCR = %s' % TCR)
 
-        for i in range(len(r_lines)):
-            temp_line = r_lines[i].split(',')
+    fig2, ax2 = plt.subplots(1, sharex=True)
+    fig2.suptitle('TCR NEW = %s\nTCR POR = %s' % (TCR_NEW, TCR_POR))
 
-            if (len(temp_line) == len(column_names)):
-                temp_list = [float(j) for j in temp_line]
-                for k in range(len(temp_list)):
-                    if (k < (len(temp_list) - 1)) and (temp_list[k] > 5):
-                        temp_list[k] = 0
-                df_data_lines.append(temp_list)
-        f.close()
-        df = pd.DataFrame(df_data_lines, columns=column_names)
-        df = df.dropna()
+    logs = log_reader.load_directory(log_directory, column_names, log_reader.DIALECT_CSV)
+    for file, df in logs.items():
+        channels = column_names[:-1]
+        df[channels] = df[channels].mask(df[channels] > 5, 0)
+        df = df.dropna().reset_index(drop=True)
         run_df_calcs()
 
         # ax1[0].plot(df['channel_1'])
@@ -103,5 +84,5 @@ for file in file_list:
         ax2.set_xlabel('Temperature (˚C)')
 
         ax2.legend(loc='upper right')
-        
-plt.show()
+    
+    plt.show()
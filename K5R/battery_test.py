@@ -4,6 +4,7 @@ import pandas as pd
 import matplotlib
 import matplotlib.pyplot as plt
 import numpy as np
+import log_reader
 matplotlib.use("TkAgg")
 
 LO_RES_TIME_FORMAT = '%04d%02d%02d'      # YYYYMMDD
@@ -22,13 +23,6 @@ column_names = [
     'p_desired'
 ]
 
-file_list = os.listdir(log_directory)
-file_list.sort()
-device_name = log_directory.split('/')[-3].split('_')[-1]
-power_setting = log_directory.split('/')[-2]
-print("Device: %s" % device_name)
-print("Power Level: %s" % power_setting)
-
 def run_df_calcs():
     t_start  = df['dut_ts'][0]
     df['timestamp'] = (df['dut_ts'] - t_start) * 1e-3
@@ -46,48 +40,33 @@ def run_df_calcs():
             sum_count += 1
     df['average_power'] = sum_power / sum_count
 
-fig, ax = plt.subplots(2, sharex=True)
-if device_name == 'k5r':
-    fig.suptitle('K5R - Max Power Setpoint: %s' % power_setting)
-else:
-    fig.suptitle('K5 - Max Power Setpoint: %s' % power_setting)
-ax[0].title.set_text('Unloaded Battery Voltage')
-ax[1].title.set_text('Power')
-
-count = 0
-fire_count = 0
-current_dut = 1
-previous_dut = 1
-color_idx = 0
-
-for file in file_list:
-    if file.endswith('.log'):
-        df = pd.DataFrame()
-        df_data_lines = []
-        file_path = log_directory + file
-        f = open(file_path, 'r')
-        r_lines = f.readlines()[4:]
-        fire_count = 0
-
-        for i in range(len(r_lines)):
-            temp_line = r_lines[i].split(',')
-
-            if PUFF_INDICATOR in r_lines[i]:
-                fire_count += 1
-
-            if (temp_line[0] == '$') and (len(temp_line) == (len(column_names) + 1)):
-                try:
-                    temp_line.pop(0)    # Remove '$'
-                    temp_list = [float(j) for j in temp_line]
-                    df_data_lines.append(temp_list)
-                except:
-                    pass
+if __name__ == '__main__':
+    device_name = log_directory.split('/')[-3].split('_')[-1]
+    power_setting = log_directory.split('/')[-2]
+    print("Device: %s" % device_name)
+    print("Power Level: %s" % power_setting)
+
+    fig, ax = plt.subplots(2, sharex=True)
+    if device_name == 'k5r':
+        fig.suptitle('K5R - Max Power Setpoint: %s' % power_setting)
+    else:
+        fig.suptitle('K5 - Max Power Setpoint: %s' % power_setting)
+    ax[0].title.set_text('Unloaded Battery Voltage')
+    ax[1].title.set_text('Power')
+
+    count = 0
+    fire_count = 0
+    current_dut = 1
+    previous_dut = 1
+    color_idx = 0
+
+    logs = log_reader.load_directory(log_directory, column_names, events=True)
+    for file, (df, events) in logs.items():
+        fire_count = int(events['text'].str.contains(PUFF_INDICATOR, regex=False).sum())
 
         count += 1
         print("%d: %s -> %d puffs" % (count, file, fire_count))
-        f.close()
-        df = pd.DataFrame(df_data_lines, columns=column_names)
-        df = df.dropna()
+        df = df.dropna().reset_index(drop=True)
         run_df_calcs()
 
         x = df['timestamp']
@@ -125,6 +104,6 @@ for file in file_list:
         # ax.legend(loc='upper right')
 
         previous_dut = current_dut
-        
-plt.xlabel(x_label)
-plt.show()
+    
+    plt.xlabel(x_label)
+    plt.show()
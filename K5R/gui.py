@@ -8,6 +8,10 @@ import PySimpleGUI as sg
 
 from file_manager import file_manager as fm
 from plotting import plotter
+import log_reader
+import serial_reader
+import serial_async
+import k5r_device
 
 PROJECT_TITLE = 'K5R'
 PROJECT_COLOR_THEME = 'DarkPurple1'      # 'DarkAmber'
@@ -29,6 +33,10 @@ GUI_FONT_TITLE = (GUI_TEXTFONT_ALL, GUI_TEXTSIZE_TITLE)
 
 GUI_BORDERWIDTH_FRAME = 10
 
+LOG_STATS_INTERVAL = 1000   # ms between updates of the logging status readout
+ASYNC_COMMS = True          # Serve the port on the asyncio core (serial_async) instead of the thread_comms thread
+ASYNC_WRITES = True         # Log lines are queued for file_manager's writer thread, no disk I/O on the serial side
+
 PARSE_LINE_PARAM_UPDATE_LIST = ['tcr', 'temp']
 cp = sg.cprint
 
@@ -78,6 +86,7 @@ FRAME_COMMS_LAYOUT = [
 
 FRAME_DATA_PROCESSING_LAYOUT = [
     [sg.Text('Data File:',size=(8,1),font=GUI_FONT_MAIN),sg.Input(key='gui_process_data_file',size=(26,1),font=GUI_FONT_MAIN, change_submits=True, disabled=True),sg.FileBrowse(key='gui_process_file_browser', size=(6,1), font=GUI_FONT_MAIN),sg.Button('PLOT',key='gui_button_process_plot',size=(4,1),font=GUI_FONT_MAIN)],
+    [sg.Text('Range:',size=(8,1),font=GUI_FONT_MAIN),sg.Input(key='gui_process_range_start',size=(10,1),font=GUI_FONT_MAIN),sg.Text('to',size=(2,1),font=GUI_FONT_MAIN),sg.Input(key='gui_process_range_end',size=(10,1),font=GUI_FONT_MAIN),sg.Text('(sec or HH:MM:SS)',font=GUI_FONT_MAIN)],
     [sg.T('', size=(1,1))],
     # [sg.Text('Config File:',size=(8,1),font=GUI_FONT_MAIN),sg.Input(key='gui_process_config_file',size=(26,1),font=GUI_FONT_MAIN, change_submits=True, disabled=True),sg.FileBrowse(key='gui_process_config_browser', size=(6,1), font=GUI_FONT_MAIN)],
 ]
@@ -99,6 +108,7 @@ FRAME_TESTING_LAYOUT = [
 
 FRAME_CONSOLE_LAYOUT = [
     [sg.Multiline(key='gui_cons_output',font=GUI_FONT_MAIN,autoscroll=True,size=(60,10),reroute_cprint=True, write_only=True)],
+    [sg.Text('', key='gui_log_stats', font=GUI_FONT_MAIN, size=(80,1))],
 ]
 
 GUI_LAYOUT = [  
@@ -117,12 +127,13 @@ class SerialPort:
         self.port_new = None
         self.port_open = False
         self.lock = threading.Lock()
-        self.last_command = ''
-        self.send_command_flag = False
-        self.msg_time = 0
-        self.msg_timeout = 0.5
+        self.reader = serial_reader.LINE_READER()
+        self.stream = None          # serial_async.SERIAL_STREAM while the asyncio core serves the port
+        self.device = k5r_device.K5R_DEVICE(self.write_port)     # CLI protocol and puff test
 
-    def open_port(self, port, baud=115200, time_out=0.1):
+    def open_port(self, port, baud=115200, time_out=serial_reader.RX_TIMEOUT):
+        if self.port_open and self.port != port:
+            self.stop_stream()
         self.lock.acquire()
         if self.port_open:
             if self.port != port:
@@ -144,6 +155,8 @@ class SerialPort:
             self.ser = serial.Serial(port=self.port, baudrate=baud, bytesize=serial.EIGHTBITS, parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE, timeout=time_out)
             self.port_open = True
             self.flush_port()
+            if ASYNC_COMMS:
+                self.stream = serial_async.get_acquisition().open(self.ser, self.rx_lines)
             self.lock.release()
             cp("PORT {} now open!".format(self.port))
             return True
@@ -156,6 +169,9 @@ class SerialPort:
 
     def close_port(self):
         if self.port_open:
+            self.device.stop()
+            self.device.fire(False)
+            self.stop_stream()
             self.lock.acquire()
             cp("CLOSING PORT: {}".format(self.port))
             self.ser.close()
@@ -167,6 +183,19 @@ class SerialPort:
             cp("No PORT actively open!")
             return False
 
+    def stop_stream(self):
+        # Not under self.lock: the stream's handler may be waiting on it (send_msg)
+        if self.stream is not None:
+            serial_async.get_acquisition().close(self.stream)
+            self.stream = None
+
+    def console(self, text):
+        # Console output of the serial side. The asyncio core hands it to the GUI thread.
+        if self.stream is not None:
+            serial_async.get_acquisition().post('console', text)
+        else:
+            cp(text)
+
     def flush_port(self):
         while self.ser.in_waiting:
             self.ser.read(1)
@@ -178,30 +207,16 @@ class SerialPort:
             cp('No serial port actively open! Connect to a serial port and resend.')
             return False
 
+    def write_port(self, data):
+        with self.lock:
+            self.ser.write(data)
+
     def send_msg(self, msg):
-        self.lock.acquire()
-        msg += '\r'
-        self.ser.write(msg.encode())
-        self.send_command_flag = True
-        self.last_command = msg
-        self.msg_time = time.time()
-        self.lock.release()
-
-    def resend_msg(self):
-        self.lock.acquire()
-        self.ser.write(self.last_command.encode())
-        self.send_command_flag = True
-        self.msg_time = time.time()
-        self.lock.release()
+        self.device.send(msg)
 
     def RX(self):
-        # self.lock.acquire()
-        try:
-            line = self.ser.readline().strip().decode()
-        except:
-            line = ''
-        # self.lock.release()
-        return line
+        # Blocks until the port has data (no lock, so sends are not held up), returns the complete lines
+        return self.reader.read_lines(self.ser)
 
 class GUI(SerialPort):
     def __init__(self, gui_title, layout):
@@ -209,13 +224,14 @@ class GUI(SerialPort):
         self.event = ''
         self.e_val = ''
         self.layout = layout
-        self.k3_fire_flag = False
-        self.start = 0
 
         # Hard coded pax labs log image as base-64
         self.pax_icon_base_64 = b'iVBORw0KGgoAAAANSUhEUgAAAMgAAADICAYAAACtWK6eAAAAAXNSR0IArs4c6QAAAFBlWElmTU0AKgAAAAgAAgESAAMAAAABAAEAAIdpAAQAAAABAAAAJgAAAAAAA6ABAAMAAAABAAEAAKACAAQAAAABAAAAyKADAAQAAAABAAAAyAAAAACJhhOLAAABWWlUWHRYTUw6Y29tLmFkb2JlLnhtcAAAAAAAPHg6eG1wbWV0YSB4bWxuczp4PSJhZG9iZTpuczptZXRhLyIgeDp4bXB0az0iWE1QIENvcmUgNi4wLjAiPgogICA8cmRmOlJERiB4bWxuczpyZGY9Imh0dHA6Ly93d3cudzMub3JnLzE5OTkvMDIvMjItcmRmLXN5bnRheC1ucyMiPgogICAgICA8cmRmOkRlc2NyaXB0aW9uIHJkZjphYm91dD0iIgogICAgICAgICAgICB4bWxuczp0aWZmPSJodHRwOi8vbnMuYWRvYmUuY29tL3RpZmYvMS4wLyI+CiAgICAgICAgIDx0aWZmOk9yaWVudGF0aW9uPjE8L3RpZmY6T3JpZW50YXRpb24+CiAgICAgIDwvcmRmOkRlc2NyaXB0aW9uPgogICA8L3JkZjpSREY+CjwveDp4bXBtZXRhPgoZXuEHAAAcSElEQVR4Ae2dSagtRxnHO06JUxYZUATdCEFFwSEhCiEbcWmCZDAIauLKgEMcIAt3knUggkoQEjeCKKIogiBuVJQsfDyShfL0EYIYESQE4zzkWL/SX7/v1junTt/p3dt9voJzq7rm+n//f1V117l9LhuGYVU+6RKBRGANAi9YE5dRiUAi8H8EUiBJhUSgg0AKpANOJiUCKZDkQCLQQSAF0gEnkxKBFEhyIBHoIJAC6YCTSYlACiQ5kAh0EEiBdMDJpEQgBZIcSAQ6CKRAOuBkUiKQAkkOJAIdBFIgHXAyKRFIgSQHEoEOAimQDjiZlAikQJIDiUAHgRRIB5xMSgRSIMmBRKCDQAqkA04mJQIpkORAItBBIAXSASeTEoEUSHIgEeggkALpgJNJiUAKJDmQCHQQSIF0wMmkRCAFkhxIBDoIpEA64GRSIpACSQ4kAh0EUiAdcDIpEUiBJAcSgQ4CKZAOOJmUCKRAkgOJQAeBFEgHnExKBFIgyYFEoINACqQDTiYlAimQ5EAi0EEgBdIBJ5MSgRRIciAR6CCQAumAk0mJQAokOZAIdBBIgXTAyaREIAWSHEgEOgikQDrgZFIikAJJDiQCHQRSIB1wMikRSIEkBxKBDgIpkA44mZQILF4gL3zhC0crv+AF/xtujCOR+Msuu6x+zEwe4pbuGGPEQxzEyvGbJ8YbZ54l+osXyH/+859qt8svv3x4/vnn99hQMhBJeLVa1XQMT16v9xRa2AVjZKySnWuwwEV8HDZ5wRIntqYt0QeJ/7FiiaMrY3LGUxxXXHHF8Pe//30cLcTQ0JJEccS0scDCAo4RMYhVxMMww47YmVdcFwbLOJydE4iEwHf2XEeOEaEdC4ALzkkCIYAPQhE70ndFIIvfYmnol7zkJaOh2SJgcGc/hOK1BHnRi140kgBCLNVBdMaKY+xgAhZggvNazBALWDq51EwL/rN4gWD0F7/4xcM///nPunfGwP/4xz/GsOnYWKFAml0hgBMIY47CADOwAS/EAWaGwdL0BWujDm3xAsHoGPTKK68cPvzhDw/f+c53hnPnzg3PPvvscP78+eG73/3ucNtttw1XXXVVBQQS8KEce+6lO8bIWB034wULMAEbMAIrMAM7MARLMKXcLjjW0sV+iuFXt9566+p3v/tdWRRWqzITVv/f//539f3z29/+dnX77bdXHMrsuFg8NtnaMYMBWEQnVmIHlmAKtpvqW1D8/MVR9tCjocq2YAxjpE984hOrso2o9i6z3mh3jW2aJPjUpz5Vy8c6yyw7ksF42pkDQeijmNh34hiTJDaesePEQmzEijQxJA1srQPfdghbZ0yfaXjeAolGMYxxCDMblke62HU07L/+9a96zZ+yRagfIyACcZ/+9KdHkVinBCh79VW5Sd1DjDkYnj7T93Y8EpkxM/YohhYfsVMkYAvG1Gk9bf1zwGZLH+ctEAaH4fUl78te9rLVU089VbmvYblwVlQU+MyYMQ9hZ0cNT/0vfelLZyeM1vhxDI6NsbbjdxWJOEXszA/GYE07ilBbtG3P9Ho5AtEAkODuu++utmWW07B//etfR3s7C0IE05kxcaQR99nPfnYUhMKjDWdMhWm7p9GnjwghzuxxLIyRsYqHGBCnSEwDGzEk3dUZrKPwwGEO2Ey01/wFgvHZV3tPAAG+973vjUbHsDgNrk8cho6kiGFmyfvuu29PvRp/TgSgr/ZXcYAVY2OMYIBj7OvCpImZPnE4xAPWsV7qjoKcSMRxMjpl+ecvELcKGEnDPPnkk9WAECDOgES6z1YMxJFH47t9MO9nPvOZsV6Npxi9Ps1+21cwYkziwDgdMxhEvMQo5iU/eSwD1oyfehWKNjnNuEzs27wFUg6xxplHImAkjLfOqBhXBxnI56xpPKRQLMSRh3264psTCSSqfWYM7T0HY1UIYgAmjDviQFoUD9dgTD7r1waQL9pmIhlHW56i/PMWiECyhdA4kOJXv/oV9qsuGl/yt3HmdV8NQSSHAvLG3Tbn6DMGnGNijIYdO+ktPq2IYjpYK0Rs4HZujvis6fMyBOIMxgAx0ve//33sXEm+jQA144Y/llUsp+2chLG6skWS7uecY8PQx+goBkUELmIC1k5O4B9tsYZwp3GV6PVp3gKJhsEYkITPBz7wgdHA7exHAgZma7DNRXKwneD6NJ6TQEpmbsUCFoQVzaZzjm3jByMnCfOCgeIgDqzFPQqitU1Mm1F43gIBaIzTGuOaa67Z85UJxYBh2320ht/kU8by5CHsdksC0o/2UedJkCD2wb619xz0PxJ807hjPJhZJmLB11LAOo4VW9h2jJ9peP4CieKIM+gdd9xRyewMyMy3LhyJ0IYhRSxDOmQh7jSck7BqQMY47rjFmXLO0Y45XjNOV9E2jFDAWOLHPkSbmD5Tf94CiYYgHK8xyHET5DSckyASb4wVBzjs55wjiiKGp04QYN3i39oiBVJAutQgOGvhG6YP3KT6DdXj3GJwX3LS5yQtEcFh6jlHFMOmMCKJ2yrCbjHBOD4QiHaI9rjUvDjC9i49qY+w83tEwSwKWaJh3Asf502qhLFdZ3HbPsrxtnXZhm3Sh3ZCgOBukxQB26VIeuNbP5Zb95DC/tAu2LuSES8e5pmpP2+BADokaWdRDKWBJNGmr3O3pGivI0nWPeaEbDhn1ZMkAn3A2ae4RbLvpMcxcb3JxXrI0z7mBuMoCsaOLcT8JLE4orbnL5D9AHGpCSRhFCvXLaGm9D+Woa44IUjGXZgApmB1xHmWLRDJc9JbkNZoUTBtWnvdy+v4lrqFbLE4getlCwRA42zLNYS7lDextOlDA8keV4RtRjcvZeNN8a48hNiGzzGnL18gEEySuZIgmkv1GPQVr3jFnqd7EN3+TDEueRWW+a1zFx5jO+YT8pctEMjFNiQSTJEA+HET7OMf/3gVR1zFCMf+bDM8edvylKFunkR5I82N97rwphtw4uNNvDfup+kgdBs2lyB92QJpAbzUX8WAsDfeeGMVhFsi+uS9Q9u/ddcxL3UgGOpUDBDdR7YQfslfpVmHzzHH7YZAWDXarQpEk3zHeZN79uzZPVssSB7Fss3A6/JTp+44zzniSkcYDOMKvK3vC0hftkDidkYxEBdPf40/jsekzvI33HBDFUkkF2TbRqCYx7LUhaPuuEU6jnMO+gdWbvHECrEYt20MM09ftkD2a5yjPieByGx/Pve5z+25Md/vCuI4EAx1uaWi/m3OewvyKSLFRZwiPg0HnY7ztPiLf/VoAbrryoxY08vsXP0vfvGLwyc/+cnxtZplpqwvcC4kGn8Xg4xl9hzK7F3L9P5QjjZe97rX1ffZ2l4h+KSXYxdBDOTFUbYIq9ZFmLq3OfpIX3W8Z5dyfBgbrgiojpmx48TCvtbIHf6zdZkv2Cw6T7tVYPtwlOckzOBf//rXK4bUfVA8LUtdcVVgFdjmNv0/x2n4suVB8bgU5XZ+BSkg1xmWmRrH7MmM+uCDDw73339/XSUK+erszaxLPmZxwsRPcYWcwx//+MealbqZuW1vSnnyUoayOOqizimOPtJX+kw9hFkZiGd1YYyMlbpdOcgXV50p7Sw5z4FntALK7MsWMhzrOUkhYt3j84pO2hIzwvHa+NZv83FNXYXoVL3VxZv4IoKan9WE8pwB2V4RxxhmpSoimtQ/yy/Ynz/Jj9I4x3FO8oc//GH1yle+shKw3c7tp++WpS7qnOoQSbypJ+wNOUKwD3HsxqW/gFXgKIzIDMrs7D6fOp1JCR/0nIQ9/uc///mRhDy9ol7ILuF7/TcfZShrXuqk7m3OVYN86/6fox0vGMTVxPZ22N/tFQQCShJnU+KO6pzkZz/7WRXCUZKOuugjdW9zbsVYRXDt/3NA/B0/5xgnnQ2TwG4LZAMoI2jO2r7B/GMf+1glWtyyQEKJyP5e95Of/GTFlwqtg7bae4pt7ZvelkPM1E0bOtuO/SHNvtJ36nMssV+2k/5FergoYiRHgvU/bCBnJNb111+/OnPmjLysviTk4ve///3qgQceqGUgMrO9WMawcVP9tqwrHm3Rpi72hTj6Sp/jGBzT1LZ3Nd/ifwa6GPbQrhCz1lG4Vh+F+oj1He94x/Ce97xneP3rXz+UWXkoN87Dj3/84+FHP/rR8Nxzz9XHqTxK1VEPdejaa+Oj3+Zpr4tI6uPacuM+vPvd7x5uvvnm4VWvetVQfqag/r7gD3/4w+EXv/hFrbJszerjYerAxb7UiPxzEQIpkIsgWR8Bqcq9ynh6XrYn4wm3xCuzchWFAopkJg1Xtj/rG5gYSz0QW3LHNugHgqQN+0S1sa8IijMPy09sdmezpUC2mB5RQKjoIKnEhIyGzROFQpruqEjZ1hmFYVv2qe2r6fjrxhbTM1wOkQsIF9b8RGQtApINQuGiYCQZMzMzdfky4Dg7m9ZWKsGnCqaXP7ZBvvJEqq5srCQxjT5wjaP/jqlG5J+NCKRANkJzISGSCSFwLQFZQdptE0QkbpMAYn0XWtkcIj+uVx8rRRQu+Ykznn5T3nui/faB+nbRpUC2WF0i4Uu2tkgkcBSHMzjpfFohtfVMvaYfkJ1PbMP+xf60dcb+kW+T6Npyu3qdAtlVy+e4JyGQ3+adBFNm2lUEUiC7avkc9yQEUiCTYMpMu4pACmRXLZ/jnoRACmQSTJlpVxFIgeyq5XPckxBIgUyCKTPtKgIpkAmW5wAOh2+YQzYO3XTEe0BnnNf4hk07jB/ra+vl2j7SRuwX/TV/jD9MX5ZeNgWyxcIQihNwvhDIqTNh4gjz1Y7yf9y1hvjVEsjHhzz6hrk+qIv1Wp++9XLtiT19i/3yqyiMxTwH7cuulDu4tXYEIYnHV9ghHw6fF7Dh/va3v9WVxHyKhzx8edEy5I1hrp3NCW9ybZ5YR2yDsHnpC6sFfcPZV8Lk8/tYXKfrI5AC6eNTV4l2K0WR8gKEPVssZmQI6koDEZmx8XWEDzNzx9WAOmMbhGmbPtgXwvSdvuIQjunEx77VDPnnIgRSIBdBcnEE34TVQT6IiJOICKEl45VXXjmKATJGkZEXN4Wg5rEM5WJ99IH/JsQpWvKySuC7rfKVo9YXx1QL55+1COSXFdfCciGSWRcSQii3JmydCN9zzz3DO9/5zuEtb3lL3U49/fTTw89//vPhW9/61nDu3LkLlTQh6oSokrVJvugSovOhH5vcddddN9x2223Du971ruE1r3lN/Z+QJ554ovbnq1/9au2f/+mIwBBOHNOmejO+TGQFhPx0MIivACqrx+qDH/zgnpckFOKObzUppK9vEfnmN7+5uuaaay56x1Qh+vgSB8LbsDdPLGcZ+nL11VevvvGNb3R/NIcXOnzoQx/a05eyomxt23Z23E9xTCVAmflXX/jCF9DA6MpMXMPtm0QQzfnz51evfe1rx9fs0A512F6Zycewca0f88SyvLqHun/zm9/UF1nTns6+GKf/0EMPje8Aa9vJ64062Jiw1XhLATWSsGw76rhdNcp2ql5Dzq985SuVg2V7VX2JJzHX+b/+9a/Hl9BFgq9bEdbh2eazDvpH3ducfbTPjME6HJtjdez0I2Kyrl87FLfbApEUEELi6EsStjKPPvpo3TqxYrhqbCOn6eV3N/ZMNta/H5K1ZahzP85+s7owFsYUhWD9+I5bbPbTzwXm3W2BYFBn0kgODQ1JHnnkkVV5z9TIx3YLMyasCZQb4/qrTtdee+0okkhG29nkr8tLXfxSFHVvc64g9pn8jIUxtQKIk4SYbOrXDsXvtkDYwkQyuKXBh0Bf/vKXRw6Wg7cahnRTyElmiXnnnXfW+qj3oOSyT9QV664XnT/0VaE4BrIzNsYYx2zfwOQwfbWeBfi7LZA4i8ZtB7Op4pDkkMqwe3ritjkIyg2yZGFV2A/5yOtKQh3UNVWg9M2+2nfiDDNGxuq2SgxoJ2Jj33fNv3ACVka+i66Qpx68lT36+KtNhMsWpJ5zEMYVTo1nB2U23nPw18ONcoXcQ3kcO2ajPHE40nuuiOOiMxDqojxlSd/mCvn3nOVwjWNsH/3oR+tXUT7ykY/UuCK86pMHbHbd7fxJOifMEKVsKcavYpQnPVUcvAROMkFESU14P+Shjj/96U+ViBIakWwTB+QkD3lxlKW/1GW/asKWP/TVdhmDYepgjBx4MmbiSQcLMKGtdMUGBYSd/xRy1C3Fww8/XDh5YQvCj87gCmGqX8hW/Rg3RmwIULb8cu6IMW3xmYp7m5+67M+GJsfomM++G+fY3G4xdu9JpvZtB/ItXxxlphzJ6L7aZ//eoJeZ80DnHDBR4umP7Px/AEK+4Q1vGPugOOxLj2TmsQx5qUuSt23ZB/02vb0uq1ONMn+ek1ykh4siRkP2DDeXNAmGSBAB/dZXOIc954ik84kRBIZ0XP/gBz+o7fL1Donuj9hMwdG8lKUOylAnddMGbUF0rg/qqIMPq8mjeU4SNbBsgUCmuEooComJgA5zzgEhOZPAQbDoE/7zn/+8evOb3zwCrkDi0yL7ssk3r2XJR53UrWvbtk+mb/JdQdxmkS/PSfZoYs/FaMhNxppbPKRSIPSdaz+Iw0e5EMMzgv3MxhKT8jrJ9swzz6zuuOOOiqmrFn2I/ZmKZyxjXdRNGzjbtA/46/oW0w276nEtBoTznKRqY9kCcYsFEZ2JWUX4KI5ILsPuySHKNhfzSjD897///VUcklthKtSp4qCcZQxbJ23ENu1r7JNxm3zzOnbyGc5zkkKcqYaaa752W8U42FbhIAdkYNWQFFNn3lrB//94P2Cdt9xyS8XV30cXOwkexWLaOj/ms6z5rJu2JDn+Qe5FHHPEwjrByjb112Fq2sL8ZQvEm1pmXLYmkIwnNThn3lYYUSw144Q/1sF9AYRl5ZLQ3mRLHGd/t0rGr/PNYxnzWCdt0BZtek9iXyZ0u2ZRFFxEoXAtRmBGW/THvoitfVqov2yBaDSJdNTnHJGMf/nLX1a33377ntlWMjnjus2T+Pav55vXstZl3Zalbfqgi30zrvUVBPGuGMblOUnVxvwFAlGcrVvfexDiXTkkQEuWTdcSR7/NRzzbmigOySx5j9OPbdGHuN1b11fiNo2lze+1mLmSMJ6ILdcR+1a8xzn+Y6573gJhdo3bGcB6+ctfvmcWZytQ/i+73mNADD4Y3EeckmCKD/koR3lJxqzNN2xpm9ndGf6YDbdnjLFd+uJKEsd6kHuTOFbqYlUCy3Z7FTFHKNjEle9S4nAMbc1bIM5iAOMMJkjMrKRvOueYIgjyeKbgLKpPGqR773vfW8nQEqK9tl9H6bdtcM2HPkVB2Gd9x8QYpri4XYvnJHH1am0QbXOUY77Edc1bIILlks5MGo32pS99abT/un96GhM3BCRUTJYsnEHcdddddSa3TciJUP0qi/07Tp+2aFOx2Bf6dhTnJI4XDCKGYOu4aNOVU1uYNnN//gLBMJIDomige++9t/LarRAXzqrR6DVT508s71MdfM85JIB94FqymHacfmwr9oE2j+KcRKzEDqjEBIxpB8xdwelD7NNxjv0S1D1/gQiSBuL61a9+dd2HswJg4Pjo1lVhP/cgkENS4HvOQVvsvyMh3FrEOPt41L5t2Cb1ExfvCQ5zTiJGYhaxJI57HbB2XNEGxs3cn79AIAezFsbhw3Lv6sFs5+NKjRxnQMJTnLPounMOCQAxJWp7E2ue4/Bti7YVjO2AB/GHOSdxYgAnMRRT4sAazMUfW4iD/ZixP2+BtFsKDfHTn/60rhpuC5wJo7FjGEOvcwqDNGbL+CiXtiQFvm23JDX+OP3Y5ro+0fZBzkkiRobFEmwJg/W6sW2yzbq8pzhu3gIBWGdQwhL1ySefHPneisRtAhmcEfXHQiEAMagjisMb4VNs2JG0sa/bzknWYYIInCiiOIQIrCP2rU3mgFGnj/MWiEs5s5VCIY7ZPj7KjEbWsM6IXBvmKU0rFuo66XOOjgFHIfTysMK4ysRzErFgzD6hEouIi/ni5EIcGIOPdsAGrhzG9fo1g7R5C6QF2BWkvDy62hSDRoMjFPfPhL1uRUFh0lg5TvKcox3ffq8lq+W45uM5CWNsHViAkfiQ7rV5wdRVBaypX+xtayH+vAUiAeJsxSz2ta99rc5sGFRDS4YoGA0OKTS4W7LnnnvuVJxzHJZovXMSxohzzGCwbrIQsxZLVg+wdvWmr9pC2xy2/ydcft4CcdbC9/wDQNlr45j5NLjfdiVeg5sHH2c8eeM9B3VGg7tdOWHjTd5e2c84BnESF8cODq6yERPC5nWVIS7iFM9DtI1tz9Sft0AA3RmLsEbhHODxxx/HfiPp60X5o2C8xifOexZmUx6LWu9JnnMcllQK2bFQH3GekxDPWF1BwGATPhEvxQTG1iX2rU0OO4YTLj9vgWAUPhjd2dGvebztbW9bPfvss9WuGlQiKAq2DJEQEOTWW28d64rGoQ2JFrcUMc9pDNtX+q5gYj/BjTE7QWzCRuzEEmzBmLrEnLpoQ7vEdmYanr9ABF7DcK1o+L9t99lxBvQrIzHO/yGnrHVoaOOIX0cy+3Ba/djnOCbHhR//xz3isg4rMCX/OszFwLq9nqk/b4FsAx0DvulNb1o99thj1ebuoZkFXT1YQcpPp61uuOGGcU9ffkJ5DG9rY+7pcaxgABZgwgeMXDHEDizBNIpu7hhs6v/if6OwzGL19Z3lsGx4+9vfPrzvfe8b3vrWt47vtv3lL385lJ9LG8ppcMFoGMq/stbXcRZijO/srQkL/VNIXl8zWrZGQ9kmDeUspI70pptuGsoKMbzxjW+sryQFj7Nnzw7f/va3hzNnztT3GIvtQqGpw1q8QBhl2YOPP4VcZsvx98OjYTE2ZCmz5U7+uGW5PxnHXlaOte8NjthFTCOOSwsv/uXVGhLy8yn76WpDVhREATFwZf81vtSZ2RJH/qU7x+iY46oANlyDFQ7sxLE8Bt6Jl1vvxAqCcZ0hCbOdgBD6xEVHPB9Wk11wYAMeiiSOWYz0SYtYxrxLDC9+BXEGZNuAYwZktcBBCIyN8XH45CfePDVh4X8YK2Nm7BELhcPwyeNqA5auwAuHZlj8CoLR15EdA5fn+tW+cUYkP06h1IuF/0EUYqQfMYlYRSg2YRvzzD28+BUEg2NIDK5jJlQcxCkKZ0jKuLpYZqm+q4TCEAMxYdxgZTzXlNkFcTDWxa8gDDJdInBQBBa/ghwUmCyXCIBACiR5kAh0EEiBdMDJpEQgBZIcSAQ6CKRAOuBkUiKQAkkOJAIdBFIgHXAyKRFIgSQHEoEOAimQDjiZlAikQJIDiUAHgRRIB5xMSgRSIMmBRKCDQAqkA04mJQIpkORAItBBIAXSASeTEoEUSHIgEeggkALpgJNJiUAKJDmQCHQQSIF0wMmkRCAFkhxIBDoIpEA64GRSIpACSQ4kAh0EUiAdcDIpEUiBJAcSgQ4CKZAOOJmUCKRAkgOJQAeBFEgHnExKBFIgyYFEoINACqQDTiYlAimQ5EAi0EEgBdIBJ5MSgRRIciAR6CCQAumAk0mJQAokOZAIdBBIgXTAyaREIAWSHEgEOgikQDrgZFIikAJJDiQCHQRSIB1wMikRSIEkBxKBDgIpkA44mZQIpECSA4lAB4EUSAecTEoEUiDJgUSgg0AKpANOJiUCKZDkQCLQQSAF0gEnkxKB/wJxSCUG4f7kpAAAAABJRU5ErkJggg=='
         sg.set_global_icon(self.pax_icon_base_64)
         self.window = sg.Window(gui_title, self.layout, icon=self.pax_icon_base_64, finalize=True, resizable=True)
+        fm.set_async(ASYNC_WRITES)
+        # Serial side and timers reach the window through the bridge, with or without ASYNC_COMMS
+        serial_async.get_acquisition().bridge.window = self.window
 
         # Initialize LEDs
         SetLED(self.window, 'gui_status_comms','','red')
@@ -233,57 +249,46 @@ class GUI(SerialPort):
 
         self.initialize_flag = False
 
-        self.heater_on_time = 10.0      # Float value in seconds for heating time
-        self.heater_off_time = 10.0     # Float value in seconds for downtime between puffs
-        self.num_puffs = 10             # Number of puffs desired
-        self.puff_counter = 0           # Puff counter
         self.test_file_name = ''        # Desired file name
-        self.test_flag = False          # Main flag for indicating test 
-        self.test_mode_start = 0        # Value for indicating test started
-        self.test_time = 0
+        self.device.on_puff = self.show_puff_count
+        self.device.on_test_end = self.finish_test
 
     def update_param(self, param, val):
         self.window[param].Update(value=val)
 
-    def parse_line(self, line):
-        cp(line)
+    def rx_lines(self, lines):
+        # Complete lines of one read, from thread_comms or the asyncio core
+        for line in lines:
+            self.parse_line(line)
+
+    def parse_line(self, raw):
+        # raw: line as received (bytes), logged as is. Only the console gets it as text.
+        # Runs on the serial side: the lines the device acts on go to the GUI thread.
+        self.console(raw.decode(errors='replace'))
         if self.log_stat == 1:
-            fm.write_log(line)
-            now = time.time()
-
-            if '??' in line:
-                self.resend_msg()
-
-            if self.send_command_flag:
-                if (now - self.msg_time) > 0.5:
-                    self.send_command_flag = False
-                    if self.test_mode_start == 1:
-                        self.test_mode_start = 2
-                        self.send_msg('heater stream 1')
-                    elif self.test_mode_start == 2:
-                        self.test_mode_start = 0
-                        self.puff_counter += 1
-                        self.update_param('gui_test_puff_count', self.puff_counter)
-                        self.send_msg('heater ok2vape ' + str(int(self.heater_on_time * 1000)))
-
-            if self.test_flag:
-                if (now - self.test_time) > (self.heater_on_time + self.heater_off_time + 1):
-                    if self.puff_counter >= self.num_puffs:
-                        self.end_test()
-                    else:
-                        self.test_time = now
-                        self.puff_counter += 1
-                        self.update_param('gui_test_puff_count', self.puff_counter)
-                        self.send_msg('heater ok2vape ' + str(int(self.heater_on_time * 1000)))
+            fm.write_log(raw)
+            if k5r_device.COMMAND_ERROR in raw:
+                serial_async.get_acquisition().post_call(self.device.parse_line, raw)
 
-            # K3 ONLY!
-            if self.k3_fire_flag:
-                if (now - self.start) > 0.1:
-                    self.start = now
-                    self.ser.write('f'.encode())
+    def show_puff_count(self, count):
+        self.update_param('gui_test_puff_count', count)
+
+    def set_log_format(self):
+        # Data rows as the plot config describes them, counted per segment when the log rotates
+        try:
+            f = open(self.config_file_path, 'r')
+            num_fields = len(json.load(f)['DATA_HEADERS'])
+            f.close()
+        except (OSError, ValueError, KeyError):
+            num_fields = None
+        if plotter.dvc_config == "K3":
+            fm.set_row_format(num_fields, '', ';', True, None)
+        else:
+            fm.set_row_format(num_fields, '$,', ',')
 
     def enable_logging(self, enable):
         if enable:
+            self.set_log_format()
             logfile = fm.create_log_file()
             cp('New logfile created: %s' % logfile)
             self.log_stat = 1
@@ -293,33 +298,23 @@ class GUI(SerialPort):
             self.log_stat = 0
 
     def start_test(self, e_val):
-        self.heater_on_time = float(e_val['gui_test_heater_on_time']) * 0.001
-        self.heater_off_time = float(e_val['gui_test_heater_off_time']) * 0.001
-        self.num_puffs = int(e_val['gui_test_number_puffs'])
         self.test_file_name = e_val['gui_test_file_name']
-        self.puff_counter = 0
-        self.update_param('gui_test_puff_count', self.puff_counter)
         current_logfile = fm.close_log_file()
         cp('Closing logfile: %s' % current_logfile)
         current_logfile = fm.create_log_file(self.test_file_name)
         cp('New logfile created: %s' % current_logfile)
         self.log_stat = 1
-        self.test_flag = True
-        self.test_mode_start = 2
-        self.send_command_flag = True
-        self.test_time = time.time()
+        self.device.start_test(float(e_val['gui_test_heater_on_time']) * 0.001, float(e_val['gui_test_heater_off_time']) * 0.001, int(e_val['gui_test_number_puffs']))
         # self.send_msg('psense enable 0')
 
     def end_test(self):
-        self.send_msg('heater stream 0')
-        sleep(1)
-        self.puff_counter = 0
-        self.update_param('gui_test_puff_count', self.puff_counter)
+        # The device stops the stream, the log is closed by finish_test() once it has
+        self.device.end_test()
+
+    def finish_test(self):
         current_logfile = fm.close_log_file()
         cp('Closing logfile: %s' % current_logfile)
         self.log_stat = 0
-        self.test_flag = False
-        self.test_mode_start = 0
         try:
             old_file = current_logfile.strip(".log")
             new_num = int(old_file.split('_')[-1]) + 1
@@ -328,14 +323,36 @@ class GUI(SerialPort):
         except:
             print("File name not incremented!")
 
+    def get_plot_range(self):
+        # Optional (start, end) to plot, in seconds from the start of the log or HH:MM:SS clock time
+        try:
+            start = log_reader.parse_time(self.plot_file_path, self.e_val['gui_process_range_start'])
+            end = log_reader.parse_time(self.plot_file_path, self.e_val['gui_process_range_end'])
+        except ValueError:
+            cp('Plot range must be in seconds or HH:MM:SS, plotting whole file!')
+            return None
+        if start is None and end is None:
+            return None
+        return (start, end)
+
+    def take_bridge(self):
+        # Console text first, then the calls posted for the GUI thread (sequencer, timeouts)
+        items = serial_async.get_acquisition().bridge.take()
+        console = [value for kind, value in items if kind == 'console']
+        if console:
+            cp('\n'.join(console))
+        for kind, value in items:
+            if kind == serial_async.CALL:
+                value.run()
+
     def event_loop(self):
         # Event Loop to process "events"
         while True:
-            self.event, self.e_val = self.window.read()
+            self.event, self.e_val = self.window.read(timeout=LOG_STATS_INTERVAL)
             # cp(self.event, self.e_val)
             # TIMEOUT
             if self.event == '__TIMEOUT__':
-                pass
+                self.window['gui_log_stats'].update(fm.status_text())
 
             # SERIAL COMMS
             elif self.event == 'gui_comms_port_list':
@@ -368,7 +385,7 @@ class GUI(SerialPort):
                         cp('Configuration file: %s' % self.config_file_path.split('/')[-1])
                         cp('PLOTTING!')
                         plotter.load_config_file(self.config_file_path)
-                        if plotter.load_data_file(self.plot_file_path):
+                        if plotter.load_data_file(self.plot_file_path, self.get_plot_range(), fm.is_writing(self.plot_file_path)):
                             plotter.run()
                         else:
                             cp('Bad data import of file!')
@@ -392,12 +409,10 @@ class GUI(SerialPort):
                     self.send_msg('psense enable 0')
             elif self.event == 'gui_button_heater_k3_on':
                 if self.is_port_open():
-                    self.k3_fire_flag = True
-                    self.start = time.time()
-                    self.ser.write('f'.encode())
+                    self.device.fire(True)
             elif self.event == 'gui_button_heater_k3_off':
                 if self.is_port_open():
-                    self.k3_fire_flag = False
+                    self.device.fire(False)
             elif self.event == 'gui_ckbox_heater_temp_send':
                 self.tx_check_box_dict['temp'][0] ^= 1
                 if self.tx_check_box_dict['temp'][0] == 1:
@@ -416,6 +431,10 @@ class GUI(SerialPort):
                 if self.is_port_open():
                     self.end_test()
 
+            # SERIAL SIDE (asyncio core)
+            elif self.event == serial_async.BRIDGE_EVENT:
+                self.take_bridge()
+
             # ENDING
             elif self.event == sg.WIN_CLOSED or self.event == 'gui_button_exit':
                 self.close_port()
@@ -424,24 +443,26 @@ class GUI(SerialPort):
             sleep(0.1)
                 
         self.window.close()
+        fm.stop_writer()        # Whatever is still queued reaches the log
 
 def thread_comms(thread_name, period, gui):
     while True:
         if gui.port_open:
             try:
-                while gui.ser.in_waiting:
-                    line = gui.RX()
-                    gui.parse_line(line)
+                # RX() wakes as soon as bytes arrive, period only applies while the port is closed
+                gui.rx_lines(gui.RX())
             except:
-                pass
-        sleep(period * 0.001)
+                sleep(period * 0.001)
+        else:
+            sleep(period * 0.001)
         # window.write_event_value(thread_name, f'count = {i}')
 
 
 
 gui = GUI(PROJECT_TITLE, GUI_LAYOUT)
 
-threading.Thread(target=thread_comms, args=('gui_thread_comms', 10, gui), daemon=True).start()
+if not ASYNC_COMMS:
+    threading.Thread(target=thread_comms, args=('gui_thread_comms', 10, gui), daemon=True).start()
 
 # Run main event loop
 gui.event_loop()
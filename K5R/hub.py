@@ -0,0 +1,373 @@
+"""
+Multi-device hub for K5R bench testing.
+One window serves up to HUB_MAX_DEVICES ports at once instead of one copy of
+gui.py per device. Every port is a DEVICE with its own line handler and its own
+log ('<log name>-<port>.log', a named log of the shared session), all served by
+the one asyncio loop of serial_async, so another device is another stream on
+that loop, not another process. The named logs are host stamped from the same
+perf_counter_ns() clock, so rows of different devices line up in time; the main
+log of the session records what the hub did (ports opened, commands sent).
+The device table shows per device receive rate, line count, dropped lines, puff
+count and the last line, the status line the totals of the whole session. CLI
+commands go to every open device; the console echoes one device at a time.
+Every device runs its own puff test (k5r_device.K5R_DEVICE, the same sequencer
+as gui.py): started together, each one times its puffs and commands on its own.
+"""
+
+import sys, glob
+import os
+import time
+import serial
+import PySimpleGUI as sg
+
+from file_manager import file_manager as fm
+import serial_reader
+import serial_async
+import k5r_device
+
+PROJECT_TITLE = 'K5R HUB'
+PROJECT_COLOR_THEME = 'DarkPurple1'
+
+GUI_TEXTSIZE_TITLE = 20
+GUI_TEXTSIZE_FRAME = 14
+GUI_TEXTSIZE_SUBTEXT = 12
+
+GUI_TEXTFONT_ALL = 'default'
+
+GUI_FONT_MAIN = (GUI_TEXTFONT_ALL, GUI_TEXTSIZE_SUBTEXT)
+GUI_FONT_FRAME = (GUI_TEXTFONT_ALL, GUI_TEXTSIZE_FRAME)
+GUI_FONT_TITLE = (GUI_TEXTFONT_ALL, GUI_TEXTSIZE_TITLE)
+
+GUI_BORDERWIDTH_FRAME = 10
+
+HUB_MAX_DEVICES = 10        # Ports served at once
+HUB_BAUD = 115200
+LOG_STATS_INTERVAL = 1000   # ms between updates of the device table and status line
+ECHO_NONE = 'NONE'          # Console echo off
+LAST_LINE_WIDTH = 48        # Characters of the last line shown in the device table
+
+cp = sg.cprint
+
+sg.theme(PROJECT_COLOR_THEME)
+
+# Global Functions
+def list_serial_ports():
+    if sys.platform.startswith('win'):
+        ports = ['COM%s' % (i + 1) for i in range(20)]
+    elif sys.platform.startswith('linux') or sys.platform.startswith('cygwin'):
+        # this excludes your current terminal "/dev/tty"
+        ports = glob.glob('/dev/tty[A-Za-z]*')
+    elif sys.platform.startswith('darwin'):
+        ports = glob.glob('/dev/tty.*')
+    else:
+        raise EnvironmentError('Unsupported platform')
+
+    result = []
+    for port in ports:
+        try:
+            s = serial.Serial(port)
+            s.close()
+            result.append(port)
+        except (OSError, serial.SerialException):
+            pass
+    return result
+
+FRAME_PORTS_LAYOUT = [
+    [sg.Listbox(list_serial_ports(), select_mode=sg.LISTBOX_SELECT_MODE_MULTIPLE, font=GUI_FONT_MAIN, size=(28,6), key='gui_hub_port_list')],
+    [sg.Button('OPEN', key='gui_button_hub_open'),sg.Button('CLOSE ALL', key='gui_button_hub_close'),sg.Button('REFRESH PORTS', key='gui_button_hub_refresh')],
+]
+
+FRAME_CONTROL_LAYOUT = [
+    [sg.Text('Log:',size=(8,1),font=GUI_FONT_MAIN),sg.Button('START', key='gui_button_hub_log_start'),sg.Button('STOP', key='gui_button_hub_log_stop'),sg.T('OFF',size=(8,1),font=GUI_FONT_MAIN,key='gui_text_hub_log_stat')],
+    [sg.Text('Stream:',size=(8,1),font=GUI_FONT_MAIN),sg.Button('ON', key='gui_button_hub_stream_on'),sg.Button('OFF', key='gui_button_hub_stream_off')],
+    [sg.Text('Psense:',size=(8,1),font=GUI_FONT_MAIN),sg.Button('ON', key='gui_button_hub_psense_on'),sg.Button('OFF', key='gui_button_hub_psense_off')],
+    [sg.Text('CLI:',size=(8,1),font=GUI_FONT_MAIN),sg.Input(key='gui_hub_cli',size=(20,1),font=GUI_FONT_MAIN),sg.Button('SEND ALL', key='gui_button_hub_send')],
+    [sg.Text('Test:',size=(8,1),font=GUI_FONT_MAIN),sg.Text('on ms',font=GUI_FONT_MAIN),sg.Input('10000',key='gui_hub_test_on_time',size=(7,1),font=GUI_FONT_MAIN,justification='right'),
+     sg.Text('off ms',font=GUI_FONT_MAIN),sg.Input('10000',key='gui_hub_test_off_time',size=(7,1),font=GUI_FONT_MAIN,justification='right'),
+     sg.Text('puffs',font=GUI_FONT_MAIN),sg.Input('10',key='gui_hub_test_puffs',size=(4,1),font=GUI_FONT_MAIN,justification='right')],
+    [sg.Text('',size=(8,1),font=GUI_FONT_MAIN),sg.Button('GO ALL', key='gui_button_hub_test_go'),sg.Button('HALT ALL', key='gui_button_hub_test_halt')],
+    [sg.Text('Echo:',size=(8,1),font=GUI_FONT_MAIN),sg.Combo([ECHO_NONE], default_value=ECHO_NONE, font=GUI_FONT_MAIN, size=20, readonly=True, enable_events=True, key='gui_hub_echo')],
+]
+
+FRAME_DEVICES_LAYOUT = [
+    [sg.Table([], headings=['PORT', 'STATE', 'LINES/S', 'LINES', 'DROPPED', 'PUFFS', 'LAST LINE'], col_widths=[12, 8, 8, 10, 8, 6, LAST_LINE_WIDTH],
+              auto_size_columns=False, justification='left', num_rows=HUB_MAX_DEVICES, font=GUI_FONT_MAIN, key='gui_hub_devices')],
+]
+
+FRAME_CONSOLE_LAYOUT = [
+    [sg.Multiline(key='gui_cons_output',font=GUI_FONT_MAIN,autoscroll=True,size=(100,10),reroute_cprint=True, write_only=True)],
+    [sg.Text('', key='gui_log_stats', font=GUI_FONT_MAIN, size=(100,1))],
+]
+
+GUI_LAYOUT = [
+    [sg.Text(PROJECT_TITLE, font=GUI_FONT_TITLE, key='gui_title')],
+    [sg.Frame('PORTS', FRAME_PORTS_LAYOUT, font=GUI_FONT_FRAME, border_width=GUI_BORDERWIDTH_FRAME, key='gui_frame_hub_ports'),sg.Frame('CLI CONTROL', FRAME_CONTROL_LAYOUT, font=GUI_FONT_FRAME, border_width=GUI_BORDERWIDTH_FRAME, key='gui_frame_hub_control')],
+    [sg.Frame('DEVICES', FRAME_DEVICES_LAYOUT, font=GUI_FONT_FRAME, border_width=GUI_BORDERWIDTH_FRAME, key='gui_frame_hub_devices')],
+    [sg.Frame('CONSOLE', FRAME_CONSOLE_LAYOUT, font=GUI_FONT_FRAME, border_width=GUI_BORDERWIDTH_FRAME, key='gui_frame_console')],
+    [sg.Button('EXIT', key='gui_button_exit')],
+]
+
+
+class DEVICE():
+    # One port of the hub. rx_lines() runs on the asyncio loop thread, everything else on the GUI thread.
+    def __init__(self, port, hub):
+        self.port = port
+        self.name = os.path.basename(port)      # Named log and table label
+        self.hub = hub
+        self.ser = None
+        self.stream = None
+        self.lines = 0
+        self.last_lines = 0         # self.lines at the previous table update
+        self.rate = 0.0
+        self.last_line = ''
+        self.k5r = k5r_device.K5R_DEVICE(self.write, on_test_end=self.test_done)     # CLI protocol and puff test
+
+    def open(self, acq):
+        self.ser = serial.Serial(port=self.port, baudrate=HUB_BAUD, bytesize=serial.EIGHTBITS, parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE, timeout=serial_reader.RX_TIMEOUT)
+        self.ser.reset_input_buffer()
+        self.stream = acq.open(self.ser, self.rx_lines)
+
+    def close(self, acq):
+        self.k5r.stop()
+        if self.stream is not None:
+            acq.close(self.stream)
+            self.stream = None
+        if self.ser is not None:
+            self.ser.close()
+
+    def state(self):
+        if self.stream is None:
+            return 'CLOSED'
+        if self.stream.pump.done():
+            return 'LOST'       # Read failed, port unplugged
+        return 'OPEN'
+
+    def rx_lines(self, lines):
+        # One stamp per burst: every line of it arrived by now, the same clock as the other devices
+        t_host = time.perf_counter_ns()
+        self.lines += len(lines)
+        if self.hub.log_stat:
+            for line in lines:
+                fm.write_named_log(self.name, line, t_host)
+        for line in lines:
+            if k5r_device.COMMAND_ERROR in line:
+                self.hub.acq.post_call(self.k5r.parse_line, line)      # The sequencer is the GUI thread's
+        self.last_line = lines[-1].decode(errors='replace')
+        if self.hub.echo == self.name:
+            self.hub.acq.post('console', '\n'.join('%s: %s' % (self.name, line.decode(errors='replace')) for line in lines))
+
+    def write(self, data):
+        # Any thread, the write itself happens on the loop
+        if self.stream is not None:
+            self.hub.acq.call(self.stream.write, data)
+
+    def send(self, msg):
+        self.k5r.send(msg)
+
+    def test_done(self):
+        cp('%s: test done, %d puffs' % (self.name, self.k5r.num_puffs))
+        self.hub.hub_log('test done %s' % self.port)
+
+
+class HUB():
+    def __init__(self, gui_title, layout):
+        self.event = ''
+        self.e_val = ''
+        self.acq = serial_async.get_acquisition()
+        self.devices = {}           # name: DEVICE
+        self.log_stat = 0
+        self.echo = ECHO_NONE
+        self.last_update = time.monotonic()
+        self.window = sg.Window(gui_title, layout, finalize=True, resizable=True)
+        self.acq.bridge.window = self.window
+
+    def hub_log(self, text):
+        # Hub events go to the main log of the session, in line with the device logs
+        if self.log_stat:
+            fm.write_log(text)
+
+    def open_devices(self, ports):
+        for port in ports:
+            name = os.path.basename(port)
+            if name in self.devices and self.devices[name].stream is not None:
+                cp("PORT {} already open!".format(port))
+                continue
+            if len([d for d in self.devices.values() if d.stream is not None]) >= HUB_MAX_DEVICES:
+                cp("Hub is full, %d devices at most!" % HUB_MAX_DEVICES)
+                break
+            device = DEVICE(port, self)
+            cp("OPENING PORT: {}".format(port))
+            try:
+                device.open(self.acq)
+            except Exception as e:
+                cp("Serial Port %s is no longer available. Check connections!" % port)
+                continue
+            self.devices[name] = device
+            if self.log_stat:
+                cp('New logfile created: %s' % fm.open_named_log(name))
+            self.hub_log('open %s' % port)
+            cp("PORT {} now open!".format(port))
+        self.update_echo_list()
+
+    def close_devices(self):
+        for device in self.devices.values():
+            if device.stream is not None:
+                cp("CLOSING PORT: {}".format(device.port))
+                device.close(self.acq)
+                self.hub_log('close %s' % device.port)
+            fm.close_named_log(device.name)
+        self.devices = {}
+        self.update_echo_list()
+
+    def send_all(self, msg):
+        sent = 0
+        for device in self.devices.values():
+            if device.state() == 'OPEN':
+                device.send(msg)
+                sent += 1
+        if sent:
+            self.hub_log('send %s' % msg)
+            cp('Sent "%s" to %d devices' % (msg, sent))
+        else:
+            cp('No serial port actively open! Connect to a serial port and resend.')
+
+    def start_tests(self):
+        # Same test on every open device, each one sequenced on its own
+        try:
+            on_time = float(self.e_val['gui_hub_test_on_time']) * 0.001
+            off_time = float(self.e_val['gui_hub_test_off_time']) * 0.001
+            num_puffs = int(self.e_val['gui_hub_test_puffs'])
+        except ValueError:
+            cp('Test on/off time (ms) and puffs must be numbers!')
+            return
+        devices = [d for d in self.devices.values() if d.state() == 'OPEN']
+        if not devices:
+            cp('No serial port actively open! Connect to a serial port and resend.')
+            return
+        for device in devices:
+            device.k5r.start_test(on_time, off_time, num_puffs)
+        self.hub_log('test %d %d %d' % (on_time * 1000, off_time * 1000, num_puffs))
+        cp('Test started on %d devices' % len(devices))
+
+    def end_tests(self):
+        for device in self.devices.values():
+            if device.k5r.test_flag and device.state() == 'OPEN':
+                device.k5r.end_test()
+
+    def enable_logging(self, enable):
+        if enable and not self.log_stat:
+            logfile = fm.create_log_file()
+            cp('New logfile created: %s' % logfile)
+            for name in self.devices:
+                cp('New logfile created: %s' % fm.open_named_log(name))
+            self.log_stat = 1
+            self.hub_log('devices %s' % ' '.join(d.port for d in self.devices.values()))
+        elif not enable and self.log_stat:
+            self.log_stat = 0
+            logfile = fm.close_log_file()
+            cp('Closing logfile: %s' % logfile)
+        self.update_param('gui_text_hub_log_stat', 'ON' if self.log_stat else 'OFF')
+
+    def update_param(self, param, val):
+        self.window[param].Update(value=val)
+
+    def update_echo_list(self):
+        names = [ECHO_NONE] + list(self.devices)
+        if self.echo not in names:
+            self.echo = ECHO_NONE
+        self.window['gui_hub_echo'].Update(values=names, value=self.echo)
+
+    def update_devices(self):
+        now = time.monotonic()
+        elapsed = max(now - self.last_update, 1e-6)
+        self.last_update = now
+        rows = []
+        total_rate = 0.0
+        for device in self.devices.values():
+            lines = device.lines
+            device.rate = (lines - device.last_lines) / elapsed
+            device.last_lines = lines
+            total_rate += device.rate
+            named = fm.named_logs.get(device.name)
+            dropped = named.dropped_lines if named is not None else 0
+            rows.append([device.name, device.state(), '%d' % device.rate, lines, dropped, device.k5r.puff_counter, device.last_line[:LAST_LINE_WIDTH]])
+        self.window['gui_hub_devices'].update(values=rows)
+        self.window['gui_log_stats'].update('%d devices  rx %d lines/s  |  log %s' % (len(rows), total_rate, fm.status_text()))
+
+    def take_bridge(self):
+        # Console echo first, then the calls the devices posted for the GUI thread
+        items = self.acq.bridge.take()
+        console = [value for kind, value in items if kind == 'console']
+        if console:
+            cp('\n'.join(console))
+        for kind, value in items:
+            if kind == serial_async.CALL:
+                value.run()
+
+    def event_loop(self):
+        while True:
+            self.event, self.e_val = self.window.read(timeout=LOG_STATS_INTERVAL)
+            # TIMEOUT
+            if self.event == '__TIMEOUT__':
+                self.update_devices()
+
+            # SERIAL COMMS
+            elif self.event == 'gui_button_hub_open':
+                ports = self.e_val['gui_hub_port_list']
+                if ports:
+                    self.open_devices(ports)
+                else:
+                    cp("No PORT selected from menu!")
+            elif self.event == 'gui_button_hub_close':
+                self.close_devices()
+            elif self.event == 'gui_button_hub_refresh':
+                cp("Refreshing Serial Ports!")
+                self.window['gui_hub_port_list'].Update(values=list_serial_ports())
+
+            # LOGGING
+            elif self.event == 'gui_button_hub_log_start':
+                self.enable_logging(1)
+            elif self.event == 'gui_button_hub_log_stop':
+                self.enable_logging(0)
+
+            # CLI CONTROL
+            elif self.event == 'gui_button_hub_stream_on':
+                self.send_all('heater stream 1')
+            elif self.event == 'gui_button_hub_stream_off':
+                self.send_all('heater stream 0')
+            elif self.event == 'gui_button_hub_psense_on':
+                self.send_all('psense enable 1')
+            elif self.event == 'gui_button_hub_psense_off':
+                self.send_all('psense enable 0')
+            elif self.event == 'gui_button_hub_send':
+                if self.e_val['gui_hub_cli']:
+                    self.send_all(self.e_val['gui_hub_cli'])
+            elif self.event == 'gui_button_hub_test_go':
+                self.start_tests()
+            elif self.event == 'gui_button_hub_test_halt':
+                self.end_tests()
+            elif self.event == 'gui_hub_echo':
+                self.echo = self.e_val['gui_hub_echo']
+
+            # SERIAL SIDE (asyncio core)
+            elif self.event == serial_async.BRIDGE_EVENT:
+                self.take_bridge()
+
+            # ENDING
+            # CLOSE WINDOW
+            elif self.event == sg.WIN_CLOSED or self.event == 'gui_button_exit':
+                # The window may be gone, no table or console updates from here
+                for device in self.devices.values():
+                    device.close(self.acq)
+                if self.log_stat:
+                    self.log_stat = 0
+                    fm.close_log_file()
+                break
+
+        self.window.close()
+
+
+hub = HUB(PROJECT_TITLE, GUI_LAYOUT)
+
+# Run main event loop
+hub.event_loop()
@@ -0,0 +1,150 @@
+"""
+CLI protocol and puff test of one K5R, shared by gui.py (one device) and hub.py
+(one per port).
+A command that the device answers with '??' is sent again. A test is the
+sequence the GUI used to run from its line handler: after the command timeout
+the first 'heater ok2vape <on time>' goes out, then one every heater on + off
+time (+1 sec) until the number of puffs is reached, then 'heater stream 0' and,
+END_TEST_DELAY later, the end of the test.
+The serial side (asyncio loop or thread_comms) touches none of it: it posts the
+lines holding COMMAND_ERROR to the GUI thread for parse_line(). Everything runs
+on the GUI thread, timed by the asyncio loop (serial_async call_later), so a
+device that stops talking still times out and nothing ever sleeps on the loop
+every port shares.
+"""
+
+import asyncio
+import serial_async
+
+MSG_TIMEOUT = 0.5           # sec after a command before the test moves on to its next step
+END_TEST_DELAY = 1.0        # sec the stream gets to stop before the test ends
+K3_FIRE_PERIOD = 0.1        # sec between 'f' commands while K3 FIRE is on
+PUFF_MARGIN = 1.0           # sec added to heater on + off time between puffs
+COMMAND_ERROR = b'??'       # In the reply to a command the device didn't take
+
+
+class K5R_DEVICE():
+    def __init__(self, write, on_puff=None, on_test_end=None):
+        self.write = write                  # write(bytes) to the port, from any thread
+        self.on_puff = on_puff              # on_puff(puff count), GUI thread
+        self.on_test_end = on_test_end      # on_test_end(), GUI thread, once the test is over
+        self.acq = serial_async.get_acquisition()
+        self.last_command = b''
+        self.msg_timeout = MSG_TIMEOUT
+        self.command_timer = None           # serial_async.GUI_CALL of the pending command_timeout()
+
+        self.heater_on_time = 10.0          # Float value in seconds for heating time
+        self.heater_off_time = 10.0         # Float value in seconds for downtime between puffs
+        self.num_puffs = 10                 # Number of puffs desired
+        self.puff_counter = 0               # Puff counter
+        self.test_flag = False              # Main flag for indicating test
+        self.test_mode_start = 0            # Value for indicating test started
+        self.puff_timer = None              # GUI_CALL of the next puff
+        self.end_timer = None               # GUI_CALL ending the test
+        self.k3_fire_flag = False
+
+    def parse_line(self, raw):
+        # GUI thread, raw: a received line (bytes) the serial side posted
+        if COMMAND_ERROR in raw:
+            self.resend()
+
+    def send(self, msg):
+        # command_timeout() follows msg_timeout later unless another command is sent first
+        self.last_command = (msg + '\r').encode()
+        self.write(self.last_command)
+        self.arm_command_timeout()
+
+    def resend(self):
+        if self.last_command:
+            self.write(self.last_command)
+            self.arm_command_timeout()
+
+    def arm_command_timeout(self):
+        if self.command_timer is not None:
+            self.command_timer.cancel()
+        self.command_timer = self.acq.call_later(self.msg_timeout, self.command_timeout)
+
+    def command_timeout(self):
+        # Next step of the test start
+        self.command_timer = None
+        if self.test_mode_start == 1:
+            self.test_mode_start = 2
+            self.send('heater stream 1')
+        elif self.test_mode_start == 2:
+            self.test_mode_start = 0
+            self.puff()
+
+    def puff(self):
+        self.puff_counter += 1
+        if self.on_puff is not None:
+            self.on_puff(self.puff_counter)
+        self.send('heater ok2vape ' + str(int(self.heater_on_time * 1000)))
+
+    def start_test(self, heater_on_time, heater_off_time, num_puffs):
+        # Times in seconds. The first puff goes out once the command timeout passes.
+        self.stop()
+        self.heater_on_time = heater_on_time
+        self.heater_off_time = heater_off_time
+        self.num_puffs = num_puffs
+        self.puff_counter = 0
+        if self.on_puff is not None:
+            self.on_puff(self.puff_counter)
+        self.test_flag = True
+        self.test_mode_start = 2
+        self.arm_command_timeout()
+        self.puff_timer = self.acq.call_later(self.puff_period(), self.next_puff)
+
+    def puff_period(self):
+        return self.heater_on_time + self.heater_off_time + PUFF_MARGIN
+
+    def next_puff(self):
+        self.puff_timer = None
+        if not self.test_flag:
+            return
+        if self.puff_counter >= self.num_puffs:
+            self.end_test()
+            return
+        self.puff()
+        self.puff_timer = self.acq.call_later(self.puff_period(), self.next_puff)
+
+    def end_test(self):
+        # The device gets END_TEST_DELAY to stop streaming, then finish_test()
+        self.stop()
+        self.send('heater stream 0')
+        self.end_timer = self.acq.call_later(END_TEST_DELAY, self.finish_test)
+
+    def finish_test(self):
+        self.end_timer = None
+        self.puff_counter = 0
+        if self.on_puff is not None:
+            self.on_puff(self.puff_counter)
+        if self.on_test_end is not None:
+            self.on_test_end()
+
+    def stop(self):
+        # Drops the test and every pending timer (port closing, new test)
+        for timer in (self.puff_timer, self.command_timer, self.end_timer):
+            if timer is not None:
+                timer.cancel()
+        self.puff_timer = None
+        self.command_timer = None
+        self.end_timer = None
+        self.test_flag = False
+        self.test_mode_start = 0
+
+    def fire(self, enable):
+        # K3 ONLY! 'f' every K3_FIRE_PERIOD while enabled, written from the asyncio loop
+        if enable and not self.k3_fire_flag:
+            self.k3_fire_flag = True
+            self.acq.submit(self.k3_fire())
+        elif not enable:
+            self.k3_fire_flag = False
+
+    async def k3_fire(self):
+        while self.k3_fire_flag:
+            try:
+                self.write('f'.encode())
+            except Exception:
+                break
+            await asyncio.sleep(K3_FIRE_PERIOD)
+        self.k3_fire_flag = False
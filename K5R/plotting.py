@@ -5,6 +5,9 @@ import matplotlib.pyplot as plt
 import numpy as np
 matplotlib.use("TkAgg")
 
+import log_reader
+
+# Fallback when the log format can't be sniffed from the data file
 # DVC_CONFIG = "K3"
 DVC_CONFIG = "K5R"
 
@@ -21,6 +24,10 @@ class PLOTTER:
 		self.headers = []
 		self.num_data_headers = 0
 		self.extra_calcs_flag = False
+		self.used_headers = None
+		self.dtypes = None
+		self.t_start = None
+		self.dvc_config = DVC_CONFIG
 
 		self.r_targ = 0
 		self.r_base = 0
@@ -58,18 +65,51 @@ class PLOTTER:
 						self.headers[loc] = v
 						self.hlabels[loc] = self.config["HEADERS_LABELS"][k]
 
+				# Only the columns the plot windows (and their calculations) use are parsed
+				self.used_headers = log_reader.plot_columns(self.config, self.headers, self.num_data_headers, ['time_stamp'])
+				# Optional per-column types, e.g. "DATA_TYPES": {"2": "int8"}. Others stay float64.
+				self.dtypes = log_reader.plot_dtypes(self.config, self.headers, self.num_data_headers)
+
 			except:
 				print('Configuration file selected is not properly formated for JSON!')
 		else:
 			print('Configuration file must be JSON!')
 
-	def load_data_file(self, file):
+	def load_data_file(self, file, t_range=None, live=False):
 		rtn_val = True
-		if file.endswith('.log'):
-			f = open(file, 'r')
-			r_lines = f.readlines()
-			if len(r_lines) > 10:
-				df_data_lines = []
+		records = file.endswith(log_reader.RECORD_SUFFIX)
+		if file.endswith('.log') or file.endswith('.log' + log_reader.COMPRESSED_SUFFIX) or file.endswith(log_reader.SESSION_SUFFIX) or records:
+			if DVC_CONFIG == "K3":
+				dialect = log_reader.DIALECT_K3
+			else:
+				dialect = log_reader.DIALECT_K5R
+			if not records:
+				# K3 (';' rows) or K5R ('$,' rows), whichever the start of the file holds
+				dialect = log_reader.sniff_dialect(file, self.headers[:self.num_data_headers], dialect, [log_reader.DIALECT_K5R, log_reader.DIALECT_K3])
+			if dialect == log_reader.DIALECT_K3:
+				self.dvc_config = "K3"
+			else:
+				self.dvc_config = "K5R"
+			self.t_start = None
+			streaming = log_reader.log_size(file) > log_reader.STREAM_THRESHOLD_BYTES and t_range is None and not live and not records
+			if records:
+				# Binary record log: mapped straight into columns, nothing to parse
+				df = log_reader.load_record_log(file, self.used_headers, self.dtypes)
+				if len(df) == 0:
+					df = None
+			elif t_range is not None:
+				df = self.load_data_range(file, t_range, dialect)
+			elif live:
+				# Log still being written: only the rows added since the last plot are parsed
+				df = log_reader.tail_log(file, self.headers[:self.num_data_headers], dialect, usecols=self.used_headers)
+				if len(df) == 0:
+					df = None
+			elif streaming:
+				# Too large to hold at once: calcs and plot decimation run chunk by chunk
+				df = log_reader.stream_log(file, self.headers[:self.num_data_headers], self.run_chunk_calcs, dialect, usecols=self.used_headers)
+			else:
+				df = log_reader.load_log(file, self.headers[:self.num_data_headers], dialect, min_lines=10, usecols=self.used_headers, dtypes=self.dtypes)
+			if df is not None:
 				self.r_targ = 0
 				self.r_base = 0
 				self.t_targ = 0
@@ -78,32 +118,16 @@ class PLOTTER:
 				self.puff_counter = 0
 				self.puff_start_flag = False
 				self.puff_duration = []
-				for i in range(len(r_lines)):
-					if DVC_CONFIG == "K3":
-						temp_line = r_lines[i].split(";")
-						if (len(temp_line) == len(self.config["DATA_HEADERS"].keys()) + 1):
-							temp_line.pop(len(self.config["DATA_HEADERS"].keys())) 	# Remove ''
-							temp_list = [float(j) for j in temp_line]
-							df_data_lines.append(temp_list)
-					else:
-						temp_line = r_lines[i].split(",")
-						if temp_line[0] == '$' and (len(temp_line) == len(self.config["DATA_HEADERS"].keys()) + 1):
-							try:
-								temp_line.pop(0) 	# Remove '$'
-								temp_list = [float(j) for j in temp_line]
-								df_data_lines.append(temp_list)
-							except:
-								pass
-
 			else:
 				print('Data file is empty!')
 				rtn_val = False
-			f.close()
 			if rtn_val:
 				# try:
-				self.df = pd.DataFrame(df_data_lines, columns=self.headers[:len(self.config["DATA_HEADERS"].keys())])
-				self.df = self.df.dropna()
-				self.run_df_calcs()
+				if streaming:
+					self.df = df
+				else:
+					self.df = df.dropna()
+					self.run_df_calcs()
 				print(self.df)
 				# except:
 					# print('Bad pandas import of file!')
@@ -113,12 +137,38 @@ class PLOTTER:
 			rtn_val = False
 		return rtn_val
 
+	def load_data_range(self, file, t_range, dialect):
+		# t_range is (start, end) in x axis units: seconds from the first row, or sample number for K3.
+		# Either end may be None. Only the rows found through the offset index are parsed.
+		columns = self.headers[:self.num_data_headers]
+		if self.dvc_config == "K3":
+			index = log_reader.load_index(file, columns, dialect, time_column=None, t_from=t_range[0], t_to=t_range[1])
+			first, last = log_reader.find_rows(index, t_range[0], t_range[1])
+		else:
+			t_start = log_reader.start_time(file, columns, dialect)
+			if t_start is None:
+				return None
+			self.t_start = t_start
+			bounds = [None if t is None else self.t_start + t * 1e3 for t in t_range]
+			index = log_reader.load_index(file, columns, dialect, t_from=bounds[0], t_to=bounds[1])
+			first, last = log_reader.find_rows(index, bounds[0], bounds[1])
+		df = log_reader.load_rows(file, columns, index, first, last, dialect, usecols=self.used_headers, dtypes=self.dtypes)
+		df.index = np.arange(first, first + len(df))
+		return df
+
+	def run_chunk_calcs(self, df):
+		self.df = df
+		self.run_df_calcs()
+		return self.df
+
 	def run_df_calcs(self):
-		if DVC_CONFIG == "K3":
+		if self.dvc_config == "K3":
 			pass
 		else:
-			t_start  = self.df['time_stamp'][0]
-			self.df['time_stamp'] = (self.df['time_stamp'] - t_start) * 1e-3
+			# First row of the file, kept across chunks when streaming
+			if self.t_start is None:
+				self.t_start = self.df['time_stamp'].iat[0]
+			self.df['time_stamp'] = (self.df['time_stamp'] - self.t_start) * 1e-3
 
 			# self.df['tcr_temp'] = (((self.df['r_targ'] - self.df['r_base'])/self.df['r_base']) / 0.000415) + 29
 			# self.df['tcr_live'] = (((self.df['r_live'] - self.df['r_base'])/self.df['r_base']) / 0.000415) + 29
@@ -160,14 +210,14 @@ class PLOTTER:
 					for trace in v['subplot%d' % (i+1)]:
 						y = self.df[self.headers[trace - 1]]
 						if num_sub_plots > 1:
-							if DVC_CONFIG == "K3":
+							if self.dvc_config == "K3":
 								ax[i].plot(y, label=self.headers[trace - 1])
 							else:
 								ax[i].plot(x, y, label=self.headers[trace - 1])
 							ax[i].set_ylabel(self.hlabels[trace - 1])
 							ax[i].legend(loc='upper right')
 						else:
-							if DVC_CONFIG == "K3":
+							if self.dvc_config == "K3":
 								ax.plot(y, label=self.headers[trace - 1])
 							else:
 								ax.plot(x, y, label=self.headers[trace - 1])
@@ -187,7 +237,7 @@ class PLOTTER:
 				# ax[3].plot(self.df['time_stamp'],self.df['fixed_offset_minus1'])
 				# ax[1].plot(self.df['time_stamp'],self.df['offset'])
 
-				if DVC_CONFIG != "K3":
+				if self.dvc_config != "K3":
 					plt.xlabel(x_label)
 		plt.show()
 
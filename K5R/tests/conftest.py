@@ -0,0 +1,23 @@
+import os
+import sys
+import tempfile
+import importlib
+
+K5R_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, K5R_DIRECTORY)
+
+# file_manager creates logs/ in the working directory when it is imported, keep it out of the tree
+cwd = os.getcwd()
+os.chdir(tempfile.mkdtemp())
+importlib.import_module('file_manager')
+os.chdir(cwd)
+
+import pytest
+
+
+@pytest.fixture
+def log_dir(tmp_path, monkeypatch):
+    # FILE_MANAGER writes to logs/ under the working directory
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('logs')
+    return tmp_path / 'logs'
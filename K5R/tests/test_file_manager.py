@@ -0,0 +1,235 @@
+import os
+import json
+import time
+
+import file_manager
+import log_reader
+
+
+def read(path):
+    f = open(path, 'rb')
+    data = f.read()
+    f.close()
+    return data
+
+def data_lines(path):
+    # Lines after the header's blank line
+    return read(path).split(b'\n\n', 1)[1].replace(b'\r\n', b'\n').split(b'\n')[:-1]
+
+
+def test_write_log_sync(log_dir):
+    fm = file_manager.FILE_MANAGER(False)
+    fm.create_log_file('sync')
+    fm.write_log('$,1,2,3')
+    fm.write_log(b'$,4,5,6')
+    assert fm.lines_written == 2
+    fm.close_log_file()
+    assert data_lines(log_dir / 'sync.log') == [b'$,1,2,3', b'$,4,5,6']
+
+def test_async_writes(log_dir):
+    fm = file_manager.FILE_MANAGER(True)
+    fm.create_log_file('queued')
+    for i in range(1000):
+        fm.write_log('$,%d,0,0' % i)
+    fm.close_log_file()
+    lines = data_lines(log_dir / 'queued.log')
+    assert len(lines) == 1000 and lines[-1] == b'$,999,0,0'
+    assert fm.stats()['dropped_lines'] == 0
+    fm.stop_writer()
+
+def test_full_queue_drops_lines(log_dir):
+    fm = file_manager.FILE_MANAGER(True, queue_size=3)
+    fm.create_log_file('full')
+    with fm.lock:
+        # The writer can't take anything off the queue while the lock is held
+        for i in range(10):
+            fm.write_log('$,%d,0,0' % i)
+    fm.close_log_file()
+    assert len(data_lines(log_dir / 'full.log')) == 3
+    s = fm.stats()
+    assert s['dropped_lines'] == 7
+    assert s['queue_high_water'] == 3
+    assert 'DROPPED 7' in fm.status_text()
+    fm.stop_writer()
+
+def test_write_error_counts_lines(log_dir):
+    fm = file_manager.FILE_MANAGER(True)
+    fm.create_log_file('failing')
+    def write_text(text, num_lines):
+        raise OSError('disk full')
+    fm.write_text = write_text
+    for i in range(5):
+        fm.write_log('$,%d,0,0' % i)
+    fm.stop_writer()
+    s = fm.stats()
+    assert s['dropped_lines'] == 5
+    assert s['last_error'] == 'disk full'
+
+def test_write_error_sync_releases_lock(log_dir):
+    fm = file_manager.FILE_MANAGER(False)
+    fm.create_log_file('failing')
+    write_text = fm.write_text
+    def failing(text, num_lines):
+        raise OSError('disk full')
+    fm.write_text = failing
+    fm.write_log('$,1,2,3')
+    assert not fm.lock.locked()
+    fm.write_text = write_text
+    fm.write_log('$,4,5,6')
+    fm.close_log_file()
+    assert fm.stats()['dropped_lines'] == 1
+    assert data_lines(log_dir / 'failing.log') == [b'$,4,5,6']
+
+def test_set_async(log_dir):
+    fm = file_manager.FILE_MANAGER(False)
+    fm.set_async()
+    fm.create_log_file('switched')
+    fm.write_log('$,1,2,3')
+    fm.set_async(False)
+    assert not fm.writer.is_alive()
+    fm.write_log('$,4,5,6')     # Written directly
+    assert fm.queue_depth() == 0
+    fm.close_log_file()
+    assert data_lines(log_dir / 'switched.log') == [b'$,1,2,3', b'$,4,5,6']
+
+def test_drain_without_writer(log_dir):
+    fm = file_manager.FILE_MANAGER(True)
+    fm.create_log_file('stuck')
+    fm.writer_running = False
+    fm.writer.join()
+    for i in range(5):
+        fm.write_log('$,%d,0,0' % i)
+    # Returns instead of waiting for a writer that will never empty the queue
+    assert not fm.drain_queue(timeout=0.1)
+    fm.close_log_file()
+    s = fm.stats()
+    assert s['dropped_lines'] == 5
+    assert 'not running' in s['last_error']
+
+
+def test_flush_policy(log_dir):
+    fm = file_manager.FILE_MANAGER(False)
+    fm.set_flush_policy(lines=3)
+    fm.create_log_file('flushed')
+    size = os.path.getsize(log_dir / 'flushed.log')
+    fm.write_log('$,1,2,3')
+    fm.write_log('$,1,2,3')
+    assert os.path.getsize(log_dir / 'flushed.log') == size
+    fm.write_log('$,1,2,3')
+    assert os.path.getsize(log_dir / 'flushed.log') > size
+    fm.close_log_file()
+
+def test_flush_interval_without_new_lines(log_dir):
+    fm = file_manager.FILE_MANAGER(False)
+    fm.set_flush_policy(lines=0, interval_ms=50)
+    fm.create_log_file('idle')
+    size = os.path.getsize(log_dir / 'idle.log')
+    fm.write_log('$,1,2,3')
+    assert os.path.getsize(log_dir / 'idle.log') == size
+    # The stream stopped: flushed by the timer, not by the next line
+    time.sleep(0.2)
+    assert os.path.getsize(log_dir / 'idle.log') > size
+    fm.close_log_file()
+    assert fm.stats()['last_error'] is None
+
+
+def test_rotation(log_dir):
+    fm = file_manager.FILE_MANAGER(False)
+    fm.set_rotation(num_bytes=100)
+    fm.create_log_file('rotated')
+    for i in range(30):
+        fm.write_log('$,%d,0,0' % i)
+    fm.close_log_file()
+    session, segments = log_reader.load_session(str(log_dir / ('rotated' + file_manager.SESSION_SUFFIX)))
+    assert len(segments) > 1
+    assert all(s['end'] is not None for s in session['segments'])
+    assert sum(s['lines'] for s in session['segments']) == 30
+    assert 'row_format' not in session
+    df = log_reader.load_log(str(log_dir / ('rotated' + file_manager.SESSION_SUFFIX)), ['time', 'a', 'b'])
+    assert df['time'].tolist() == list(range(30))
+
+def test_rotation_row_format(log_dir):
+    # Cumulative time: the running sum carries on across segments
+    fm = file_manager.FILE_MANAGER(False)
+    fm.set_row_format(3, '', ',', time_column=0, cumulative=True)
+    fm.set_rotation(num_bytes=50)
+    fm.create_log_file('cumulative')
+    for i in range(20):
+        fm.write_log('0.5,%d,0' % i)
+    fm.close_log_file()
+    session = json.load(open(log_dir / ('cumulative' + file_manager.SESSION_SUFFIX)))
+    segments = [s for s in session['segments'] if s['rows']]
+    assert sum(s['rows'] for s in segments) == 20
+    assert segments[0]['first_time'] == 0.5
+    assert segments[-1]['last_time'] == 10.0
+    assert all(a['last_time'] < b['first_time'] for a, b in zip(segments, segments[1:]))
+
+
+def test_host_timestamps(log_dir):
+    fm = file_manager.FILE_MANAGER(False, host_timestamps=True)
+    fm.create_log_file('stamped')
+    fm.write_log('$,1,2,3', 12345)
+    fm.close_log_file()
+    assert data_lines(log_dir / 'stamped.log') == [b'12345\t$,1,2,3']
+
+
+def test_column_sink_rows(log_dir):
+    fm = file_manager.FILE_MANAGER(False)
+    fm.set_column_sink(['time', 'a', 'b'], '$,', batch_rows=4)
+    fm.create_log_file('sink')
+    for line in ['$,1,2,3', 'heater stream 1', '$,4,5', '$,x,5,6'] + ['$,%d,0,0' % i for i in range(10)]:
+        fm.write_log(line)
+    sink = fm.sink
+    fm.close_log_file()
+    assert sink.skipped_rows == 2
+    schema = json.load(open(log_dir / ('sink.log' + file_manager.COLUMNS_SUFFIX) / 'schema.json'))
+    assert schema['complete'] and schema['rows'] == 11 and schema['chunks'] == 3
+
+
+def test_named_logs(log_dir):
+    fm = file_manager.FILE_MANAGER(False)
+    fm.create_log_file('main')
+    fm.open_named_log('dev1')
+    fm.write_named_log('dev1', '$,1,2,3', 111)
+    fm.write_named_log('unknown', '$,1,2,3')
+    fm.close_log_file()
+    assert data_lines(log_dir / 'main-dev1.log') == [b'111\t$,1,2,3']
+
+    # Re-opened with the next main log until it is closed for good
+    fm.create_log_file('second')
+    assert os.path.isfile(log_dir / 'second-dev1.log')
+    fm.close_named_log('dev1')
+    assert 'dev1' not in fm.named_logs
+    fm.write_named_log('dev1', '$,4,5,6')
+    fm.close_log_file()
+    fm.create_log_file('third')
+    fm.close_log_file()
+    assert not os.path.exists(log_dir / 'third-dev1.log')
+
+def test_close_named_log_stops_writer(log_dir):
+    fm = file_manager.FILE_MANAGER(True)
+    fm.create_log_file('main')
+    fm.open_named_log('dev1')
+    named = fm.named_logs['dev1']
+    for i in range(100):
+        fm.write_named_log('dev1', '$,%d,0,0' % i)
+    fm.close_named_log('dev1')
+    assert not named.writer.is_alive()
+    assert len(data_lines(log_dir / 'main-dev1.log')) == 100
+    fm.close_log_file()
+    fm.stop_writer()
+
+
+def test_stats_rate_per_reader(log_dir):
+    fm = file_manager.FILE_MANAGER(False)
+    fm.create_log_file('rates')
+    fm.stats('benchmark')
+    fm.write_log('$,1,2,3')
+    fm.stats()
+    fm.write_log('$,1,2,3')
+    # Reading the status bar's rate didn't move the benchmark's window
+    benchmark = fm.stats('benchmark')
+    status = fm.stats()
+    assert benchmark['lines'] == status['lines'] == 2
+    assert benchmark['lines_per_sec'] > 0
+    fm.close_log_file()
@@ -0,0 +1,343 @@
+import os
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import file_manager
+import log_reader
+
+COLUMNS = ['time', 'a', 'b']
+HEADER = b'DATA LOG: PAX ERA LIFE\rDATE: 2024-01-02\rTIME: 03:04:05\r\n\r\n'
+
+
+def write_log(path, lines, header=HEADER):
+    f = open(path, 'wb')
+    f.write(header + b''.join(line + b'\r\n' for line in lines))
+    f.close()
+    return str(path)
+
+def k5r_rows(first, last):
+    return [b'$,%d,%d,%d' % (t, t * 2, t * 3) for t in range(first, last)]
+
+
+def test_parse_buffer_keeps_data_rows_only():
+    buf = HEADER + b'heater stream 1\r\n$,1,2,3\r\n$,4,5\r\n$,7,8,9\r\npuff stop\r\n'
+    df = log_reader.parse_buffer(buf, COLUMNS)
+    assert df.values.tolist() == [[1, 2, 3], [7, 8, 9]]
+
+def test_parse_buffer_line_ends():
+    df = log_reader.parse_buffer(b'$,1,2,3\r$,4,5,6\n$,7,8,9\r\n$,10,11,12', COLUMNS)
+    assert df['time'].tolist() == [1, 4, 7, 10]
+
+def test_parse_buffer_min_lines():
+    assert log_reader.parse_buffer(HEADER + b'$,1,2,3\r\n', COLUMNS, min_lines=10) is None
+
+def test_parse_buffer_k3_dialect():
+    df = log_reader.parse_buffer(b'1;2;3;\r\n4;5;6;\r\n4;5;\r\n', COLUMNS, log_reader.DIALECT_K3)
+    assert df.values.tolist() == [[1, 2, 3], [4, 5, 6]]
+
+def test_parse_log(tmp_path):
+    df = log_reader.parse_log(write_log(tmp_path / 'parsed.log', k5r_rows(0, 20)), COLUMNS)
+    assert df['b'].tolist() == [t * 3 for t in range(20)]
+
+
+def test_load_log_cache(tmp_path):
+    path = write_log(tmp_path / 'cached.log', k5r_rows(0, 50))
+    df = log_reader.load_log(path, COLUMNS)
+    assert len(os.listdir(log_reader.cache_directory(path))) > 0
+    cached = log_reader.load_log(path, COLUMNS)
+    assert cached.equals(df)
+    # A changed log is parsed again
+    write_log(tmp_path / 'cached.log', k5r_rows(0, 60))
+    assert len(log_reader.load_log(path, COLUMNS)) == 60
+
+def test_load_log_without_rows(tmp_path):
+    path = write_log(tmp_path / 'echo.log', [b'heater stream 1', b'heater stream 0'])
+    assert log_reader.load_log(path, COLUMNS) is None
+    assert log_reader.load_log(path, COLUMNS) is None     # From the cache
+
+
+def test_iter_log_chunks(tmp_path):
+    # Chunks cut rows in half, every row still comes out once
+    path = write_log(tmp_path / 'chunked.log', k5r_rows(0, 1000))
+    chunks = list(log_reader.iter_log_chunks(path, COLUMNS, chunk_bytes=1000))
+    assert len(chunks) > 10
+    assert chunks[-1][1] == 1.0
+    df = pd.concat([chunk for chunk, progress in chunks], ignore_index=True)
+    assert df['time'].tolist() == list(range(1000))
+
+def test_stream_log(tmp_path):
+    path = write_log(tmp_path / 'streamed.log', k5r_rows(0, 1000))
+    def calcs(df):
+        df['c'] = df['a'] + df['b']
+        return df
+    df = log_reader.stream_log(path, COLUMNS, calcs, max_points=100)
+    assert 100 <= len(df) <= 250
+    # Min/max envelope: the extremes survive decimation
+    assert df['c'].min() == 0 and df['c'].max() == 999 * 5
+
+
+def test_index_and_rows(tmp_path):
+    path = write_log(tmp_path / 'indexed.log', k5r_rows(0, 100))
+    index = log_reader.load_index(path, COLUMNS)
+    assert len(index) == 100
+    first, last = log_reader.find_rows(index, 10, 19)
+    assert (first, last) == (10, 20)
+    df = log_reader.load_rows(path, COLUMNS, index, first, last)
+    assert df['time'].tolist() == list(range(10, 20))
+    df = log_reader.load_rows(path, COLUMNS, index, 95, 100)
+    assert df['time'].tolist() == list(range(95, 100))
+
+def test_find_rows_time_going_backwards():
+    index = np.zeros(6, dtype=log_reader.INDEX_DTYPE)
+    index['time'] = [5, 6, 7, 1, 2, 3]
+    assert log_reader.find_rows(index, 6, 7) == (1, 3)
+    assert log_reader.find_rows(index, 2, 6) == (0, 6)
+
+
+def test_load_directory(tmp_path):
+    write_log(tmp_path / 'b.log', k5r_rows(10, 20))
+    write_log(tmp_path / 'a.log', k5r_rows(0, 10))
+    write_log(tmp_path / 'empty.log', [b'heater stream 1'])
+    write_log(tmp_path / 'other.txt', k5r_rows(0, 10))
+    done = []
+    logs = log_reader.load_directory(str(tmp_path), COLUMNS, workers=2, progress=lambda n, total, file: done.append(total))
+    assert list(logs) == ['a.log', 'b.log']
+    assert logs['b.log']['time'].tolist() == list(range(10, 20))
+    assert done == [3, 3, 3]
+
+def test_load_directory_concat(tmp_path):
+    write_log(tmp_path / 'a.log', k5r_rows(0, 10))
+    write_log(tmp_path / 'b.log', k5r_rows(10, 20))
+    df = log_reader.load_directory(str(tmp_path), COLUMNS, workers=2, concat=True, progress=None)
+    assert df.index.names == ['file', 'row']
+    assert df.loc['b.log']['time'].tolist() == list(range(10, 20))
+
+
+def test_parse_buffer_usecols():
+    df = log_reader.parse_buffer(HEADER + b'$,1,2,3\r\n$,4,5,6\r\n', COLUMNS, usecols=['b'])
+    assert list(df.columns) == ['b']
+    assert df['b'].tolist() == [3, 6]
+
+def test_plot_columns():
+    headers = ['time', 'a', 'b', 'c', 'sum']
+    config = {
+        'PLOT_WINDOW_1': {'title': 'T', 'x_data': [1], 'subplot1': [5]},
+        'CALCULATIONS': {'5': ['sum', 2, 4]},
+    }
+    assert log_reader.plot_columns(config, headers, 4) == ['time', 'a', 'c']
+    assert log_reader.plot_columns(config, headers, 4, ['b']) == ['time', 'a', 'b', 'c']
+    # A calculation without its inputs listed can use anything
+    config['CALCULATIONS']['5'] = 'sum'
+    assert log_reader.plot_columns(config, headers, 4) is None
+
+
+def test_tail_log(tmp_path):
+    path = tmp_path / 'growing.log'
+    write_log(path, k5r_rows(0, 10))
+    assert log_reader.tail_log(str(path), COLUMNS)['time'].tolist() == list(range(10))
+    f = open(path, 'ab')
+    f.write(b'$,10,20,30\r\n$,11,2')       # Last row still being written
+    f.close()
+    assert log_reader.tail_log(str(path), COLUMNS)['time'].tolist() == list(range(11))
+    f = open(path, 'ab')
+    f.write(b'2,33\r\n')
+    f.close()
+    df = log_reader.tail_log(str(path), COLUMNS)
+    assert df['time'].tolist() == list(range(12))
+    assert df['b'].iloc[-1] == 33
+
+def test_log_tail_replaced_file(tmp_path):
+    path = tmp_path / 'replaced.log'
+    write_log(path, k5r_rows(0, 10))
+    tail = log_reader.LOG_TAIL(str(path), COLUMNS, usecols=['a'])
+    assert len(tail.read()) == 10
+    os.remove(path)
+    write_log(path, k5r_rows(100, 103))
+    assert tail.read()['a'].tolist() == [200, 202, 204]
+
+
+def test_load_log_dtypes(tmp_path):
+    path = write_log(tmp_path / 'small.log', k5r_rows(0, 50) + [b'$,50,60000,1.5'])
+    df = log_reader.load_log(path, COLUMNS, dtypes={'time': 'int16', 'b': 'int8'})
+    assert df['time'].dtype == np.int16
+    assert df['b'].dtype == np.float64      # Declared type can't hold 1.5
+    # Undeclared columns are inferred
+    assert df['a'].dtype == np.int32
+
+def test_load_log_float64_without_dtypes(tmp_path):
+    df = log_reader.load_log(write_log(tmp_path / 'plain.log', k5r_rows(0, 50)), COLUMNS)
+    assert (df.dtypes == np.float64).all()
+
+def test_plot_dtypes(tmp_path):
+    assert log_reader.plot_dtypes({}, COLUMNS, 3) is None
+    # Only the declared columns are narrowed, the others stay float64
+    dtypes = log_reader.plot_dtypes({"DATA_TYPES": {"2": "int32"}}, COLUMNS + ['calc'], 3)
+    assert dtypes == {'time': 'float64', 'a': 'int32', 'b': 'float64'}
+    df = log_reader.load_log(write_log(tmp_path / 'plot.log', k5r_rows(0, 50)), COLUMNS, dtypes=dtypes)
+    assert df['a'].dtype == np.int32
+    assert df['time'].dtype == df['b'].dtype == np.float64
+
+
+def test_sniff_dialect(tmp_path):
+    assert log_reader.sniff_dialect(write_log(tmp_path / 'k5r.log', k5r_rows(0, 20)), COLUMNS) == log_reader.DIALECT_K5R
+    k3 = write_log(tmp_path / 'k3.log', [b'%d;%d;%d;' % (i, i, i) for i in range(20)])
+    assert log_reader.sniff_dialect(k3, COLUMNS) == log_reader.DIALECT_K3
+    csv = write_log(tmp_path / 'csv.log', [b't,a,b'] + [b'%d,%d,%d' % (i, i, i) for i in range(20)])
+    assert log_reader.sniff_dialect(csv, COLUMNS) == log_reader.DIALECT_CSV
+    # Rows with another field count don't vote
+    assert log_reader.sniff_dialect(k3, COLUMNS[:2]) == log_reader.DIALECT_K5R
+
+def test_load_log_sniffs_dialect(tmp_path):
+    path = write_log(tmp_path / 'k3.log', [b'%d;%d;%d;' % (i, i, i) for i in range(20)])
+    assert log_reader.load_log(path, COLUMNS, dialect=None)['time'].tolist() == list(range(20))
+
+
+def test_load_log_events(tmp_path):
+    path = write_log(tmp_path / 'events.log', k5r_rows(0, 3) + [b'puff stop'] + k5r_rows(3, 5) + [b'error: 5'])
+    df, events = log_reader.load_log_events(path, COLUMNS)
+    assert len(df) == 5
+    puffs = events[events['text'] == 'puff stop']
+    assert puffs['row'].tolist() == [3] and puffs['time'].tolist() == [2]
+    assert events['text'].tolist()[-1] == 'error: 5'
+    assert events['row'].tolist()[-1] == 5
+    # The file header comes first, ahead of the first row
+    assert events['text'].iloc[0].startswith('DATA LOG')
+    assert events['row'].iloc[0] == 0
+
+
+def test_record_log(log_dir):
+    fm = file_manager.FILE_MANAGER(False)
+    name = fm.create_record_file(COLUMNS, 'records', prefix='$,')
+    fm.write_log('heater stream 1')
+    for line in k5r_rows(0, 10):
+        fm.write_log(line)
+    fm.write_record([10, 20, 30])
+    fm.close_log_file()
+    assert fm.skipped_lines == 1
+    df = log_reader.load_record_log(str(log_dir / name))
+    assert df['time'].tolist() == list(range(11))
+    assert df['b'].iloc[-1] == 30
+    assert log_reader.log_start_time(str(log_dir / name)) is not None
+
+
+def test_compressed_frames(log_dir):
+    fm = file_manager.FILE_MANAGER(False)
+    fm.create_log_file('packed', compress=True)
+    for line in k5r_rows(0, 200):
+        fm.write_log(line)
+    fm.close_log_file()
+    path = str(log_dir / ('packed.log' + log_reader.COMPRESSED_SUFFIX))
+    assert len(log_reader.load_frames(path)) >= 1
+    df = log_reader.load_log(path, COLUMNS)
+    assert df['time'].tolist() == list(range(200))
+    index = log_reader.load_index(path, COLUMNS)
+    first, last = log_reader.find_rows(index, 50, 59)
+    assert log_reader.load_rows(path, COLUMNS, index, first, last)['time'].tolist() == list(range(50, 60))
+
+
+def write_session(log_dir, rows_per_segment, num_segments, row_format=True):
+    # Session of num_segments full segments written through FILE_MANAGER, times from 100 on
+    fm = file_manager.FILE_MANAGER(False)
+    if row_format:
+        fm.set_row_format(len(COLUMNS), '$,', ',')
+    line_bytes = len(b'$,100,200,300') + len(fm.line_end)
+    fm.set_rotation(num_bytes=rows_per_segment * line_bytes)
+    fm.create_log_file('session')
+    for line in k5r_rows(100, 100 + rows_per_segment * num_segments):
+        fm.write_log(line)
+    fm.close_log_file()
+    return str(log_dir / ('session' + log_reader.SESSION_SUFFIX))
+
+def test_session_min_lines(log_dir):
+    # min_lines is for the whole session, segments shorter than that still count
+    session = write_session(log_dir, 4, 5)
+    df = log_reader.load_log(session, COLUMNS, min_lines=10)
+    assert df['time'].tolist() == list(range(100, 120))
+    assert log_reader.load_log(session, COLUMNS, min_lines=30) is None
+
+def test_session_manifest_rows(log_dir):
+    # The last row fills a segment, so the session ends with an empty one
+    session, segments = log_reader.load_session(write_session(log_dir, 10, 3))
+    assert len(segments) == 4
+    assert session['row_format']['fields'] == len(COLUMNS)
+    assert [s['rows'] for s in session['segments']] == [10, 10, 10, 0]
+    assert [(s['first_time'], s['last_time']) for s in session['segments']] == [(100, 109), (110, 119), (120, 129), (None, None)]
+
+def test_session_range_skips_segments(log_dir, monkeypatch):
+    session = write_session(log_dir, 10, 5)
+    full = log_reader.load_index(session, COLUMNS)
+    indexed = []
+    build_index = log_reader.build_index
+    def counted(file, *args, **kwargs):
+        indexed.append(os.path.basename(file))
+        return build_index(file, *args, **kwargs)
+    monkeypatch.setattr(log_reader, 'build_index', counted)
+    for name in os.listdir(log_dir):
+        if name.startswith('.'):
+            for cached in os.listdir(log_dir / name):
+                os.remove(log_dir / name / cached)
+
+    index = log_reader.load_index(session, COLUMNS, t_from=122, t_to=127)
+    assert indexed == ['session_002.log']
+    assert len(index) == len(full)
+    first, last = log_reader.find_rows(index, 122, 127)
+    assert (first, last) == log_reader.find_rows(full, 122, 127)
+    df = log_reader.load_rows(session, COLUMNS, index, first, last)
+    assert df['time'].tolist() == list(range(122, 128))
+
+def test_session_without_row_format_opens_every_segment(log_dir):
+    session = write_session(log_dir, 10, 3, row_format=False)
+    index = log_reader.load_index(session, COLUMNS, t_from=125, t_to=127)
+    assert np.all(index['offset'][10:] > 0)
+    assert log_reader.start_time(session, COLUMNS) == 100
+
+
+def test_host_time_stamp():
+    buf = b'123\t$,1,2,3\r\n$,4,5,6\r\n'
+    df = log_reader.parse_buffer(buf, COLUMNS, usecols=['a', log_reader.HOST_TIME_COLUMN])
+    assert df['a'].tolist() == [2, 5]
+    assert df[log_reader.HOST_TIME_COLUMN].iloc[0] == 123
+    assert np.isnan(df[log_reader.HOST_TIME_COLUMN].iloc[1])
+
+@pytest.mark.parametrize('line, start', [
+    (b'123\tx', 4),         # Stamp
+    (b'12.5\t3;4;', 0),     # Tab separated data row, not a stamp
+    (b'9a9\tx', 0),
+    (b'\tx', 0),
+    (b'1' * 20 + b'\tx', 0),    # Longer than any int64
+    (b'x\t1', 0),
+])
+def test_skip_host_time(line, start):
+    raw = np.frombuffer(line + b'\n', dtype=np.uint8)
+    starts = np.array([0])
+    ends = np.array([len(line)])
+    new_starts, stamp_ends = log_reader.skip_host_time(raw, starts, ends)
+    assert new_starts[0] == start
+    assert stamp_ends[0] == (start - 1 if start else 0)
+
+
+def test_column_sink(log_dir):
+    fm = file_manager.FILE_MANAGER(False)
+    fm.set_column_sink(COLUMNS, '$,')
+    fm.create_log_file('sunk')
+    for line in k5r_rows(0, 30) + [b'puff stop']:
+        fm.write_log(line)
+    fm.close_log_file()
+    path = str(log_dir / 'sunk.log')
+    df = log_reader.load_column_sink(path, COLUMNS)
+    assert df['b'].tolist() == [t * 3 for t in range(30)]
+    assert log_reader.load_log(path, COLUMNS, usecols=['a'])['a'].tolist() == [t * 2 for t in range(30)]
+
+def test_empty_column_sink(log_dir):
+    fm = file_manager.FILE_MANAGER(False)
+    fm.set_column_sink(COLUMNS, '$,')
+    fm.create_log_file('empty')
+    fm.write_log('heater stream 1')
+    fm.close_log_file()
+    path = str(log_dir / 'empty.log')
+    assert json.load(open(path + log_reader.COLUMNS_SUFFIX + '/schema.json'))['complete']
+    assert log_reader.load_column_sink(path, COLUMNS) is None
+    assert log_reader.load_log(path, COLUMNS) is None
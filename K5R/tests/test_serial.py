@@ -0,0 +1,148 @@
+import time
+
+import pytest
+
+import serial_reader
+import serial_async
+import k5r_device
+
+
+class PORT():
+    # What LINE_READER.read() uses of a pyserial port
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+
+    @property
+    def in_waiting(self):
+        return len(self.chunks[0]) if self.chunks else 0
+
+    def read(self, size):
+        if not self.chunks:
+            return b''
+        chunk = self.chunks.pop(0)
+        if size < len(chunk):
+            self.chunks.insert(0, chunk[size:])
+        return chunk[:size]
+
+
+def test_read_drains_port():
+    reader = serial_reader.LINE_READER()
+    port = PORT([b'$,1,2\r\n$,3', b',4\r\n'])
+    assert reader.read(port) == b'$,1,2\r\n$,3'
+    assert reader.read(port) == b',4\r\n'
+    assert reader.read(port) == b''     # Port timeout
+
+def test_read_lines():
+    reader = serial_reader.LINE_READER()
+    port = PORT([b'$,1,2\r\n$,3,4\r\n$,5'])
+    assert reader.read_lines(port) == [b'$,1,2', b'$,3,4']
+    assert reader.read_lines(port) == []
+    # A partial line of another port is dropped
+    assert reader.read_lines(PORT([b',6\r\n'])) == [b',6']
+
+
+def test_frame_complete_lines():
+    reader = serial_reader.LINE_READER()
+    assert reader.frame(b'$,1,2\r\n$,3,4\r\n') == [b'$,1,2', b'$,3,4']
+    assert reader.buffer == bytearray()
+
+def test_frame_keeps_partial_line():
+    reader = serial_reader.LINE_READER()
+    assert reader.frame(b'$,1,2\r\n$,3') == [b'$,1,2']
+    assert reader.frame(b',4') == []
+    assert reader.frame(b'\r\nheater') == [b'$,3,4']
+    reader.reset()
+    assert reader.frame(b' stream 1\n') == [b'stream 1']
+
+
+def test_gui_call_cancel():
+    calls = []
+    call = serial_async.GUI_CALL(calls.append, (1,))
+    call.run()
+    call.cancel()
+    call.run()
+    assert calls == [1]
+
+
+class GUI():
+    # The GUI thread's side of the bridge: takes the items and runs the calls, like take_bridge()
+    def __init__(self, acq):
+        self.acq = acq
+        self.items = []
+
+    def take(self, seconds):
+        end = time.perf_counter() + seconds
+        while time.perf_counter() < end:
+            for kind, value in self.acq.bridge.take():
+                if kind == serial_async.CALL:
+                    value.run()
+                else:
+                    self.items.append((kind, value))
+            time.sleep(0.001)
+
+@pytest.fixture
+def acq():
+    acq = serial_async.ACQUISITION()
+    yield acq
+    acq.loop.call_soon_threadsafe(acq.loop.stop)
+
+def test_post_call(acq):
+    calls = []
+    acq.post_call(calls.append, 'a')
+    acq.post('console', 'text')
+    gui = GUI(acq)
+    gui.take(0.01)
+    assert calls == ['a']
+    assert gui.items == [('console', 'text')]
+
+def test_call_later(acq):
+    calls = []
+    start = time.perf_counter()
+    acq.call_later(0.05, lambda: calls.append(time.perf_counter() - start))
+    cancelled = acq.call_later(0.05, calls.append, 'cancelled')
+    cancelled.cancel()
+    gui = GUI(acq)
+    gui.take(0.02)
+    assert calls == []
+    gui.take(0.1)
+    assert len(calls) == 1 and calls[0] >= 0.05
+
+
+@pytest.fixture
+def device(acq, monkeypatch):
+    # K5R_DEVICE on its own loop with test times short enough to run here
+    monkeypatch.setattr(serial_async, 'get_acquisition', lambda: acq)
+    monkeypatch.setattr(k5r_device, 'PUFF_MARGIN', 0.0)
+    monkeypatch.setattr(k5r_device, 'END_TEST_DELAY', 0.02)
+    written = []
+    dvc = k5r_device.K5R_DEVICE(written.append)
+    dvc.msg_timeout = 0.01
+    dvc.written = written
+    return dvc
+
+def test_device_resends_on_error(acq, device):
+    device.send('heater stream 1')
+    # The serial side posts the reply, the resend happens on the GUI thread
+    acq.post_call(device.parse_line, b'?? unknown command')
+    assert device.written == [b'heater stream 1\r']
+    GUI(acq).take(0.005)
+    assert device.written == [b'heater stream 1\r'] * 2
+
+def test_device_test_sequence(acq, device):
+    puffs = []
+    ended = []
+    device.on_puff = puffs.append
+    device.on_test_end = lambda: ended.append(device.puff_counter)
+    device.start_test(0.02, 0.02, 3)
+    GUI(acq).take(0.5)
+    sent = [w.decode().strip() for w in device.written]
+    assert sent == ['heater ok2vape 20'] * 3 + ['heater stream 0']
+    assert puffs == [0, 1, 2, 3, 0]
+    assert ended == [0]
+    assert not device.test_flag
+
+def test_device_stop_cancels_test(acq, device):
+    device.start_test(0.02, 0.02, 3)
+    device.stop()
+    GUI(acq).take(0.1)
+    assert device.written == []
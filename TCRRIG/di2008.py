@@ -65,6 +65,9 @@ slist contents.
 
 AMBIENT_TEMP = 23
 
+RX_TIMEOUT = 0.1        # Port read timeout (sec): longest run() blocks with nothing arriving
+IDLE_PERIOD = 10        # run() poll period (ms) while not acquiring
+
 TC_TYPE_LOOKUP  = {'B': 0x1000, 'E': 0x1100, 'J': 0x1200, 'K': 0x1300, 'N': 0x1400, 'R': 0x1500, 'S': 0x1600, 'T': 0x1700}
 
 # samp_rate_hz = 100 / (int(SRATE) * int(DEC))
@@ -87,6 +90,10 @@ class DI2008():
         self.t_last = 0
         self.t_diff = 0
         self.log_stat = False
+        self.log_name = None        # Named log (FILE_MANAGER.open_named_log) to write to instead of the main log
+        self.t_host = 0
+        self.rx_buffer = bytearray()    # Received bytes not yet converted (odd byte of a sample)
+        self.scan_string = ''           # Samples converted so far of the scan in progress
         self.ser_lock = threading.Lock()
         self.output_lock = threading.Lock()
 
@@ -107,7 +114,7 @@ class DI2008():
         self.ser_lock.acquire()
         if hooked_port:
             print("Found DATAQ Instruments device on",hooked_port)
-            self.ser.timeout = 0
+            self.ser.timeout = RX_TIMEOUT
             self.ser.port = hooked_port
             self.ser.baudrate = '115200'
             self.ser.open()
@@ -249,82 +256,100 @@ class DI2008():
         self.output_lock.release()
         return rtn_str
 
-    def run(self, period):
+    def run(self, period=IDLE_PERIOD):
         while True:
-            if self.acquiring:
-                self.ser_lock.acquire()
-                if self.ser.inWaiting():
-                    self.output_lock.acquire()
-                    self.t_now = time.time()
-                    self.t_diff = self.t_now - self.t_last
-                    self.t_last = self.t_now
-                    self.output_string = "%f," % self.t_diff
-                    while self.ser.inWaiting():   # (2 * len(self.slist))
-                        for i in range(len(self.slist)):
-                            # The four LSBs of slist determine measurement function
-                            function = self.slist[self.slist_pointer] & 0xf
-                            mode_bit = self.slist[self.slist_pointer] & 0x1000
-                            # Always two bytes per sample...read them
-                            if self.ser.inWaiting() >= 2:
-                                new_bytes = self.ser.read(2)
-                            else:
-                                break
-                            if (function < 8) and (not(mode_bit)):
-                                # Working with a Voltage input channel. Scale accordingly.
-                                result = self.range_table[self.slist_pointer] * int.from_bytes(new_bytes, byteorder='little', signed=True) / 32768
-                                self.output_string = self.output_string + "{: 3.3f}, ".format(result)
-                            elif (function < 8) and (mode_bit):
-                                """
-                                Working with a TC channel.
-                                Convert to temperature if no errors.
-                                First, test for TC error conditions.
-                                """
-                                result = int.from_bytes(new_bytes, byteorder='little', signed=True)
-                                if result == 32767:
-                                    print('CJC Error!')
-                                # elif result == -32768:
-                                #     print('OPEN Circuit!')
-                                else:
-                                    # Get here if no errors, so isolate TC type
-                                    tc_type = self.slist[self.slist_pointer] & 0x0700
-                                    tc_chan = self.slist[self.slist_pointer] & 0x000F
-                                    # Move TC type into 3 LSBs to form an index we'll use to select m & b scaling constants
-                                    tc_type = tc_type >> 8
-                                    self.temperature[tc_chan] = TC_SLOPE[tc_type] * result + TC_OFFSET[tc_type]
-                                    self.temp_filt[tc_chan].moving_avg(self.temperature[tc_chan])
-                                    self.output_string = self.output_string + "{: 3.3f},{: 3.3f},".format(self.temperature[tc_chan], self.temp_filt[tc_chan].result)
-
-                            elif function == 8:
-                                # Working with the Digital input channel 
-                                result = (int.from_bytes(new_bytes, byteorder='big', signed=False)) & (0x007f)
-                                self.output_string = self.output_string + "{: 3d}, ".format(result)
-
-                            elif function == 9:
-                                # Working with the Rate input channel
-                                result = (int.from_bytes(new_bytes, byteorder='little', signed=True) + 32768) / 65535 * (self.range_table[self.slist_pointer])
-                                self.output_string = self.output_string + "{: 3.1f}, ".format(result)
-
-                            else:
-                                # Working with the Counter input channel
-                                result = (int.from_bytes(new_bytes, byteorder='little', signed=True)) + 32768
-                                self.output_string = self.output_string + "{: 1d}, ".format(result)
-
-                            # Get the next position in slist
-                            self.slist_pointer += 1
-
-                            if (self.slist_pointer + 1) > (len(self.slist)):
-                                # End of a pass through slist items...output, reset, continue
-                                # print(self.output_string.rstrip(", ")) 
-                                # self.output_string = ""
-                                self.slist_pointer = 0
-                    if self.log_stat:
-                        fm.write_log(self.output_string.rstrip(","))
-                    # print(self.output_string.rstrip(", "))
-
-                    self.output_lock.release()
-                self.ser_lock.release()
+            if not (self.acquiring and self.slist):
+                self.rx_buffer = bytearray()
+                self.scan_string = ''
+                self.slist_pointer = 0
+                time.sleep(period * 0.001)
+                continue
+            # Block on the port until the instrument sends, then drain everything waiting in one read
+            self.ser_lock.acquire()
+            try:
+                data = self.ser.read(1)
+                if data and self.ser.in_waiting:
+                    data += self.ser.read(self.ser.in_waiting)
+            except:
+                data = b''
+                time.sleep(period * 0.001)      # Port closed under us
+            self.ser_lock.release()
+            if not data:
+                continue
+
+            self.output_lock.acquire()
+            self.t_host = time.perf_counter_ns()     # Receive time of the burst for host_time stamps
+            self.rx_buffer += data
+            # A burst can hold many scans: spread the time since the last burst evenly over the
+            # scans it completes instead of giving the first one all of it and the rest ~0
+            scans = (self.slist_pointer + len(self.rx_buffer) // 2) // len(self.slist)
+            if scans:
+                self.t_now = time.time()
+                self.t_diff = (self.t_now - self.t_last) / scans
+                self.t_last = self.t_now
+            pos = 0
+            # Always two bytes per sample
+            while len(self.rx_buffer) - pos >= 2:
+                new_bytes = self.rx_buffer[pos:pos + 2]
+                pos += 2
+                # The four LSBs of slist determine measurement function
+                function = self.slist[self.slist_pointer] & 0xf
+                mode_bit = self.slist[self.slist_pointer] & 0x1000
+                if (function < 8) and (not(mode_bit)):
+                    # Working with a Voltage input channel. Scale accordingly.
+                    result = self.range_table[self.slist_pointer] * int.from_bytes(new_bytes, byteorder='little', signed=True) / 32768
+                    self.scan_string = self.scan_string + "{: 3.3f}, ".format(result)
+                elif (function < 8) and (mode_bit):
+                    """
+                    Working with a TC channel.
+                    Convert to temperature if no errors.
+                    First, test for TC error conditions.
+                    """
+                    result = int.from_bytes(new_bytes, byteorder='little', signed=True)
+                    if result == 32767:
+                        print('CJC Error!')
+                    # elif result == -32768:
+                    #     print('OPEN Circuit!')
+                    else:
+                        # Get here if no errors, so isolate TC type
+                        tc_type = self.slist[self.slist_pointer] & 0x0700
+                        tc_chan = self.slist[self.slist_pointer] & 0x000F
+                        # Move TC type into 3 LSBs to form an index we'll use to select m & b scaling constants
+                        tc_type = tc_type >> 8
+                        self.temperature[tc_chan] = TC_SLOPE[tc_type] * result + TC_OFFSET[tc_type]
+                        self.temp_filt[tc_chan].moving_avg(self.temperature[tc_chan])
+                        self.scan_string = self.scan_string + "{: 3.3f},{: 3.3f},".format(self.temperature[tc_chan], self.temp_filt[tc_chan].result)
+
+                elif function == 8:
+                    # Working with the Digital input channel 
+                    result = (int.from_bytes(new_bytes, byteorder='big', signed=False)) & (0x007f)
+                    self.scan_string = self.scan_string + "{: 3d}, ".format(result)
+
+                elif function == 9:
+                    # Working with the Rate input channel
+                    result = (int.from_bytes(new_bytes, byteorder='little', signed=True) + 32768) / 65535 * (self.range_table[self.slist_pointer])
+                    self.scan_string = self.scan_string + "{: 3.1f}, ".format(result)
 
-            time.sleep(period * 0.001)
+                else:
+                    # Working with the Counter input channel
+                    result = (int.from_bytes(new_bytes, byteorder='little', signed=True)) + 32768
+                    self.scan_string = self.scan_string + "{: 1d}, ".format(result)
+
+                # Get the next position in slist
+                self.slist_pointer += 1
+
+                if (self.slist_pointer + 1) > (len(self.slist)):
+                    # End of a pass through slist items...output, reset, continue
+                    self.slist_pointer = 0
+                    self.output_string = "%f," % self.t_diff + self.scan_string
+                    self.scan_string = ''
+                    if self.log_stat:
+                        if self.log_name is None:
+                            fm.write_log(self.output_string.rstrip(","), self.t_host)
+                        else:
+                            fm.write_named_log(self.log_name, self.output_string.rstrip(","), self.t_host)
+            del self.rx_buffer[:pos]
+            self.output_lock.release()
 
 FILTER_BUFF_SIZE = 32
 
@@ -0,0 +1,213 @@
+"""
+asyncio acquisition core for the serial ports.
+One event loop on one daemon thread serves every open port, so another port is
+another stream on the same loop, not another polling thread and lock. Each port
+is a SERIAL_STREAM: an asyncio StreamReader fed straight from the port
+(loop.add_reader on the file descriptor, where there is none - Windows - a
+short poll on the loop instead) and a write() side. A coroutine per port frames
+the received bytes into lines (serial_reader.LINE_READER.frame) and hands every
+burst to the caller's on_lines(), which parses and logs on the loop thread.
+The GUI is only reached through GUI_BRIDGE: posts are queued and the window
+gets one thread-safe wake-up event (write_event_value) at a time, on which the
+GUI thread takes everything queued so far. A slow GUI gets bigger batches, not
+a growing backlog of events. The GUI thread reaches the loop through
+submit()/call().
+Work that belongs to the GUI thread (widgets, test sequencing, log files) is
+posted as a GUI_CALL: post_call() runs it at the next take, call_later() has the
+loop wait first, so timeouts run even when no line arrives and nothing sleeps.
+"""
+
+import asyncio
+import threading
+from collections import deque
+import serial_reader
+
+BRIDGE_EVENT = 'gui_serial_async'   # Window event telling the GUI to take() the bridge queue
+READ_SIZE = 65536                   # Most bytes taken from a stream per wakeup
+POLL_INTERVAL = 0.002               # Port check period (sec) where the port can't be waited on
+CLOSE_TIMEOUT = 1.0                 # Longest close() waits for the loop to let go of a port (sec)
+CALL = 'call'                       # Bridge item kind of a GUI_CALL, the GUI thread run()s it
+
+
+class GUI_BRIDGE():
+    # The one path from the serial side to the GUI thread
+    def __init__(self, key=BRIDGE_EVENT):
+        self.key = key
+        self.window = None      # Set once the window exists, nothing is signalled before that
+        self.items = deque()
+        self.signalled = False  # A wake-up event is on its way and not taken yet
+
+    def post(self, kind, value):
+        # Any thread, deque.append is atomic
+        self.items.append((kind, value))
+        if not self.signalled and self.window is not None:
+            self.signalled = True
+            try:
+                self.window.write_event_value(self.key, None)
+            except:
+                pass        # Window closed
+
+    def take(self):
+        # GUI thread, on BRIDGE_EVENT: [(kind, value), ...] posted so far. Cleared before
+        # draining, so a post racing with this signals again instead of being missed.
+        self.signalled = False
+        items = []
+        while self.items:
+            items.append(self.items.popleft())
+        return items
+
+
+class GUI_CALL():
+    # func(*args) for the GUI thread. cancel() (GUI thread) drops it if it hasn't run yet.
+    def __init__(self, func, args):
+        self.func = func
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        if not self.cancelled:
+            self.func(*self.args)
+
+
+class SERIAL_STREAM():
+    # Reader/writer pair over an open pyserial port, created and used on the loop thread
+    def __init__(self, ser, on_lines, loop):
+        self.ser = ser
+        self.on_lines = on_lines
+        self.loop = loop
+        self.reader = asyncio.StreamReader()
+        self.framer = serial_reader.LINE_READER()
+        self.lines = 0
+        self.bytes = 0
+        self.fd = None
+        self.poller = None
+        self.ser.timeout = 0        # Only read what is already there, the loop does the waiting
+        try:
+            self.fd = self.ser.fileno()
+            self.loop.add_reader(self.fd, self.readable)
+        except (AttributeError, NotImplementedError, ValueError, OSError):
+            self.fd = None
+            self.poller = self.loop.create_task(self.poll())
+        self.pump = self.loop.create_task(self.read_lines())
+
+    def readable(self):
+        try:
+            data = self.ser.read(self.ser.in_waiting or 1)
+        except Exception as e:
+            self.fail(e)
+            return
+        if data:
+            self.reader.feed_data(data)
+
+    async def poll(self):
+        while True:
+            try:
+                waiting = self.ser.in_waiting
+                if waiting:
+                    self.reader.feed_data(self.ser.read(waiting))
+            except Exception as e:
+                self.fail(e)
+                return
+            await asyncio.sleep(POLL_INTERVAL)
+
+    def fail(self, e):
+        # Port gone (unplugged or closed under us): stop reading, the pump ends with the error
+        self.detach()
+        self.reader.set_exception(e)
+
+    def detach(self):
+        if self.fd is not None:
+            self.loop.remove_reader(self.fd)
+            self.fd = None
+        if self.poller is not None:
+            self.poller.cancel()
+            self.poller = None
+
+    async def read_lines(self):
+        while True:
+            try:
+                data = await self.reader.read(READ_SIZE)
+            except Exception as e:
+                print('Serial port %s error: %s' % (self.ser.port, e))
+                return
+            if not data:
+                return      # feed_eof() from close()
+            self.bytes += len(data)
+            lines = self.framer.frame(data)
+            if lines:
+                self.lines += len(lines)
+                try:
+                    self.on_lines(lines)
+                except Exception as e:
+                    print('Serial stream handler error:', e)
+
+    def write(self, data):
+        self.ser.write(data)
+
+    def close(self):
+        self.detach()
+        if not self.reader.at_eof():
+            self.reader.feed_eof()
+
+
+class ACQUISITION():
+    # The event loop and its thread, shared by every port of the process
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.bridge = GUI_BRIDGE()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def submit(self, coro):
+        # From any thread: runs coro on the loop, returns a concurrent.futures.Future
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def call(self, func, *args):
+        # From any thread: runs func(*args) on the loop
+        self.loop.call_soon_threadsafe(func, *args)
+
+    def open(self, ser, on_lines):
+        # Starts serving an open port, on_lines(list of bytes) is called on the loop thread
+        async def start():
+            return SERIAL_STREAM(ser, on_lines, self.loop)
+        return self.submit(start()).result()
+
+    def close(self, stream):
+        # Stops serving the port, once this returns the port can be closed
+        async def stop():
+            stream.close()
+            await asyncio.wait([stream.pump], timeout=CLOSE_TIMEOUT)
+        try:
+            self.submit(stop()).result(CLOSE_TIMEOUT * 2)
+        except Exception as e:
+            print('Serial stream close error:', e)
+
+    def post(self, kind, value):
+        # Send value to the GUI through the bridge
+        self.bridge.post(kind, value)
+
+    def post_call(self, func, *args):
+        # From any thread: func(*args) runs on the GUI thread when it takes the bridge
+        call = GUI_CALL(func, args)
+        self.bridge.post(CALL, call)
+        return call
+
+    def call_later(self, delay, func, *args):
+        # From any thread: the loop waits delay seconds, then posts func(*args) for the GUI thread
+        call = GUI_CALL(func, args)
+        self.loop.call_soon_threadsafe(self.loop.call_later, delay, self.bridge.post, CALL, call)
+        return call
+
+
+acquisition = None
+
+
+def get_acquisition():
+    # The process wide loop, started on first use
+    global acquisition
+    if acquisition is None:
+        acquisition = ACQUISITION()
+    return acquisition
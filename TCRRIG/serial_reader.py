@@ -0,0 +1,51 @@
+"""
+Event driven line reader for the serial ports.
+read_lines() blocks on the port until bytes arrive instead of polling
+in_waiting on a timer: the first byte wakes it, everything else already waiting
+is drained in one read() and the complete lines are handed back. A partial line
+is kept until the rest of it arrives. With nothing arriving the read returns
+after the port timeout, so an idle port costs a few wakeups per second and
+closing the port from another thread is never held up for long.
+Lines are framed on the raw bytes and handed back as bytes: the log takes them
+as they are, only consumers that need text (console, command matching) decode.
+"""
+
+RX_TIMEOUT = 0.1        # Port read timeout (sec): longest a read blocks with nothing arriving
+
+
+class LINE_READER():
+    def __init__(self):
+        self.ser = None
+        self.buffer = bytearray()   # Bytes received after the last complete line
+
+    def reset(self):
+        self.buffer = bytearray()
+
+    def read(self, ser):
+        # Blocks until at least one byte arrives or the port times out, then drains the port
+        if ser is not self.ser:
+            # Different port (or reopened), a partial line of the old one means nothing
+            self.ser = ser
+            self.reset()
+        data = ser.read(1)
+        if data:
+            waiting = ser.in_waiting
+            if waiting:
+                data += ser.read(waiting)
+        return data
+
+    def frame(self, data):
+        # Complete lines (bytes, stripped) in data and the bytes left over from the last call
+        self.buffer += data
+        end = self.buffer.rfind(b'\n')
+        if end < 0:
+            return []
+        lines = bytes(self.buffer[:end]).split(b'\n')
+        del self.buffer[:end + 1]
+        return [line.strip() for line in lines]
+
+    def read_lines(self, ser):
+        data = self.read(ser)
+        if not data:
+            return []
+        return self.frame(data)
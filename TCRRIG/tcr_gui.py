@@ -10,6 +10,8 @@ import PySimpleGUI as sg
 import di2008
 from file_manager import file_manager as fm
 from plotting import plotter
+import log_reader
+import serial_reader
 
 PROJECT_TITLE = 'TCR Rig V2.0'
 PROJECT_COLOR_THEME = 'DarkTanBlue'
@@ -33,6 +35,8 @@ GUI_FONT_TITLE = (GUI_TEXTFONT_ALL, GUI_TEXTSIZE_TITLE)
 
 GUI_BORDERWIDTH_FRAME = 10
 
+LOG_STATS_INTERVAL = 1000   # ms between updates of the logging status readout
+
 cp = sg.cprint
 
 # Define overall GUI theme color scheme (See bottom of script for possible color themes)
@@ -52,6 +56,11 @@ USB_IDENTIFIER_ARDUINO = 'VID:PID=2341'
 USB_IDENTIFIER_FURNACE = 'VID:PID=0403'
 USB_IDENTIFIER_TCLOGGER = 'VID:PID=0683'
 
+# Each source logs at its own rate to its own named log of the session (<log>-gom.log, ...)
+LOG_NAME_GOM = 'gom'
+LOG_NAME_FURNACE = 'furnace'
+LOG_NAME_TCLOGGER = 'tc'
+
 # GLOBAL FUNCTIONS
 def LEDIndicator(key=None, radius=15):
     return sg.Graph(canvas_size=(radius, radius),
@@ -81,6 +90,7 @@ def find_port(usb_identifier):
 
 FRAME_DATA_PROCESSING_LAYOUT = [
     [sg.Text('Data File:',size=(8,1),font=GUI_FONT_MAIN),sg.Input(key='gui_process_data_file',size=(52,1),font=GUI_FONT_MAIN, change_submits=True, disabled=True),sg.FileBrowse(key='gui_process_file_browser', size=(10,1), font=GUI_FONT_MAIN),sg.Button('Plot',key='gui_button_process_plot',size=(4,1),font=GUI_FONT_MAIN)],
+    [sg.Text('Range:',size=(8,1),font=GUI_FONT_MAIN),sg.Input(key='gui_process_range_start',size=(10,1),font=GUI_FONT_MAIN),sg.Text('to',size=(2,1),font=GUI_FONT_MAIN),sg.Input(key='gui_process_range_end',size=(10,1),font=GUI_FONT_MAIN),sg.Text('(sec or HH:MM:SS)',font=GUI_FONT_MAIN)],
     [sg.Text('Config File:',size=(8,1),font=GUI_FONT_MAIN),sg.Input(key='gui_process_config_file',size=(52,1),font=GUI_FONT_MAIN, change_submits=True, disabled=True),sg.FileBrowse(key='gui_process_config_browser', size=(10,1), font=GUI_FONT_MAIN)],
 ]
 
@@ -92,6 +102,7 @@ FRAME_TEST_SETTINGS_LAYOUT = [
 
 FRAME_CONSOLE_LAYOUT = [
     [sg.Multiline(key='gui_cons_output',font=GUI_FONT_MAIN,text_color = 'DarkBlue', autoscroll=True, size=(80, 12),reroute_cprint=True, write_only=True)],
+    [sg.Text('', key='gui_log_stats', font=GUI_FONT_MAIN, size=(80,1))],
 ]
 
 #Main GUI Layout
@@ -169,8 +180,9 @@ class SerialPort:
 
 class ARDUINO:
     def __init__(self):
-        self.ser_port = SerialPort(baud=SER_BAUD_RATE_ARDUINO, stop_bits=serial.STOPBITS_ONE, time_out=0.1)
+        self.ser_port = SerialPort(baud=SER_BAUD_RATE_ARDUINO, stop_bits=serial.STOPBITS_ONE, time_out=serial_reader.RX_TIMEOUT)
         self.comms = self.ser_port.ser
+        self.reader = serial_reader.LINE_READER()
         self.data = ''
         self.new_data_flag = False
         self.lock = threading.Lock()
@@ -179,6 +191,7 @@ class ARDUINO:
     def initialize_port(self, usb_identifier):
         hooked_port = find_port(usb_identifier)
         if hooked_port != '':
+            self.reader.reset()     # Same Serial object is reopened, drop any partial line
             self.ser_port.open_port(hooked_port)
         else:
             cp('Arduino not detected! Check connection, then press RECONNECT')
@@ -204,21 +217,28 @@ class ARDUINO:
         self.lock.release()
 
     def RX(self):
+        # Blocks until the Arduino sends something, then takes every complete line received
+        lines = self.reader.read_lines(self.comms)
+        if not lines:
+            return
+        t_host = time.perf_counter_ns()
         self.lock.acquire()
-        self.data = self.comms.readline().strip().decode()
+        self.data = lines[-1].decode(errors='replace')     # Latest reading as text for the GUI, lines are logged as received
         self.new_data_flag = True
         self.lock.release()
+        for line in lines:
+            fm.write_named_log(LOG_NAME_GOM, line, t_host)
 
     def main_thread(self, period):
         while True:
             if self.ser_port.port_open:
-                while self.comms.in_waiting:
-                    try:
-                        self.RX()
-                    except:
-                        cp("BAD DATA LINE!")
-
-            sleep(period * 0.001)
+                try:
+                    self.RX()
+                except:
+                    cp("BAD DATA LINE!")
+                    sleep(period * 0.001)
+            else:
+                sleep(period * 0.001)
 
 class FURNACE:
     def __init__(self):
@@ -311,6 +331,7 @@ class FURNACE:
         if acknowledge == ACK:
             if self.msg_type == READ_MESSAGE:
                 self.temp_live = response[7:12]
+                fm.write_named_log(LOG_NAME_FURNACE, '%d,%s' % (self.temp_setting, self.temp_live))
             elif self.msg_type == WRITE_MESSAGE:
                 self.tx_handshake = True
         elif acknowledge == NAK:
@@ -366,9 +387,14 @@ class GUI:
     def enable_logging(self, enable):
         if enable:
             logfile = fm.create_log_file()
+            for name in (LOG_NAME_GOM, LOG_NAME_FURNACE, LOG_NAME_TCLOGGER):
+                fm.open_named_log(name)
+            tc_logger.log_name = LOG_NAME_TCLOGGER
+            tc_logger.log_enable(True)
             cp('New logfile created: %s' % logfile)
             self.log_stat = 1
         else:
+            tc_logger.log_enable(False)
             logfile = fm.close_log_file()
             if logfile == '':
                 cp('No active log file open!')
@@ -388,15 +414,27 @@ class GUI:
         self.enable_logging(0)
         self.start_test_flag = False
     
+    def get_plot_range(self):
+        # Optional (start, end) to plot, in seconds from the start of the log or HH:MM:SS clock time
+        try:
+            start = log_reader.parse_time(self.plot_file_path, self.e_val['gui_process_range_start'])
+            end = log_reader.parse_time(self.plot_file_path, self.e_val['gui_process_range_end'])
+        except ValueError:
+            cp('Plot range must be in seconds or HH:MM:SS, plotting whole file!')
+            return None
+        if start is None and end is None:
+            return None
+        return (start, end)
+
     def event_loop(self, gom, muff_furnace, tc_log):
         # Event Loop to process "events"
         while True:
                 
-            self.event, self.e_val = self.window.read()
+            self.event, self.e_val = self.window.read(timeout=LOG_STATS_INTERVAL)
 
             # TIMEOUT
             if self.event == '__TIMEOUT__':
-                pass
+                self.window['gui_log_stats'].update(fm.status_text())
             
             # DATA PROCESSING
             elif self.event == 'gui_process_data_file':
@@ -410,7 +448,7 @@ class GUI:
                         cp('Configuration file: %s' % self.config_file_path.split('/')[-1])
                         cp('PLOTTING!')
                         plotter.load_config_file(self.config_file_path)
-                        if plotter.load_data_file(self.plot_file_path):
+                        if plotter.load_data_file(self.plot_file_path, self.get_plot_range()):
                             plotter.run()
                         else:
                             cp('Bad data import of file!')
@@ -5,6 +5,8 @@ import matplotlib.pyplot as plt
 import numpy as np
 matplotlib.use("TkAgg")
 
+import log_reader
+
 LOGFILE_HEADER_SKIP = 4
 MAX_DUTY_TICKS = 666
 
@@ -15,8 +17,12 @@ class PLOTTER:
 		self.headers = []
 		self.num_data_headers = 0
 		self.extra_calcs_flag = False
+		self.used_headers = None
+		self.dtypes = None
+		self.dialect = log_reader.DIALECT_WILLOW
 
 		self.sample_time = 1/125
+		self.rows_loaded = 0
 
 		self.temp_state = 0
 		self.heating_state = 0
@@ -59,51 +65,46 @@ class PLOTTER:
 						self.headers[loc] = v[0]
 						self.hlabels[loc] = self.config["HEADERS_LABELS"][k]
 
+				# Only the columns the plot windows (and their calculations) use are parsed
+				self.used_headers = log_reader.plot_columns(self.config, self.headers, self.num_data_headers)
+				# Optional per-column types, e.g. "DATA_TYPES": {"2": "int8"}. Others stay float64.
+				self.dtypes = log_reader.plot_dtypes(self.config, self.headers, self.num_data_headers)
+
 			except:
 				print('Configuration file selected is not properly formated for JSON!')
 		else:
 			print('Configuration file must be JSON!')
 
-	def load_data_file(self, file):
+	def load_data_file(self, file, t_range=None):
 		rtn_val = True
-		if file.endswith('.log'):
-			f = open(file, 'r')
-			r_lines = f.readlines()
-			w_lines = []
-			if len(r_lines) > 10:
-				df_data_lines = []
-				# self.temp_state = 0
-				# self.heating_state = 0
-				# self.bitfield = 0
-				# self.thermistor_adc = 0
-				# self.oven_temp = 0
-				# self.target_thermistor_adc = 0
-				# self.target_oven_temp = 0
-				# self.live_duty_cycle = 0
-				# self.pid_duty_cycle = 0
-				# self.pid_adc_error = 0
-				# self.pid_adc_integral_error = 0
-				# self.pid_adc_derivative_error = 0
-				# self.heating_duration = []
-				for i in range(len(r_lines)):
-					temp_line = r_lines[i].split(';')
-					temp_line.pop()
-					if len(temp_line) == self.num_data_headers:
-						try:
-							w_lines.append([float(j) for j in temp_line])
-						except:
-							pass
+		records = file.endswith(log_reader.RECORD_SUFFIX)
+		if file.endswith('.log') or file.endswith('.log' + log_reader.COMPRESSED_SUFFIX) or file.endswith(log_reader.SESSION_SUFFIX) or records:
+			self.rows_loaded = 0
+			if not records:
+				# Row format sniffed from the start of the file, DIALECT_WILLOW if it can't tell
+				self.dialect = log_reader.sniff_dialect(file, self.headers[:self.num_data_headers], log_reader.DIALECT_WILLOW)
+			streaming = log_reader.log_size(file) > log_reader.STREAM_THRESHOLD_BYTES and t_range is None and not records
+			if records:
+				# Binary record log: mapped straight into columns, nothing to parse
+				df = log_reader.load_record_log(file, self.used_headers, self.dtypes)
+				if len(df) == 0:
+					df = None
+			elif t_range is not None:
+				df = self.load_data_range(file, t_range)
+			elif streaming:
+				# Too large to hold at once: calcs and plot decimation run chunk by chunk
+				df = log_reader.stream_log(file, self.headers[:self.num_data_headers], self.run_chunk_calcs, self.dialect, usecols=self.used_headers)
 			else:
+				df = log_reader.load_log(file, self.headers[:self.num_data_headers], self.dialect, min_lines=10, usecols=self.used_headers, dtypes=self.dtypes)
+			if df is None:
 				print('Data file is empty!')
 				rtn_val = False
-			f.close()
 			if rtn_val:
 				try:
-					self.df = pd.DataFrame(w_lines, columns=self.headers[:len(self.config["DATA_HEADERS"].keys())])
-					self.df = self.df.dropna()
-					self.df['time_stamp'] = range(0, len(self.df))
-					self.df['time_stamp'] = self.sample_time * self.df['time_stamp']
-					self.run_df_calcs()
+					if streaming:
+						self.df = df
+					else:
+						self.run_chunk_calcs(df.dropna())
 					print(self.df)
 				except:
 					print('Bad pandas import of file!')
@@ -113,6 +114,24 @@ class PLOTTER:
 			rtn_val = False
 		return rtn_val
 
+	def load_data_range(self, file, t_range):
+		# t_range is (start, end) in seconds from the first row, either end may be None.
+		# Rows are evenly spaced so the range maps straight to row numbers in the offset index.
+		columns = self.headers[:self.num_data_headers]
+		bounds = [None if t is None else t / self.sample_time for t in t_range]
+		index = log_reader.load_index(file, columns, self.dialect, time_column=None, t_from=bounds[0], t_to=bounds[1])
+		first, last = log_reader.find_rows(index, bounds[0], bounds[1])
+		self.rows_loaded = first
+		return log_reader.load_rows(file, columns, index, first, last, self.dialect, usecols=self.used_headers, dtypes=self.dtypes)
+
+	def run_chunk_calcs(self, df):
+		# Rows are evenly spaced by sample_time, continued across chunks when streaming
+		self.df = df
+		self.df['time_stamp'] = self.sample_time * np.arange(self.rows_loaded, self.rows_loaded + len(self.df))
+		self.rows_loaded += len(self.df)
+		self.run_df_calcs()
+		return self.df
+
 	def run_df_calcs(self):
 		#t_start  = self.df['leading_zero'][0]
 		#self.df['time_stamp'] = (self.df['time_stamp'] - t_start) * (1/125)
@@ -122,7 +141,7 @@ class PLOTTER:
 		if self.extra_calcs_flag:
 			for k,v in self.config["CALCULATIONS"].items():
 				if 'sum' in v[0]:
-					self.df[v[0]] = self.df[self.headers[v[1]-1]] + self.df[self.headers[v[2]-1]]
+					self.df[v[0]] = self.df[self.headers[v[1]-1]].astype(np.float64) + self.df[self.headers[v[2]-1]]
 				elif 'power' in v[0]:
 					R = self.df[self.headers[v[1]-1]] * 0.001
 					duty = self.df[self.headers[v[2]-1]] * 0.01
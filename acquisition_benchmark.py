@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+
+## End to end acquisition benchmark for the data loggers
+##
+##     python3 acquisition_benchmark.py --targets k5r willow di2008 --rates 1000 10000 100000 --output bench.json
+##
+## Every step feeds one target a synthetic stream at a fixed line rate over a pseudo terminal and
+## measures what comes out of the real acquisition path in a separate process: for the GUIs
+## thread_comms (or the asyncio core with --comms async) -> parse_line -> fm.write_log -> cp(),
+## for the DI-2008 DI2008.run -> fm.write_log. The GUI scripts are loaded without their window:
+## PySimpleGUI is replaced by a headless stand-in whose cprint records when each data row reaches
+## the console, nothing is drawn and the plotter is not loaded. Rates go up until a step loses data.
+##
+## Per step: sustained lines/s, p50/p99/max latency from the write to the port until the row
+## reaches the end of the path, CPU% of the acquisition process and the rows lost, counted as
+## port overruns (the pty is full, a real UART would drop them), writer queue drops and rows that
+## never arrived. The first rate losing rows is the drop onset. Results go to a JSON file.
+
+import os
+import sys
+import ast
+import tty
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+import traceback
+import multiprocessing
+from array import array
+from datetime import datetime as dt
+
+import serial_simulator
+
+REPO_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+# Target: (folder, script, row format of serial_simulator.FORMATS)
+TARGETS = {
+    'k5r':    ('K5R', 'gui.py', 'k5r'),
+    'k5':     (os.path.join('K5', 'Data Logger'), 'gui.py', 'k5r'),
+    'willow': (os.path.join('Willow', 'Data Logger'), 'gui.py', 'willow'),
+    'tcrrig': ('TCRRIG', 'gui.py', 'tcr'),
+    'di2008': (os.path.join('DATAQ', 'Data Logger'), 'di2008.py', 'di2008'),
+}
+DEFAULT_RATES = [100, 300, 1000, 3000, 10000, 30000, 100000]     # Lines per second
+STEP_SECONDS = 5.0          # Stream length of a step
+DRAIN_SECONDS = 5.0         # Longest a step waits for the rows still in flight
+STARTUP_SECONDS = 60.0      # Longest the acquisition process may take to open the port
+TICK = 0.001                # Producer period (sec), rows due are written together
+DI2008_SLIST = [0x1300, 0x1301]     # Two K thermocouples
+FURNACE_TEMP = 25.0         # TCRRIG: furnace reading used instead of a round trip to a furnace
+
+
+class NULL():
+    # Any element, method or constant of the headless stand-in: accepts everything, does nothing
+    def __call__(self, *args, **kwargs):
+        return self
+
+    def __getattr__(self, name):
+        return self
+
+    def __getitem__(self, key):
+        return self
+
+
+class HEADLESS_WINDOW(NULL):
+    def __init__(self, *args, **kwargs):
+        self.signal = threading.Event()     # Set by write_event_value(), the GUI thread takes the bridge
+
+    def write_event_value(self, key, value):
+        self.signal.set()
+
+
+class HEADLESS_SG(NULL):
+    # PySimpleGUI as the GUI script sees it: no window, cprint goes to the benchmark console
+    def __init__(self, console):
+        self.cprint = console
+        self.Window = HEADLESS_WINDOW
+
+
+class CONSOLE():
+    # Receive time of every data row handed to cprint (or to fm.write_log for the DI-2008)
+    def __init__(self, fmt):
+        delimiter, prefix = serial_simulator.FORMATS[fmt][:2]
+        self.delimiter = delimiter.decode()
+        self.prefix = prefix.decode()
+        self.arrivals = array('q')
+
+    def __call__(self, *args, **kwargs):
+        now = time.perf_counter_ns()
+        text = ' '.join(str(arg) for arg in args)
+        rows = 0
+        for line in text.split('\n'):
+            if line.startswith(self.prefix) and self.delimiter in line:
+                rows += 1
+        if rows:
+            self.arrivals.extend([now] * rows)
+
+
+def synthetic_rows(fmt, first, last, rate):
+    # Data rows first..last-1 of a stream at rate lines/s, as the device sends them
+    if fmt == 'k5r':
+        return b''.join(b'$,%d,1,4100,4200,%d,6000\r\n' % (i * 1000 // rate, i % 10000) for i in range(first, last))
+    if fmt in ('k3', 'willow'):
+        return b''.join(b'0;%05d;10011;09961;50248;00001;00000;30000;00000;30000;50241;00501;00012;\r\n' % (i % 100000) for i in range(first, last))
+    if fmt == 'tcr':
+        return b''.join(b'%d.%03d,1.001,1.002,1.003,1.004,1.005,1.006,1.007\r\n' % (1 + i % 2, i % 1000) for i in range(first, last))
+    return b''.join(serial_simulator.di2008_scan(b'0,%d,0,%d,0' % (20 + i % 100, 200 + i % 100), DI2008_SLIST) for i in range(first, last))
+
+def load_gui(file, console):
+    # Namespace of a GUI script run up to (not including) 'gui = GUI(...)', the window and the
+    # event loop, with PySimpleGUI replaced by the headless stand-in and without the plotter
+    f = open(file, 'r', encoding='utf-8')
+    tree = ast.parse(f.read(), file)
+    f.close()
+    ns = {'__name__': 'benchmark_gui', '__file__': file}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and [getattr(t, 'id', None) for t in node.targets] == ['gui']:
+            break
+        if isinstance(node, ast.Import) and node.names[0].name == 'PySimpleGUI':
+            ns[node.names[0].asname or 'PySimpleGUI'] = HEADLESS_SG(console)
+            continue
+        if isinstance(node, ast.ImportFrom) and node.module == 'plotting':
+            for name in node.names:
+                ns[name.asname or name.name] = NULL()     # Plot windows, not on the acquisition path
+            continue
+        exec(compile(ast.Module([node], []), file, 'exec'), ns)
+    return ns
+
+def open_gui(target, port, comms, console):
+    folder, script, fmt = TARGETS[target]
+    ns = load_gui(os.path.join(REPO_DIRECTORY, folder, script), console)
+    ns['ASYNC_COMMS'] = comms == 'async'
+    gui = ns['GUI'](ns['PROJECT_TITLE'], ns['GUI_LAYOUT'])
+    if target == 'tcrrig':
+        gui.get_furnace_temperature = lambda: FURNACE_TEMP
+    if not gui.open_port(port):
+        raise IOError('Could not open %s' % port)
+    gui.enable_logging(1)
+    if comms == 'thread':
+        threading.Thread(target=ns['thread_comms'], args=('gui_thread_comms', 10, gui), daemon=True).start()
+
+    def take():
+        # What the event loop does on the bridge event
+        if gui.window.signal.is_set():
+            gui.window.signal.clear()
+            gui.take_bridge()
+
+    def close():
+        gui.close_port()
+        gui.enable_logging(0)
+
+    return ns['fm'], take, close
+
+def open_di2008(port, console):
+    import serial
+    import di2008
+    fm = di2008.fm
+    dvc = di2008.DI2008()
+    dvc.ser = serial.Serial(port=port, baudrate=115200, timeout=di2008.RX_TIMEOUT)
+    dvc.unit_connected = True
+    dvc.slist = list(DI2008_SLIST)
+    dvc.range_table = [0] * len(DI2008_SLIST)
+    fm.create_log_file()
+    write_log = fm.write_log
+
+    def logged(data, host_time=None):
+        write_log(data, host_time)
+        console.arrivals.append(time.perf_counter_ns())
+
+    fm.write_log = logged
+    dvc.log_enable(True)
+    dvc.acquiring = True
+    threading.Thread(target=dvc.run, daemon=True).start()
+
+    def close():
+        dvc.acquiring = False
+        dvc.ser.close()
+        fm.close_log_file()
+
+    return fm, lambda: None, close
+
+def acquisition(conn, target, port, comms):
+    # The process under test: opens the port like the tool does and reports what arrived
+    log_directory = tempfile.mkdtemp(prefix='acquisition_benchmark_')
+    try:
+        folder, script, fmt = TARGETS[target]
+        os.chdir(log_directory)
+        sys.path.insert(0, os.path.join(REPO_DIRECTORY, folder))
+        console = CONSOLE(fmt)
+        if fmt == 'di2008':
+            fm, take, close = open_di2008(port, console)
+        else:
+            fm, take, close = open_gui(target, port, comms, console)
+        fm.stats('benchmark')
+        conn.send('ready')
+        conn.recv()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        sent = None
+        deadline = None
+        while True:
+            take()
+            if sent is None and conn.poll():
+                sent = conn.recv()
+                deadline = time.perf_counter() + DRAIN_SECONDS
+            if sent is not None and (len(console.arrivals) >= sent or time.perf_counter() > deadline):
+                break
+            time.sleep(TICK)
+        take()
+        wall = time.perf_counter() - wall
+        cpu = time.process_time() - cpu
+        log = fm.stats('benchmark')
+        close()
+        conn.send({'arrivals': console.arrivals.tobytes(), 'cpu_percent': 100 * cpu / wall, 'log': log})
+    except Exception:
+        conn.send({'error': traceback.format_exc()})
+    finally:
+        os.chdir(REPO_DIRECTORY)
+        shutil.rmtree(log_directory, ignore_errors=True)
+
+def produce(master, fmt, rate, seconds):
+    # Writes rate rows/s for seconds without ever blocking: rows due while the port is still full
+    # are overruns. Returns (send time of every row written, overruns).
+    total = int(rate * seconds)
+    sent = array('q')
+    overrun = 0
+    pending = b''
+    i = 0
+    start = time.perf_counter()
+    while i < total or pending:
+        try:
+            os.read(master, 65536)      # Commands from the host, not answered
+        except (BlockingIOError, OSError):
+            pass
+        due = min(total, int((time.perf_counter() - start) * rate) + 1)
+        if pending:
+            try:
+                pending = pending[os.write(master, pending):]
+            except BlockingIOError:
+                pass
+            if due > i:
+                overrun += due - i
+                i = due
+        elif due > i:
+            data = synthetic_rows(fmt, i, due, rate)
+            t = time.perf_counter_ns()
+            try:
+                pending = data[os.write(master, data):]
+            except BlockingIOError:
+                pending = data
+            sent.extend([t] * (due - i))
+            i = due
+        if i >= total and time.perf_counter() - start > seconds + DRAIN_SECONDS:
+            break       # Port never drained
+        time.sleep(TICK)
+    return sent, overrun
+
+def percentile(values, p):
+    return values[(len(values) - 1) * p // 100] if values else 0
+
+def run_step(target, rate, seconds, comms):
+    fmt = TARGETS[target][2]
+    master, slave = os.openpty()
+    tty.setraw(master)
+    tty.setraw(slave)
+    os.set_blocking(master, False)
+    context = multiprocessing.get_context('spawn')
+    conn, child_conn = context.Pipe()
+    process = context.Process(target=acquisition, args=(child_conn, target, os.ttyname(slave), comms), daemon=True)
+    process.start()
+    try:
+        if not conn.poll(STARTUP_SECONDS):
+            raise RuntimeError('%s did not start' % target)
+        reply = conn.recv()
+        if reply != 'ready':
+            raise RuntimeError(reply['error'])
+        conn.send('go')
+        sent, overrun = produce(master, fmt, rate, seconds)
+        conn.send(len(sent))
+        result = conn.recv()
+        if 'error' in result:
+            raise RuntimeError(result['error'])
+    finally:
+        process.join(DRAIN_SECONDS)
+        if process.is_alive():
+            process.terminate()
+        os.close(master)
+        os.close(slave)
+
+    arrivals = array('q')
+    arrivals.frombytes(result['arrivals'])
+    n = min(len(sent), len(arrivals))
+    latency = sorted(arrivals[k] - sent[k] for k in range(n))
+    lost = max(0, len(sent) - len(arrivals))
+    log = result['log']
+    elapsed = (arrivals[-1] - sent[0]) * 1e-9 if n else 0
+    return {
+        'rate': rate,
+        'seconds': seconds,
+        'offered': int(rate * seconds),
+        'sent': len(sent),
+        'received': len(arrivals),
+        'sustained_lines_per_sec': len(arrivals) / elapsed if elapsed > 0 else 0.0,
+        'latency_p50_ms': percentile(latency, 50) / 1e6,
+        'latency_p99_ms': percentile(latency, 99) / 1e6,
+        'latency_max_ms': latency[-1] / 1e6 if latency else 0.0,
+        'cpu_percent': result['cpu_percent'],
+        'overrun': overrun,
+        'writer_dropped': log['dropped_lines'],
+        'lost': lost,
+        'dropped': overrun + log['dropped_lines'] + lost,
+        'log': log,
+    }
+
+def run_target(target, rates, seconds, comms, all_rates=False):
+    steps = []
+    onset = None
+    for rate in rates:
+        step = run_step(target, rate, seconds, comms)
+        steps.append(step)
+        print('%-8s %8d lines/s offered  %9.0f sustained  p50 %8.2f  p99 %8.2f ms  cpu %5.1f%%  dropped %d' % (
+            target, rate, step['sustained_lines_per_sec'], step['latency_p50_ms'], step['latency_p99_ms'], step['cpu_percent'], step['dropped']))
+        if step['dropped'] and onset is None:
+            onset = rate
+            if not all_rates:
+                break
+    clean = [s['sustained_lines_per_sec'] for s in steps if not s['dropped']]
+    return {
+        'path': 'DI2008.run' if TARGETS[target][2] == 'di2008' else comms,
+        'max_sustained_lines_per_sec': max(clean) if clean else 0.0,
+        'drop_onset_rate': onset,
+        'steps': steps,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='End to end acquisition benchmark of the data loggers')
+    parser.add_argument('--targets', nargs='+', choices=sorted(TARGETS), default=sorted(TARGETS))
+    parser.add_argument('--rates', nargs='+', type=int, default=DEFAULT_RATES, help='line rates to step through (lines/s)')
+    parser.add_argument('--seconds', type=float, default=STEP_SECONDS, help='stream length of every step')
+    parser.add_argument('--comms', choices=['thread', 'async'], default='thread', help='GUI serial path: thread_comms or the asyncio core')
+    parser.add_argument('--all-rates', action='store_true', help='keep going after the first step that drops data')
+    parser.add_argument('--output', help='JSON results file (default acquisition_benchmark-<date>-<time>.json)')
+    args = parser.parse_args()
+
+    now = dt.now()
+    output = args.output or now.strftime('acquisition_benchmark-%Y%m%d-%H%M%S.json')
+    results = {
+        'date': now.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'seconds': args.seconds,
+        'comms': args.comms,
+        'targets': {},
+    }
+    for target in args.targets:
+        try:
+            results['targets'][target] = run_target(target, sorted(args.rates), args.seconds, args.comms, args.all_rates)
+        except Exception as e:
+            print('%s failed: %s' % (target, e))
+            results['targets'][target] = {'error': str(e)}
+    f = open(output, 'w')
+    json.dump(results, f, indent=1)
+    f.close()
+    print('Results written to %s' % output)
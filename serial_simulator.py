@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+
+## Virtual serial device: replays a recorded log over a pseudo terminal (Linux / macOS)
+##
+## The loggers open the printed port (or the --link path) like a real device:
+##
+##     python3 serial_simulator.py logs/20240101-120000.log --format k5r --speed 10 --link /tmp/ttyK5R
+##
+## Data rows are taken from the log as written by FILE_MANAGER (header, CLI echo and host time
+## stamps are dropped) and sent at the pace they were recorded, or --speed times faster
+## (--speed 0: as fast as the port takes them). Row times come from the host stamps when the log
+## has them, else from the device time column, else from the format's fixed row period.
+## The CLI commands the GUIs send are answered: 'heater stream 1/0' starts and stops a K5R
+## stream, the DI-2008 commands (slist, srate, dec, ps, stop) are echoed like the instrument
+## does and 'start' sends the rows as binary scans in the configured scan list.
+
+import os
+import sys
+import tty
+import time
+import argparse
+import threading
+from bisect import bisect_right
+
+# Data rows of each format: (field delimiter, row prefix, trailing delimiter, time field, time scale
+# to seconds, row period (sec) when the log has no time, fields the GUI added to the device's row)
+FORMATS = {
+    'k5r':    (b',', b'$,', False, 0, 1e-3, 0.01, 0),     # $,time_ms,...
+    'k3':     (b';', b'', True, None, None, 0.01, 0),     # f1;f2;...;fn;
+    'willow': (b';', b'', True, None, None, 1 / 125, 0),  # sample_time of the Willow plotter
+    'tcr':    (b',', b'', False, None, None, 4.0, 1),     # TCRRIG gui.py appends the furnace temperature
+    'di2008': (b',', b'', False, 0, 1.0, 1.0, 0),         # t_diff,temp,avg,... (time is per row deltas)
+}
+STREAM_COMMANDS = {'k5r': (b'heater stream 1', b'heater stream 0'), 'di2008': (b'start', b'stop')}
+LINE_END = b'\r\n'
+MAX_SLEEP = 0.05        # Longest the replay sleeps at once, so stop/start is seen quickly
+BURST_ROWS = 1000       # Rows per write at --speed 0
+
+# DI-2008 scan list codes (see di2008.py): TC type in bits 8-10 with bit 12 set, channel in bits 0-3
+DI2008_TC_SLOPE = [0.023956, 0.018311, 0.021515, 0.023987, 0.022888, 0.02774, 0.02774, 0.009155]
+DI2008_TC_OFFSET = [1035, 400, 495, 586, 550, 859, 859, 100]
+DI2008_ANALOG_RANGES = [.5, 0.25, 0.1, .05, .025, .01, 0, 0, 50, 25, 10, 5, 2.5, 1, 0, 0]
+DI2008_TC_K = 0x1300
+
+
+def is_number(field):
+    try:
+        float(field)
+        return True
+    except ValueError:
+        return False
+
+def load_log(file, fmt):
+    # (rows without terminator, row times in seconds from the first row) of a log
+    delimiter, prefix, trailing, time_field, time_scale, period, added = FORMATS[fmt]
+    f = open(file, 'rb')
+    lines = f.read().replace(b'\r', b'\n').split(b'\n')
+    f.close()
+    rows = []
+    stamps = []
+    for line in lines:
+        stamp = None
+        tab = line.find(b'\t')
+        if tab > 0 and line[:tab].isdigit():
+            stamp = int(line[:tab])
+            line = line[tab + 1:]
+        line = line.strip()
+        if not line.startswith(prefix) or delimiter not in line:
+            continue
+        if trailing and not line.endswith(delimiter):
+            continue
+        fields = line[len(prefix):].rstrip(delimiter).split(delimiter) if trailing else line[len(prefix):].split(delimiter)
+        if not prefix and not trailing and not is_number(fields[0]):
+            continue        # CSV formats: header or CLI echo, not a row
+        if added:
+            fields = fields[:-added]
+        row = prefix + delimiter.join(fields)
+        if trailing:
+            row += delimiter
+        rows.append(row)
+        stamps.append(stamp)
+
+    if rows and None not in stamps:
+        times = [(s - stamps[0]) * 1e-9 for s in stamps]
+    elif time_field is not None:
+        times = []
+        t = 0.0
+        t0 = None
+        for row in rows:
+            try:
+                value = float(row[len(prefix):].split(delimiter)[time_field]) * time_scale
+            except (ValueError, IndexError):
+                value = None
+            if fmt == 'di2008':
+                t += value or 0.0
+            elif value is not None:
+                if t0 is None:
+                    t0 = value
+                t = max(t, value - t0)      # Device clock reset or garbage: keep going forward
+            times.append(t)
+    else:
+        times = [i * period for i in range(len(rows))]
+    return rows, times
+
+def di2008_scan(row, slist):
+    # One binary scan (2 bytes per scan list item) from a DI-2008 log row. TC channels take two
+    # columns (temperature, moving average), everything else one.
+    fields = row.split(b',')[1:]
+    scan = bytearray()
+    k = 0
+    for item in slist:
+        value = float(fields[k]) if k < len(fields) and is_number(fields[k]) else 0.0
+        function = item & 0xf
+        if function < 8 and item & 0x1000:
+            tc_type = (item & 0x0700) >> 8
+            raw = round((value - DI2008_TC_OFFSET[tc_type]) / DI2008_TC_SLOPE[tc_type])
+            k += 2
+        elif function < 8:
+            full_scale = DI2008_ANALOG_RANGES[item >> 8] or 1
+            raw = round(value / full_scale * 32768)
+            k += 1
+        else:
+            raw = 0         # Digital, rate and count channels are not simulated
+            k += 1
+        scan += max(-32768, min(32766, raw)).to_bytes(2, byteorder='little', signed=True)
+    return bytes(scan)
+
+
+class SIMULATOR():
+    def __init__(self, rows, times, fmt='k5r', speed=1.0, loop=False, autostart=None):
+        self.rows = rows
+        self.times = times
+        self.fmt = fmt
+        self.speed = speed
+        self.loop = loop
+        if autostart is None:
+            autostart = fmt not in STREAM_COMMANDS      # K3, Willow and TCR rig stream from power up
+        self.streaming = threading.Event()
+        if autostart:
+            self.streaming.set()
+        self.exit_flag = False
+        self.slist = []             # DI-2008 scan list set by 'slist n code'
+        self.position = 0           # Next row to send
+        self.rows_sent = 0
+        self.commands = []          # Commands received, in order
+        self.write_lock = threading.Lock()
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+
+    def start(self):
+        threading.Thread(target=self.replay, daemon=True).start()
+        threading.Thread(target=self.serve_commands, daemon=True).start()
+
+    def close(self):
+        self.exit_flag = True
+        self.streaming.set()
+        os.close(self.master)
+        os.close(self.slave)
+
+    def write(self, data):
+        self.write_lock.acquire()
+        try:
+            while data:
+                data = data[os.write(self.master, data):]     # Blocks while the reader is behind
+        except OSError:
+            self.exit_flag = True       # Closed
+        self.write_lock.release()
+
+    def payload(self, first, last):
+        if self.fmt == 'di2008':
+            slist = self.slist or [DI2008_TC_K | i for i in range((self.rows[first].count(b',')) // 2)]
+            return b''.join(di2008_scan(row, slist) for row in self.rows[first:last])
+        return LINE_END.join(self.rows[first:last]) + LINE_END
+
+    def replay(self):
+        while not self.exit_flag:
+            self.streaming.wait()
+            if self.exit_flag:
+                break
+            if self.position >= len(self.rows):
+                if not self.loop or not self.rows:
+                    print('Replay done: %d rows sent' % self.rows_sent)
+                    self.streaming.clear()
+                    self.position = 0
+                    continue
+                self.position = 0
+            # Row times are relative to where the replay (re)started
+            t_base = self.times[self.position]
+            start = time.perf_counter()
+            while self.streaming.is_set() and not self.exit_flag and self.position < len(self.rows):
+                if self.speed:
+                    now = t_base + (time.perf_counter() - start) * self.speed
+                    last = bisect_right(self.times, now, self.position)
+                    if last == self.position:
+                        time.sleep(min((self.times[self.position] - now) / self.speed, MAX_SLEEP))
+                        continue
+                else:
+                    last = min(self.position + BURST_ROWS, len(self.rows))
+                self.write(self.payload(self.position, last))
+                self.rows_sent += last - self.position
+                self.position = last
+
+    def serve_commands(self):
+        buffer = b''
+        while not self.exit_flag:
+            try:
+                data = os.read(self.master, 4096)
+            except OSError:
+                break
+            buffer += data
+            while True:
+                end = min([i for i in (buffer.find(b'\r'), buffer.find(b'\n')) if i >= 0], default=-1)
+                if end < 0:
+                    break
+                command = buffer[:end].strip()
+                buffer = buffer[end + 1:]
+                if command:
+                    self.answer(command)
+
+    def answer(self, command):
+        self.commands.append(command)
+        on_off = STREAM_COMMANDS.get(self.fmt)
+        if self.fmt == 'di2008':
+            words = command.split()
+            if words[0] == b'slist' and len(words) == 3:
+                if words[1] == b'0':
+                    self.slist = []
+                self.slist.append(int(words[2]))
+            if words[0] != b'start':
+                self.write(command + b'\r')     # Echo, except for start: the scans follow it at once
+        else:
+            self.write(command + LINE_END)      # CLI echo
+        if on_off is not None:
+            if command == on_off[0]:
+                self.streaming.set()
+            elif command == on_off[1]:
+                self.streaming.clear()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Replay a log over a pseudo terminal as a virtual serial device')
+    parser.add_argument('log', help='log file written by one of the data loggers')
+    parser.add_argument('--format', choices=sorted(FORMATS), default='k5r', help='row format of the log and the device to simulate')
+    parser.add_argument('--speed', type=float, default=1.0, help='replay speed, 1 = as recorded, 0 = as fast as possible')
+    parser.add_argument('--loop', action='store_true', help='start over at the end of the log')
+    parser.add_argument('--stream', action='store_true', help='stream from the start instead of waiting for the stream command')
+    parser.add_argument('--link', help='symlink to create to the port, e.g. /tmp/ttyK5R')
+    args = parser.parse_args()
+
+    rows, times = load_log(args.log, args.format)
+    if not rows:
+        print('No %s rows in %s' % (args.format, args.log))
+        sys.exit(1)
+    sim = SIMULATOR(rows, times, args.format, args.speed, args.loop, True if args.stream else None)
+    if args.link:
+        if os.path.islink(args.link):
+            os.remove(args.link)
+        os.symlink(sim.port, args.link)
+    print('%d rows over %.1f sec, serving %s on %s' % (len(rows), times[-1], args.format, args.link or sim.port))
+    sim.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    print('\n%d rows sent' % sim.rows_sent)
+    sim.close()
+    if args.link:
+        os.remove(args.link)